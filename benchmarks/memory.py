@@ -0,0 +1,82 @@
+"""
+Memory per row of the parsed results.
+
+Loads the sample results scaled up ``--scale`` times in each representation
+and reports the memory each one holds::
+
+    python -m benchmarks.memory --scale 100
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+from doeextractor import textract_parser
+from doeextractor.models import FuelLinePriceItem, FuelPrice, PriceTable
+
+SAMPLE_TEXTRACT_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.csv"
+)
+
+
+def load_dicts(serialized: str) -> list:
+    return json.loads(serialized)
+
+
+def load_dataclasses(serialized: str) -> list:
+    items = []
+    for item in json.loads(serialized):
+        item["prices"] = [FuelPrice(**fuel_price) for fuel_price in item["prices"]]
+        items.append(FuelLinePriceItem(**item))
+    return items
+
+
+def load_table(serialized: str) -> PriceTable:
+    return PriceTable.from_dicts(json.loads(serialized))
+
+
+def held_memory(load, serialized: str):
+    """
+    Bytes still allocated once ``load`` returns, i.e. held by its result.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load(serialized)
+        gc.collect()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, held, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = textract_parser.parse(SAMPLE_TEXTRACT_OUTPUT, "/dev/null")
+    serialized = json.dumps(response["results"] * args.scale)
+    rows = len(response["results"]) * args.scale
+    print(f"{rows} rows")
+    for name, load in [
+        ("dicts", load_dicts),
+        ("dataclasses", load_dataclasses),
+        ("PriceTable", load_table),
+    ]:
+        result, held, peak = held_memory(load, serialized)
+        print(
+            f"{name:12} {held / rows:8.0f} bytes/row held"
+            f" {peak / (1024 * 1024):8.2f} MB peak"
+        )
+        del result
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Throughput and peak memory of every stage of the pipeline.
+
+Runs offline on the files in ``samples/``, scaled up by repeating them, with
+stub Tabula and Textract backends. Throughput is in rows produced by each
+stage per second: tokens, parsed rows or pages. Compares against a saved baseline to
+catch regressions::
+
+    python -m benchmarks.pipeline --scales 1,10,100
+    python -m benchmarks.pipeline --save-baseline
+    python -m benchmarks.pipeline --compare --tolerance 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+from doeextractor import analyser, batch, file_helpers, parser, tabula, textract_parser
+from doeextractor.constants import AnalysisEngine, Backend
+
+SAMPLES_DIR = Path(__file__).parent.parent / "samples"
+SAMPLE_TABULA_OUTPUT = SAMPLES_DIR / "petro_min_2022-may-10.json"
+SAMPLE_TEXTRACT_OUTPUT = SAMPLES_DIR / "petro_min_2022-may-10.csv"
+SAMPLE_PAGES_DIR = SAMPLES_DIR / "output" / "petro_min_2022-may-10"
+BASELINE_PATH = Path(__file__).parent / "baselines" / "pipeline.json"
+DEFAULT_SCALES = "1,10,100"
+# Page stages cost the same per page at any scale and take seconds per page,
+# so they only run on the sample pages
+MAX_PAGES_SCALE = 1
+
+
+class Inputs:
+    """
+    Sample inputs scaled up ``scale`` times, written to ``directory``.
+
+    Everything is prepared lazily and outside of the timed stages.
+    """
+
+    def __init__(self, directory: Path, scale: int):
+        self.directory = directory
+        self.scale = scale
+        self._cache = {}
+
+    def _get(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def tabula_file_path(self) -> Path:
+        def build():
+            pages = json.loads(SAMPLE_TABULA_OUTPUT.read_bytes())
+            path = self.directory / f"tabula_x{self.scale}.json"
+            with open(path, "w") as f:
+                json.dump(pages * self.scale, f)
+            return path
+
+        return self._get("tabula_file_path", build)
+
+    @property
+    def tabula_output(self) -> bytes:
+        return self._get("tabula_output", self.tabula_file_path.read_bytes)
+
+    @property
+    def tabula_texts(self) -> list:
+        return self._get(
+            "tabula_texts",
+            lambda: list(parser.iter_tabula_texts(self.tabula_file_path)),
+        )
+
+    @property
+    def tabula_tokens(self) -> list:
+        return self._get(
+            "tabula_tokens", lambda: list(parser.tokenize(self.tabula_texts))
+        )
+
+    @property
+    def textract_csv(self) -> str:
+        return self._get(
+            "textract_csv", lambda: SAMPLE_TEXTRACT_OUTPUT.read_text() * self.scale
+        )
+
+    @property
+    def textract_file_path(self) -> Path:
+        def build():
+            path = self.directory / f"textract_x{self.scale}.csv"
+            path.write_text(self.textract_csv)
+            return path
+
+        return self._get("textract_file_path", build)
+
+    @property
+    def results(self) -> list:
+        def build():
+            with _quiet():
+                response = textract_parser.parse(
+                    SAMPLE_TEXTRACT_OUTPUT, self.directory / "results.json"
+                )
+            return response["results"] * self.scale
+
+        return self._get("results", build)
+
+    @property
+    def pages(self) -> list:
+        return self._get(
+            "pages",
+            lambda: sorted(SAMPLE_PAGES_DIR.glob("*.png"), key=lambda p: int(p.stem))
+            * self.scale,
+        )
+
+    @property
+    def pdf_file_path(self) -> Path:
+        def build():
+            from PIL import Image
+
+            images = [Image.open(page).convert("RGB") for page in self.pages]
+            path = self.directory / f"report_x{self.scale}.pdf"
+            images[0].save(path, save_all=True, append_images=images[1:])
+            return path
+
+        return self._get("pdf_file_path", build)
+
+
+@contextlib.contextmanager
+def _quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def _stub_tabula(inputs: Inputs):
+    def _run_tabula(command=None, **kwargs):
+        return subprocess.CompletedProcess(
+            command, 0, stdout=inputs.tabula_file_path.read_bytes()
+        )
+
+    # No Tabula jar is needed
+    with mock.patch.object(
+        tabula, "get_tabula_jar_path", lambda: "tabula.jar"
+    ), mock.patch.object(tabula, "_run_tabula", _run_tabula):
+        yield
+
+
+def _stub_textract(inputs: Inputs):
+    return mock.patch(
+        "doeextractor.textractor.extract_tables",
+        lambda input_file_path, **kwargs: {"csv": inputs.textract_csv},
+    )
+
+
+def _process_report(inputs: Inputs, backend: Backend, stub) -> int:
+    report = inputs.directory / "petro_min_2022-may-10.pdf"
+    report.touch()
+    with stub(inputs):
+        result = batch.process_report(report, backend, inputs.directory / "parsed")
+    if result["error"]:
+        raise Exception(result["error"])
+    return result["rows"]
+
+
+def _parse_tabula(inputs: Inputs) -> int:
+    response = parser.parse(
+        inputs.tabula_file_path, inputs.directory / "parsed.json", stream=True
+    )
+    return len(response["results"])
+
+
+def _parse_tabula_tables(inputs: Inputs) -> int:
+    tables = tabula.tables_from_output(inputs.tabula_output)
+    response = parser.parse_tables(tables["pages"], meta_id=tables["meta_id"])
+    return len(response["results"])
+
+
+def _parse_tabula_output(inputs: Inputs) -> int:
+    return len(parser.parse_output(inputs.tabula_output)["results"])
+
+
+def _parse_textract(inputs: Inputs) -> int:
+    response = textract_parser.parse(
+        inputs.textract_file_path, inputs.directory / "parsed.json"
+    )
+    return len(response["results"])
+
+
+def _encode_pages(inputs: Inputs) -> int:
+    from PIL import Image
+
+    for page in inputs.pages:
+        with Image.open(page) as image:
+            image.convert("RGB").save(io.BytesIO(), format="PNG")
+    return len(inputs.pages)
+
+
+def _convert_pdf_to_png(inputs: Inputs) -> int:
+    output_dir = inputs.directory / "pages"
+    shutil.rmtree(output_dir, ignore_errors=True)
+    with mock.patch.object(file_helpers, "OUTPUT_DIR", output_dir):
+        file_helpers.convert_pdf_to_png(inputs.pdf_file_path)
+    return len(inputs.pages)
+
+
+def _analyse(inputs: Inputs, engine: AnalysisEngine) -> int:
+    analyser.analyse(inputs.results, engine=engine)
+    return len(inputs.results)
+
+
+def _has_numpy() -> bool:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _has_poppler() -> bool:
+    return shutil.which("pdftoppm") is not None
+
+
+REQUIREMENTS = {"numpy": _has_numpy, "poppler": _has_poppler}
+
+# name: (run, prepare, max scale, requirement)
+STAGES = {
+    "tabula.tokenize": (
+        lambda inputs: len(list(parser.tokenize(inputs.tabula_texts))),
+        lambda inputs: inputs.tabula_texts,
+        None,
+        None,
+    ),
+    "tabula.build_data": (
+        lambda inputs: len(parser._build_data(inputs.tabula_tokens)),
+        lambda inputs: inputs.tabula_tokens,
+        None,
+        None,
+    ),
+    "tabula.parse": (_parse_tabula, lambda inputs: inputs.tabula_file_path, None, None),
+    "textract.tokenize_input": (
+        lambda inputs: len(
+            textract_parser.tokenize_input(inputs.textract_file_path)[0]
+        ),
+        lambda inputs: inputs.textract_file_path,
+        None,
+        None,
+    ),
+    "textract.parse": (
+        _parse_textract,
+        lambda inputs: inputs.textract_file_path,
+        None,
+        None,
+    ),
+    "analyse.decimal": (
+        lambda inputs: _analyse(inputs, AnalysisEngine.DECIMAL),
+        lambda inputs: inputs.results,
+        None,
+        None,
+    ),
+    "analyse.numpy": (
+        lambda inputs: _analyse(inputs, AnalysisEngine.NUMPY),
+        lambda inputs: inputs.results,
+        None,
+        "numpy",
+    ),
+    "tabula.parse_tables": (
+        _parse_tabula_tables,
+        lambda inputs: inputs.tabula_output,
+        None,
+        None,
+    ),
+    "tabula.parse_output": (
+        _parse_tabula_output,
+        lambda inputs: inputs.tabula_output,
+        None,
+        None,
+    ),
+    "pipeline.tabula (stub)": (
+        lambda inputs: _process_report(inputs, Backend.TABULA, _stub_tabula),
+        lambda inputs: inputs.tabula_file_path,
+        None,
+        None,
+    ),
+    "pipeline.textract (stub)": (
+        lambda inputs: _process_report(inputs, Backend.TEXTRACT, _stub_textract),
+        lambda inputs: inputs.textract_csv,
+        None,
+        None,
+    ),
+    "pages.encode_png": (
+        _encode_pages,
+        lambda inputs: inputs.pages,
+        MAX_PAGES_SCALE,
+        None,
+    ),
+    "pages.convert_pdf_to_png": (
+        _convert_pdf_to_png,
+        lambda inputs: inputs.pdf_file_path,
+        MAX_PAGES_SCALE,
+        "poppler",
+    ),
+}
+
+
+def measure(run, inputs: Inputs, repeat: int) -> dict:
+    """
+    Best wall time of ``repeat`` runs, and peak traced memory of one more
+    run (tracing slows the code down, so it is not timed).
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with _quiet():
+            rows = run(inputs)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        with _quiet():
+            run(inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    seconds = min(timings)
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_s": round(rows / seconds, 1) if seconds else None,
+        "peak_mb": round(peak / (1024 * 1024), 2),
+    }
+
+
+def run_benchmarks(scales, repeat: int, stages=None) -> dict:
+    """
+    Measure every stage at every scale. Returns ``{"<stage>@<scale>x": {...}}``.
+    """
+    report = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            inputs = Inputs(Path(directory), scale)
+            for name, (run, prepare, max_scale, requirement) in STAGES.items():
+                if stages and name not in stages:
+                    continue
+                key = f"{name}@{scale}x"
+                if max_scale is not None and scale > max_scale:
+                    continue
+                if requirement and not REQUIREMENTS[requirement]():
+                    print(f"{key:36} skipped ({requirement} is not installed)")
+                    continue
+                with _quiet():
+                    prepare(inputs)
+                report[key] = measure(run, inputs, repeat)
+                print(_format(key, report[key]))
+    return report
+
+
+def _format(key: str, result: dict) -> str:
+    return (
+        f"{key:36} {result['rows']:9} rows {result['seconds'] * 1000:10.1f} ms"
+        f" {result['rows_per_s']:12.0f} rows/s {result['peak_mb']:9.2f} MB"
+    )
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Stages slower or heavier than the baseline by more than ``tolerance``.
+    """
+    regressions = []
+    for key, result in report.items():
+        expected = baseline.get(key)
+        if not expected:
+            continue
+        if result["rows_per_s"] < expected["rows_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: {result['rows_per_s']:.0f} rows/s, baseline {expected['rows_per_s']:.0f}"
+            )
+        if result["peak_mb"] > expected["peak_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{key}: {result['peak_mb']:.2f} MB, baseline {expected['peak_mb']:.2f}"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scales",
+        default=DEFAULT_SCALES,
+        help="Comma separated scale factors, e.g. 1,10,100,1000",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stage", action="append", dest="stages", choices=list(STAGES))
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    report = run_benchmarks(scales, args.repeat, args.stages)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Baseline saved to:", args.baseline)
+    if args.compare:
+        regressions = compare(
+            report, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Startup time of the ``doeextractor`` command.
+
+Times ``doeextractor --help`` in fresh interpreters and breaks down the
+import time of ``doeextractor.cli`` with ``python -X importtime``::
+
+    python -m benchmarks.startup --runs 10 --max-ms 300
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+HELP_COMMAND = [sys.executable, "-m", "doeextractor.cli", "--help"]
+IMPORTTIME_COMMAND = [
+    sys.executable,
+    "-X",
+    "importtime",
+    "-c",
+    "import doeextractor.cli",
+]
+
+
+def _environment() -> dict:
+    # Startup must not depend on credentials or the Tabula jar
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key
+        not in {"TABULA_JAR_PATH", "AWS_REGION", "AWS_ACCESS_KEY", "AWS_SECRET_KEY"}
+    }
+    env["PYTHONPATH"] = str(ROOT_DIR)
+    return env
+
+
+def time_help(runs: int) -> list:
+    """
+    Wall time in milliseconds of each ``doeextractor --help`` run.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            HELP_COMMAND,
+            cwd=ROOT_DIR,
+            env=_environment(),
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def import_times() -> list:
+    """
+    ``(cumulative_ms, module)`` of every module imported by the CLI,
+    slowest first.
+    """
+    result = subprocess.run(
+        IMPORTTIME_COMMAND,
+        cwd=ROOT_DIR,
+        env=_environment(),
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.decode("utf-8").splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times.append((int(cumulative) / 1000, module.strip()))
+    return sorted(times, reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-ms", type=float, help="Fail if the median run is slower than this."
+    )
+    args = parser.parse_args(argv)
+
+    timings = time_help(args.runs)
+    median = statistics.median(timings)
+    print(f"doeextractor --help: median {median:.1f} ms, min {min(timings):.1f} ms")
+    print("\nSlowest imports of doeextractor.cli:")
+    for cumulative, module in import_times()[: args.top]:
+        print(f"{cumulative:10.1f} ms  {module}")
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nStartup is slower than {args.max_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Microbenchmark of token classification.
+
+Classifies every cell of the sample Tabula output with the feature
+functions one by one and with the compiled classifier::
+
+    python -m benchmarks.token_types --repeat 20
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+from doeextractor.token_types import (
+    FEATURES,
+    TOKEN_TYPES,
+    UNCATEGORIZED,
+    classify_token,
+)
+
+SAMPLE_TABULA_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.json"
+)
+
+
+def load_tokens(path: Path = SAMPLE_TABULA_OUTPUT) -> list:
+    tokens = []
+    for page in json.loads(path.read_bytes()):
+        for row in page.get("data", []):
+            tokens.extend(cell["text"] for cell in row)
+    return tokens
+
+
+def classify_with_features(tokens):
+    for text in tokens:
+        text = text.lower().strip()
+        for feature, feature_func in FEATURES.items():
+            if feature_func(text):
+                TOKEN_TYPES[feature]
+                break
+        else:
+            UNCATEGORIZED
+
+
+def classify_compiled(tokens):
+    for text in tokens:
+        classify_token(text.lower().strip())
+
+
+def classify_compiled_cold(tokens):
+    classify_token.cache_clear()
+    classify_compiled(tokens)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    tokens = load_tokens()
+    print(f"{len(tokens)} tokens, {len(set(tokens))} distinct")
+    for name, func in [
+        ("features", classify_with_features),
+        ("compiled (cold cache)", classify_compiled_cold),
+        ("compiled (warm cache)", classify_compiled),
+    ]:
+        best = min(timeit.repeat(lambda: func(tokens), number=1, repeat=args.repeat))
+        print(f"{name:24} {best * 1000:8.2f} ms  {len(tokens) / best:12.0f} tokens/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import json
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from doeextractor.analyser import DECIMAL_PLACES, iter_price_cells
+from doeextractor.models import FuelLinePriceItem, PriceTable
+from doeextractor.prices import price_values
+
+KEY_FIELDS = ("company", "product", "municity")
+
+
+@dataclass
+class PriceAggregate:
+    """
+    Running statistics of a set of prices.
+
+    The histogram counts every distinct price. Prices are quoted to the
+    centavo, so it stays small, and it makes median and mode exact and
+    mergeable.
+    """
+
+    count: int = 0
+    total: Decimal = Decimal(0)
+    min: Optional[Decimal] = None
+    max: Optional[Decimal] = None
+    histogram: Counter = field(default_factory=Counter)
+
+    def add(self, value: Decimal, count: int = 1):
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.histogram[value] += count
+
+    def merge(self, other: "PriceAggregate"):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        self.histogram.update(other.histogram)
+
+    def mean(self) -> Decimal:
+        return self.total / self.count
+
+    def median(self) -> Decimal:
+        # Middle values of the sorted prices, found by walking the histogram
+        low_idx, high_idx = (self.count - 1) // 2, self.count // 2
+        low = None
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if low is None and seen > low_idx:
+                low = value
+            if seen > high_idx:
+                return (low + value) / 2
+
+    def mode(self) -> Decimal:
+        # Smallest of the most common prices, like statistics.mode on sorted prices
+        return min(self.histogram.items(), key=lambda item: (-item[1], item[0]))[0]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": str(self.total),
+            "min": str(self.min),
+            "max": str(self.max),
+            "histogram": {str(value): count for value, count in self.histogram.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PriceAggregate":
+        return cls(
+            count=data["count"],
+            total=Decimal(data["total"]),
+            min=Decimal(data["min"]),
+            max=Decimal(data["max"]),
+            histogram=Counter(
+                {Decimal(value): count for value, count in data["histogram"].items()}
+            ),
+        )
+
+
+class AggregateStore:
+    """
+    Price aggregates per (company, product, municity), updated one report
+    at a time.
+
+    Adding a report costs time proportional to that report, and stores
+    built by parallel workers can be merged. Reports are identified by
+    their ``meta_id`` so a report is never counted twice.
+    """
+
+    def __init__(self):
+        self.aggregates: Dict[Tuple[str, str, str], PriceAggregate] = {}
+        self.meta_ids = set()
+
+    def add_results(
+        self,
+        results: Union[List[FuelLinePriceItem], PriceTable],
+        meta_id: Optional[str] = None,
+    ) -> bool:
+        """
+        Add the results of a parsed report. Returns False if the report was
+        already added.
+        """
+        if meta_id is not None:
+            if meta_id in self.meta_ids:
+                return False
+            self.meta_ids.add(meta_id)
+        for company, product, municity, price in iter_price_cells(results):
+            if not company:
+                continue
+            values = price_values(price)
+            if not values:
+                continue
+            key = (company, product, municity)
+            aggregate = self.aggregates.get(key)
+            if aggregate is None:
+                aggregate = self.aggregates[key] = PriceAggregate()
+            for value in values:
+                aggregate.add(value)
+        return True
+
+    def merge(self, other: "AggregateStore") -> "AggregateStore":
+        """
+        Merge the aggregates of another store, e.g. one built by a parallel
+        worker. The stores must not share reports.
+        """
+        if other.meta_ids & self.meta_ids:
+            raise Exception(
+                "Cannot merge stores that share reports: "
+                + ", ".join(sorted(other.meta_ids & self.meta_ids))
+            )
+        self.meta_ids |= other.meta_ids
+        for key, aggregate in other.aggregates.items():
+            self.aggregates.setdefault(key, PriceAggregate()).merge(aggregate)
+        return self
+
+    def group(self, fields: Iterable[str] = ("company", "product")) -> dict:
+        """
+        Aggregates combined over the key fields that are not in ``fields``.
+        """
+        indexes = [KEY_FIELDS.index(name) for name in fields]
+        groups = {}
+        for key, aggregate in self.aggregates.items():
+            group_key = tuple(key[idx] for idx in indexes)
+            groups.setdefault(group_key, PriceAggregate()).merge(aggregate)
+        return groups
+
+    def summary(self) -> dict:
+        """
+        Mean, median, mode, min and max of prices from all companies, in the
+        same shape as ``analyser.analyse``.
+        """
+        results = defaultdict(lambda: defaultdict(dict))
+        for (company, product), aggregate in self.group().items():
+            for name, value in (
+                ("mean", aggregate.mean()),
+                ("median", aggregate.median()),
+                ("mode", aggregate.mode()),
+                ("min", aggregate.min),
+                ("max", aggregate.max),
+            ):
+                results[company][product][name] = round(float(value), DECIMAL_PLACES)
+        return results
+
+    def add_file(self, parsed_file_path: Union[str, Path]) -> bool:
+        """
+        Add a parsed JSON output file.
+        """
+        with open(parsed_file_path) as f:
+            response = json.load(f)
+        return self.add_results(response["results"], response["metadata"]["meta_id"])
+
+    def save(self, file_path: Union[str, Path]):
+        data = {
+            "meta_ids": sorted(self.meta_ids),
+            "aggregates": [
+                [*key, aggregate.to_dict()]
+                for key, aggregate in self.aggregates.items()
+            ],
+        }
+        with open(file_path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, file_path: Union[str, Path]) -> "AggregateStore":
+        with open(file_path) as f:
+            data = json.load(f)
+        store = cls()
+        store.meta_ids = set(data["meta_ids"])
+        for *key, aggregate in data["aggregates"]:
+            store.aggregates[tuple(key)] = PriceAggregate.from_dict(aggregate)
+        return store
@@ -0,0 +1,243 @@
+"""
+Asyncio API, to run extractions inside an event loop::
+
+    result = await extract_report("petro_min_2022-may-10.pdf", Backend.TEXTRACT)
+
+Nothing blocks the loop: Tabula runs as an asyncio subprocess, Textract
+pages are sent from the default executor at most ``max_workers`` at a time,
+and parsing runs in the default executor too, so one loop can extract many
+reports at once. Cancelling ``extract_report`` kills the Tabula process or
+stops sending pages; a parse already running finishes in its thread and
+its result is dropped.
+"""
+import asyncio
+import contextlib
+import functools
+import subprocess
+from logging import getLogger
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from .batch import (
+    PARSED_SUFFIX,
+    _parse_tabula_output,
+    _parse_textract_output,
+    _tabula_options,
+)
+from .constants import AnalysisEngine, Backend
+from .exceptions import NotFoundException
+from .file_helpers import DEFAULT_DPI, AnalysisCache, get_cache, iter_pdf_pages
+from .instrumentation import stage
+from .tabula import (
+    _json_options,
+    _tabula_arguments,
+    get_tabula_jar_path,
+    tables_from_output,
+)
+from .textractor import (
+    TEXTRACT_MAX_WORKERS,
+    _extraction_settings,
+    _get_cached_tables,
+    _get_client,
+    _page_hash,
+    _save_tables,
+    analyze_page,
+)
+
+logger = getLogger(__name__)
+
+
+async def _run_in_executor(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def _run_tabula(input_file_path, **options) -> bytes:
+    command = ["java", "-jar", get_tabula_jar_path()]
+    command.extend(_tabula_arguments(input_file_path=input_file_path, **options))
+    with stage("tabula.extract"):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            raise NotFoundException("Tabula is not installed or not set in PATH")
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
+            raise
+    if process.returncode != 0:
+        logger.error(
+            "Error occured while running tabula:\n{}\n".format(stderr.decode("utf-8"))
+        )
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout
+
+
+async def run_tabula(input_file_path: Union[str, Path], **options) -> str:
+    """
+    Run Tabula in a subprocess without blocking the loop.
+
+    Accepts the same options as ``tabula.extract``. Returns the Tabula
+    output, which is empty when ``output_file_path`` is given. The process
+    is killed when the task is cancelled.
+    """
+    return (await _run_tabula(input_file_path, **options)).decode("utf-8")
+
+
+async def extract_tabula_tables(input_file_path: Union[str, Path], **options) -> dict:
+    """
+    Extract the tables of a PDF as Python objects without blocking the
+    loop. Same result as ``tabula.extract_tables``.
+    """
+    output = await _run_tabula(input_file_path, **_json_options(options))
+    return tables_from_output(output)
+
+
+async def analyze_pages(
+    pages: Iterable,
+    client=None,
+    max_workers=TEXTRACT_MAX_WORKERS,
+    page_cache: Optional[AnalysisCache] = None,
+) -> list:
+    """
+    Send pages to Textract concurrently, at most ``max_workers`` at a time.
+
+    Same as ``textractor.analyze_pages``, but awaitable: ``pages`` may be a
+    lazy iterator, which is only advanced in the executor when a slot frees
+    up. When a page fails, the pages not sent yet are dropped and the ones
+    already sent are finished and cached before the error is raised. When
+    the task is cancelled, all pages are dropped. Responses are returned in
+    the same order as ``pages``.
+    """
+    client = client or await _run_in_executor(_get_client)
+    slots = asyncio.Semaphore(max_workers)
+    pages = iter(pages)
+
+    async def _analyze(page):
+        try:
+            page_hash = None
+            if page_cache is not None:
+                if isinstance(page, Path):
+                    page = page.read_bytes()
+                page_hash = _page_hash(page)
+                cached_response = await _run_in_executor(page_cache.get_page, page_hash)
+                if cached_response is not None:
+                    return cached_response
+            response = await _run_in_executor(analyze_page, client, page)
+            response.pop("ResponseMetadata", None)
+            if page_cache is not None:
+                await _run_in_executor(page_cache.add_page, page_hash, response)
+            return response
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        while True:
+            await slots.acquire()
+            page = await _run_in_executor(next, pages, None)
+            if page is None:
+                slots.release()
+                break
+            tasks.append(asyncio.ensure_future(_analyze(page)))
+            if any(task.done() and task.exception() for task in tasks):
+                break
+        # Pages already sent are stored even when another one failed
+        responses = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+    for response in responses:
+        if isinstance(response, BaseException):
+            raise response
+    return responses
+
+
+async def extract_tables(
+    input_file_path: Union[str, Path],
+    max_workers=TEXTRACT_MAX_WORKERS,
+    dpi=DEFAULT_DPI,
+    client=None,
+    write_output=True,
+) -> Optional[dict]:
+    """
+    Extract tables from a PDF file using Amazon Textract, without blocking
+    the loop. Same result and cache as ``textractor.extract_tables``.
+    """
+    input_file_path = Path(input_file_path).absolute()
+    settings = _extraction_settings(dpi=dpi)
+    cache = get_cache()
+    with stage("textractor.extract_tables"):
+        cached_tables = await _run_in_executor(
+            _get_cached_tables, input_file_path, settings, cache
+        )
+        if cached_tables:
+            return cached_tables
+        responses = await analyze_pages(
+            iter_pdf_pages(input_file_path, dpi=dpi),
+            client=client,
+            max_workers=max_workers,
+            page_cache=cache,
+        )
+        return await _run_in_executor(
+            _save_tables, input_file_path, settings, responses, cache, write_output
+        )
+
+
+async def extract_report(
+    input_file_path: Union[str, Path],
+    backend: Backend = Backend.TABULA,
+    output_dir: Optional[Union[str, Path]] = None,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: Optional[Path] = None,
+    **options,
+) -> dict:
+    """
+    Run extraction, parsing and analysis for a single report.
+
+    Returns the parsed ``metadata``, ``results`` (as a compact
+    ``PriceTable``) and ``analysis``, with the ``input_file_path`` and the
+    ``output_file_path`` of the parsed JSON.
+    The parsed JSON is written to ``output_dir``, next to the report by
+    default. Tabula options are passed to ``run_tabula``;
+    Textract takes ``max_workers``, ``dpi``, ``client`` and ``write_output``.
+    Extracted tables are passed to the parsers in memory. Failures are
+    raised.
+    """
+    input_file_path = Path(input_file_path).absolute()
+    output_dir = Path(output_dir or input_file_path.parent).absolute()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if backend == Backend.TABULA:
+        output = await _run_tabula(
+            input_file_path, **_json_options(_tabula_options(options))
+        )
+        response = await _run_in_executor(
+            _parse_tabula_output,
+            input_file_path,
+            output,
+            output_dir,
+            engine,
+            dataset_dir,
+        )
+    else:
+        extracted = await extract_tables(input_file_path, **options)
+        response = await _run_in_executor(
+            _parse_textract_output,
+            input_file_path,
+            extracted,
+            output_dir,
+            engine,
+            dataset_dir,
+        )
+    response["input_file_path"] = str(input_file_path)
+    response["output_file_path"] = str(
+        output_dir / (input_file_path.stem + PARSED_SUFFIX)
+    )
+    return response
@@ -1,34 +1,64 @@
 import itertools
 import statistics
 from collections import defaultdict
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 from pprint import PrettyPrinter
-from typing import List
+from typing import List, Union
 
-from doeextractor.models.fuel_line_price import FuelLinePriceItem, FuelPrice
+from doeextractor.constants import AnalysisEngine
+from doeextractor.exceptions import NotFoundException
+from doeextractor.instrumentation import stage
+from doeextractor.models import FuelLinePriceItem, PriceTable
+from doeextractor.prices import price_values
 
 pp = PrettyPrinter(indent=2)
 DECIMAL_PLACES = 2
 
 
-def analyse(results: List[FuelLinePriceItem]):
-    """Get mean, median, mode of prices from all companies"""
-    company_products = defaultdict(lambda: defaultdict(list))
+def analyse(
+    results: Union[List[FuelLinePriceItem], PriceTable],
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+):
+    """
+    Get mean, median, mode, min and max of prices from all companies
+
+    The decimal engine is exact. The numpy engine computes every statistic
+    over float arrays in one vectorized pass, for large sets of reports.
+    """
+    with stage("analyser.analyse_" + engine.value) as counters:
+        counters["rows"] += len(results)
+        if engine == AnalysisEngine.NUMPY:
+            return analyse_numpy(results)
+        return analyse_decimal(results)
+
+
+def iter_price_cells(results: Union[List[FuelLinePriceItem], PriceTable]):
+    """
+    ``(company, product, municity, price)`` of every price cell of the
+    results, read in place without building dataclasses.
+    """
+    if isinstance(results, PriceTable):
+        # The price text, like for dicts: statistics use every distinct value
+        # of a cell, which ``price_low`` and ``price_high`` do not keep
+        for company, product, municity, price, _, _ in results.iter_prices():
+            yield company, product, municity, price
+        return
     for line_price_item in results:
-        line_price_item = FuelLinePriceItem(**line_price_item)
-        for fuel_price in line_price_item.prices:
-            fuel_price = FuelPrice(**fuel_price)
-            if not fuel_price.company:
-                continue
-            # price can be a range
-            price_raw = set(fuel_price.price.replace("-", "").split(" ")) - {""}
-            try:
-                price = list(map(Decimal, (list(itertools.chain(price_raw)))))
-            except InvalidOperation:
-                continue
-            if len(price) == 0:
-                continue
-            company_products[fuel_price.company][line_price_item.product].append(price)
+        product = line_price_item.get("product", "")
+        municity = line_price_item["municity"]
+        for fuel_price in line_price_item.get("prices", []):
+            yield fuel_price["company"], product, municity, fuel_price["price"]
+
+
+def analyse_decimal(results: Union[List[FuelLinePriceItem], PriceTable]):
+    company_products = defaultdict(lambda: defaultdict(list))
+    for company, product, _, price in iter_price_cells(results):
+        if not company:
+            continue
+        price = price_values(price, Decimal)
+        if not price:
+            continue
+        company_products[company][product].append(price)
 
     results = defaultdict(lambda: defaultdict(dict))
     for company in company_products.keys():
@@ -43,6 +73,120 @@ def analyse(results: List[FuelLinePriceItem]):
             results[company][product]["mode"] = round(
                 float(mode(flattened_prices)), DECIMAL_PLACES
             )
+            results[company][product]["min"] = round(
+                float(flattened_prices[0]), DECIMAL_PLACES
+            )
+            results[company][product]["max"] = round(
+                float(flattened_prices[-1]), DECIMAL_PLACES
+            )
+    return results
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise NotFoundException(
+            "NumPy is required for the numpy analysis engine. Install it with: pip install numpy"
+        )
+    return numpy
+
+
+def price_columns(results: Union[List[FuelLinePriceItem], PriceTable]):
+    """
+    Parse all prices into columnar arrays.
+
+    Returns a dict with the float ``prices`` and, per price, the integer
+    codes of its ``company``, ``product``, ``municity`` and (company,
+    product) ``group``. The ``*_names`` lists map codes back to names, in
+    order of first appearance.
+    """
+    np = _import_numpy()
+    keys = ("company", "product", "municity", "group")
+    codes = {key: {} for key in keys}
+    cells = []  # Codes of every price cell, in the order of ``keys``
+    counts = []  # Number of values of every price cell
+    prices = []
+    parsed = {}  # Price cells repeat a lot across rows
+    cell_codes = {}
+    for company, product, municity, price in iter_price_cells(results):
+        if not company:
+            continue
+        values = parsed.get(price)
+        if values is None:
+            values = parsed[price] = price_values(price, float)
+        if not values:
+            continue
+        cell_key = (company, product, municity)
+        cell = cell_codes.get(cell_key)
+        if cell is None:
+            cell = cell_codes[cell_key] = [
+                codes[key].setdefault(value, len(codes[key]))
+                for key, value in zip(keys, cell_key + ((company, product),))
+            ]
+        cells.append(cell)
+        counts.append(len(values))
+        prices.extend(values)
+
+    cells = np.array(cells, dtype=np.int64).reshape(-1, len(keys))
+    counts = np.array(counts, dtype=np.int64)
+    response = {"prices": np.array(prices, dtype=np.float64)}
+    for key_idx, key in enumerate(keys):
+        response[key] = np.repeat(cells[:, key_idx], counts)
+        response[key + "_names"] = list(codes[key])
+    return response
+
+
+def _grouped_stats(np, groups, values):
+    """
+    Mean, median, mode, min and max of ``values`` for each group code.
+    """
+    order = np.lexsort((values, groups))
+    groups = groups[order]
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    ends = starts + counts
+
+    # Runs of equal values within a group; the longest run is the mode and
+    # ties go to the smallest value, like statistics.mode on sorted prices.
+    run_starts = np.flatnonzero(
+        np.r_[True, (groups[1:] != groups[:-1]) | (values[1:] != values[:-1])]
+    )
+    run_lengths = np.diff(np.r_[run_starts, len(values)])
+    run_groups = groups[run_starts]
+    best_runs = np.lexsort((run_starts, -run_lengths, run_groups))
+    first_of_group = np.r_[
+        True, run_groups[best_runs][1:] != run_groups[best_runs][:-1]
+    ]
+
+    return {
+        "group": groups[starts],
+        "mean": np.add.reduceat(values, starts) / counts,
+        "median": (values[starts + (counts - 1) // 2] + values[starts + counts // 2])
+        / 2,
+        "mode": values[run_starts[best_runs[first_of_group]]],
+        "min": values[starts],
+        "max": values[ends - 1],
+    }
+
+
+def analyse_numpy(results: Union[List[FuelLinePriceItem], PriceTable]):
+    np = _import_numpy()
+    columns = price_columns(results)
+    results = defaultdict(lambda: defaultdict(dict))
+    if not len(columns["prices"]):
+        return results
+
+    stats = _grouped_stats(np, columns["group"], columns["prices"])
+    names = columns["group_names"]
+    keys = ("mean", "median", "mode", "min", "max")
+    for row_idx, group in enumerate(stats["group"].tolist()):
+        company, product = names[group]
+        for key in keys:
+            results[company][product][key] = round(
+                float(stats[key][row_idx]), DECIMAL_PLACES
+            )
     return results
 
 
@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+from . import analyser
+from .constants import AnalysisEngine, Backend, ExtractMethod
+from .file_helpers import AnalysisCache, get_cache, set_cache
+from .instrumentation import get_recorder, recording
+
+PARSED_SUFFIX = ".parsed.json"
+
+
+def _tabula_options(options: dict) -> dict:
+    options.setdefault("pages", "all")
+    options.setdefault("extract_method", ExtractMethod.LATTICE)
+    return options
+
+
+def _parse_tabula_output(
+    input_file_path: Path,
+    output: bytes,
+    output_dir: Path,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: Optional[Path] = None,
+) -> dict:
+    from .columnar import report_date_from_path
+    from .parser import parse_output
+
+    response = parse_output(
+        output,
+        output_dir / (input_file_path.stem + PARSED_SUFFIX),
+        dataset_dir=dataset_dir,
+        report_date=report_date_from_path(input_file_path),
+        as_table=True,
+    )
+    response["analysis"] = analyser.analyse(response["results"], engine=engine)
+    return response
+
+
+def _parse_textract_output(
+    input_file_path: Path,
+    extracted: Optional[dict],
+    output_dir: Path,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: Optional[Path] = None,
+) -> dict:
+    from .columnar import report_date_from_path
+    from .textract_parser import parse_csv
+
+    if extracted is None:
+        raise Exception("Cannot analyze or no CSV results")
+    return parse_csv(
+        extracted["csv"],
+        output_dir / (input_file_path.stem + PARSED_SUFFIX),
+        engine=engine,
+        dataset_dir=dataset_dir,
+        report_date=report_date_from_path(input_file_path),
+        as_table=True,
+    )
+
+
+def _tabula_pipeline(
+    input_file_path: Path,
+    output_dir: Path,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: Optional[Path] = None,
+    **options,
+) -> dict:
+    from . import tabula
+
+    output = tabula.extract_output(input_file_path, **_tabula_options(options))
+    return _parse_tabula_output(
+        input_file_path, output, output_dir, engine, dataset_dir
+    )
+
+
+def _textract_pipeline(
+    input_file_path: Path,
+    output_dir: Path,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: Optional[Path] = None,
+    **options,
+) -> dict:
+    from .textractor import extract_tables
+
+    return _parse_textract_output(
+        input_file_path,
+        extract_tables(input_file_path),
+        output_dir,
+        engine,
+        dataset_dir,
+    )
+
+
+PIPELINES = {
+    Backend.TABULA: _tabula_pipeline,
+    Backend.TEXTRACT: _textract_pipeline,
+}
+
+
+def process_report(
+    input_file_path: Union[str, Path],
+    backend: Backend = Backend.TABULA,
+    output_dir: Optional[Union[str, Path]] = None,
+    **options,
+) -> dict:
+    """
+    Run extraction, parsing and analysis for a single report.
+
+    Never raises; failures are reported in the ``error`` key so one bad
+    report does not stop the rest of the batch.
+    """
+    input_file_path = Path(input_file_path).absolute()
+    output_dir = Path(output_dir or input_file_path.parent).absolute()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result = {
+        "input_file_path": str(input_file_path),
+        "output_file_path": str(output_dir / (input_file_path.stem + PARSED_SUFFIX)),
+        "rows": 0,
+        "analysis": None,
+        "error": None,
+    }
+    with recording() as recorder:
+        try:
+            response = PIPELINES[backend](input_file_path, output_dir, **options)
+        except Exception as e:
+            result["error"] = f"{e.__class__.__name__}: {e}"
+            result["traceback"] = traceback.format_exc()
+        else:
+            result["rows"] = len(response["results"])
+            result["analysis"] = response["analysis"]
+    result["instrumentation"] = recorder.report()
+    return result
+
+
+def find_reports(directory: Union[str, Path]) -> List[Path]:
+    """
+    List the PDF reports in a directory.
+    """
+    return sorted(
+        path for path in Path(directory).iterdir() if path.suffix.lower() == ".pdf"
+    )
+
+
+def _init_worker(cache_db_path):
+    """
+    Share the analysis cache of the parent with the pipelines of a worker.
+    """
+    set_cache(AnalysisCache(cache_db_path))
+
+
+def _process_pool(
+    jobs: int, cache: Optional[AnalysisCache] = None
+) -> ProcessPoolExecutor:
+    """
+    Worker processes for reports, using ``cache`` (the cache of this
+    process by default).
+    """
+    # Workers are spawned, not forked, so they do not share the SQLite
+    # connection of the cache with this process; each opens its own
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=((cache or get_cache()).db_path,),
+    )
+
+
+def _print_progress(done: int, total: int, result: dict):
+    status = (
+        "error: " + result["error"] if result["error"] else f"{result['rows']} rows"
+    )
+    print(f"{done} / {total} {result['input_file_path']} ({status})")
+
+
+def run_batch(
+    directory: Union[str, Path],
+    backend: Backend = Backend.TABULA,
+    jobs: Optional[int] = None,
+    output_dir: Optional[Union[str, Path]] = None,
+    progress: Optional[Callable[[int, int, dict], None]] = _print_progress,
+    skip_analyzed: bool = False,
+    **options,
+) -> List[dict]:
+    """
+    Process every PDF report in a directory across ``jobs`` worker processes.
+
+    With ``skip_analyzed``, reports already in the analysis cache are left
+    out. Returns one result per processed report, in the order of the
+    input files.
+    """
+    input_file_paths = find_reports(directory)
+    if skip_analyzed:
+        entries = get_cache().get_many(input_file_paths)
+        input_file_paths = [path for path in input_file_paths if not entries[path]]
+        print(f"Skipping {len(entries) - len(input_file_paths)} analyzed reports")
+    total = len(input_file_paths)
+    jobs = jobs or os.cpu_count() or 1
+    results = {}
+
+    def _collect(input_file_path, result):
+        results[input_file_path] = result
+        get_recorder().merge(result["instrumentation"])
+        if progress:
+            progress(len(results), total, result)
+
+    if jobs == 1 or total <= 1:
+        for input_file_path in input_file_paths:
+            _collect(
+                input_file_path,
+                process_report(input_file_path, backend, output_dir, **options),
+            )
+    else:
+        with _process_pool(min(jobs, total)) as executor:
+            futures = {
+                executor.submit(
+                    process_report, input_file_path, backend, output_dir, **options
+                ): input_file_path
+                for input_file_path in input_file_paths
+            }
+            for future in as_completed(futures):
+                _collect(futures[future], future.result())
+    return [results[input_file_path] for input_file_path in input_file_paths]
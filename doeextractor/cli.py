@@ -1,21 +1,57 @@
 """Console script for doeextractor."""
+import json
 import sys
+from contextlib import ExitStack
+from pathlib import Path
 
 import click
 
-from doeextractor.constants import ExtractMethod, Formats
+from doeextractor.constants import (
+    SETTLE_SECONDS,
+    WATCH_INTERVAL,
+    AnalysisEngine,
+    Backend,
+    ExtractMethod,
+    Formats,
+)
+
+from .file_helpers import (
+    DEFAULT_DPI,
+    MIN_DPI,
+    PAGE_CACHE_MAX_AGE,
+    PAGE_CACHE_MAX_BYTES,
+    get_cache,
+    get_peak_memory_mb,
+)
+from .instrumentation import profile, save_report
 
-from .parser import parse as do_parse
-from .tabula import debug_info
-from .tabula import extract as do_extract
-from .textract_parser import parse as do_textract_parse
-from .textractor import extract as do_textract
+# Backend modules are imported by the commands that need them, so that
+# `doeextractor --help` does not load boto3 or check the configuration.
 
 
 @click.group()
-def cli():
+@click.option(
+    "--report",
+    "report_file_path",
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    help="Save a JSON report of the time and counters of every stage.",
+)
+@click.option(
+    "--profile",
+    "profile_file_path",
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    help="Run the command under cProfile and save the stats to this file.",
+)
+@click.pass_context
+def cli(ctx, report_file_path, profile_file_path):
     """Console script for doeextractor."""
     # click.echo("Main CLI")
+    stack = ExitStack()
+    ctx.call_on_close(stack.close)
+    if report_file_path:
+        stack.callback(save_report, report_file_path)
+    if profile_file_path:
+        stack.enter_context(profile(profile_file_path))
     return 0
 
 
@@ -102,6 +138,15 @@ def cli():
     "--output_file_path",
     type=click.Path(dir_okay=False, file_okay=True, writable=True),
 )
+@click.option(
+    "-w",
+    "--worker",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="""Run every extraction in one long-lived JVM instead of
+                            starting java per file. Requires JPype1.""",
+)
 def tabula_extract(
     area,
     batch,
@@ -114,9 +159,14 @@ def tabula_extract(
     use_line_returns,
     input_file_path,
     output_file_path,
+    worker,
 ):
     extract_method_value = ExtractMethod[extract_method]
-    do_extract(
+    from .tabula import extract as do_extract
+    from .tabula import extract_with_worker as do_extract_with_worker
+
+    run_extract = do_extract_with_worker if worker else do_extract
+    run_extract(
         area=area,
         batch_directory=batch,
         columns=columns,
@@ -137,15 +187,74 @@ def tabula_extract(
     "input_file_path",
     type=click.Path(exists=True, dir_okay=False, file_okay=True),
 )
-def extract(input_file_path):
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of pages sent to Textract at the same time.",
+)
+@click.option(
+    "--cache-pages",
+    is_flag=True,
+    default=False,
+    help="Keep the rendered page images under output/ and reuse them.",
+)
+@click.option(
+    "-m",
+    "--merge-pages",
+    is_flag=True,
+    default=False,
+    help="Send all pages to Textract as a single image.",
+)
+@click.option(
+    "-d",
+    "--dpi",
+    type=click.IntRange(min=MIN_DPI),
+    default=DEFAULT_DPI,
+    show_default=True,
+    help="Resolution of the rendered pages. Lowered automatically for merged pages that would exceed Textract's size limits.",
+)
+def extract(input_file_path, jobs, cache_pages, merge_pages, dpi):
+    from .textractor import extract as do_textract
+
     do_textract(
         input_file_path=input_file_path,
+        max_workers=jobs,
+        cache_pages=cache_pages,
+        merge_pages=merge_pages,
+        dpi=dpi,
+    )
+    click.echo(f"Peak memory: {get_peak_memory_mb()} MB")
+    return 0
+
+
+@cli.command(help="Evict cached Textract page responses")
+@click.option(
+    "--max-size-mb",
+    type=click.IntRange(min=0),
+    default=PAGE_CACHE_MAX_BYTES // (1024 * 1024),
+    show_default=True,
+)
+@click.option(
+    "--max-age-days",
+    type=click.IntRange(min=0),
+    default=PAGE_CACHE_MAX_AGE // (24 * 60 * 60),
+    show_default=True,
+)
+def evict_cache(max_size_mb, max_age_days):
+    evicted = get_cache().evict_pages(
+        max_bytes=max_size_mb * 1024 * 1024, max_age=max_age_days * 24 * 60 * 60
     )
+    click.echo(f"Evicted {evicted} cached pages")
     return 0
 
 
 @cli.command(help="Debug info for DOE Extractor")
 def show_debug_info():
+    from .tabula import debug_info
+
     click.echo(debug_info())
     return 0
 
@@ -159,9 +268,23 @@ def show_debug_info():
     "--output_file_path",
     type=click.Path(dir_okay=False, file_okay=True, writable=True),
 )
-def tabula_parse(input_file_path, output_file_path):
+@click.option(
+    "-s",
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Read the input incrementally instead of loading it whole.",
+)
+@click.option(
+    "--dataset-dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Also append the prices to a Parquet dataset in this directory.",
+)
+def tabula_parse(input_file_path, output_file_path, stream, dataset_dir):
+    from .parser import parse as do_parse
+
     click.echo("Parse extracted tables")
-    do_parse(input_file_path, output_file_path)
+    do_parse(input_file_path, output_file_path, stream=stream, dataset_dir=dataset_dir)
     return 0
 
 
@@ -180,9 +303,253 @@ def tabula_parse(input_file_path, output_file_path):
     is_flag=True,
     default=False,
 )
-def parse(input_file_path, output_file_path, clean):
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(list(AnalysisEngine.__members__.keys()), case_sensitive=False),
+    default=AnalysisEngine.DECIMAL.name,
+    show_default=True,
+    help="Analysis engine. NUMPY is faster on large inputs, DECIMAL is exact.",
+)
+@click.option(
+    "--dataset-dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Also append the prices to a Parquet dataset in this directory.",
+)
+def parse(input_file_path, output_file_path, clean, engine, dataset_dir):
+    from .textract_parser import parse as do_textract_parse
+
     click.echo("Parse extracted tables")
-    do_textract_parse(input_file_path, output_file_path, clean_input=clean)
+    do_textract_parse(
+        input_file_path,
+        output_file_path,
+        clean_input=clean,
+        engine=AnalysisEngine[engine],
+        dataset_dir=dataset_dir,
+    )
+    return 0
+
+
+@cli.command(help="Extract, parse and analyse all PDF reports in a directory")
+@click.argument(
+    "directory", type=click.Path(exists=True, dir_okay=True, file_okay=False)
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes. Defaults to the number of CPUs.",
+)
+@click.option(
+    "-k",
+    "--backend",
+    type=click.Choice(list(Backend.__members__.keys()), case_sensitive=False),
+    default=Backend.TABULA.name,
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Directory for the outputs. Defaults to the input directory.",
+)
+@click.option(
+    "-s",
+    "--skip-analyzed",
+    is_flag=True,
+    default=False,
+    help="Skip reports that are already in the analysis cache.",
+)
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(list(AnalysisEngine.__members__.keys()), case_sensitive=False),
+    default=AnalysisEngine.DECIMAL.name,
+    show_default=True,
+    help="Analysis engine. NUMPY is faster on large inputs, DECIMAL is exact.",
+)
+@click.option(
+    "--dataset-dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Also append the prices to a Parquet dataset in this directory.",
+)
+def batch(directory, jobs, backend, output_dir, skip_analyzed, engine, dataset_dir):
+    from .batch import run_batch as do_batch
+
+    results = do_batch(
+        directory,
+        backend=Backend[backend],
+        jobs=jobs,
+        output_dir=output_dir,
+        skip_analyzed=skip_analyzed,
+        engine=AnalysisEngine[engine],
+        dataset_dir=dataset_dir,
+    )
+    failed = [result for result in results if result["error"]]
+    click.echo(f"Processed {len(results)} reports, {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+    return 0
+
+
+@cli.command(help="Watch a directory and process new PDF reports as they arrive")
+@click.argument(
+    "directory", type=click.Path(exists=True, dir_okay=True, file_okay=False)
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes. Defaults to the number of CPUs.",
+)
+@click.option(
+    "-k",
+    "--backend",
+    type=click.Choice(list(Backend.__members__.keys()), case_sensitive=False),
+    default=Backend.TABULA.name,
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Directory for the outputs. Defaults to the watched directory.",
+)
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(list(AnalysisEngine.__members__.keys()), case_sensitive=False),
+    default=AnalysisEngine.DECIMAL.name,
+    show_default=True,
+    help="Analysis engine. NUMPY is faster on large inputs, DECIMAL is exact.",
+)
+@click.option(
+    "--dataset-dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    help="Also append the prices to a Parquet dataset in this directory.",
+)
+@click.option(
+    "-i",
+    "--interval",
+    type=click.FloatRange(min=0),
+    default=WATCH_INTERVAL,
+    show_default=True,
+    help="Seconds between scans of the directory.",
+)
+@click.option(
+    "--settle",
+    type=click.FloatRange(min=0),
+    default=SETTLE_SECONDS,
+    show_default=True,
+    help="Seconds a report must stay unchanged before it is picked up.",
+)
+@click.option(
+    "--once",
+    is_flag=True,
+    default=False,
+    help="Process the reports that are ready and exit.",
+)
+def watch(
+    directory, jobs, backend, output_dir, engine, dataset_dir, interval, settle, once
+):
+    from .watch import ReportWatcher
+
+    watcher = ReportWatcher(
+        directory,
+        backend=Backend[backend],
+        output_dir=output_dir,
+        jobs=jobs,
+        settle=settle,
+        engine=AnalysisEngine[engine],
+        dataset_dir=dataset_dir,
+    )
+    if once:
+        results = watcher.run_once()
+        failed = [result for result in results if result["error"]]
+        click.echo(f"Processed {len(results)} reports, {len(failed)} failed")
+        if failed:
+            sys.exit(1)
+    else:
+        watcher.run(interval=interval)
+    return 0
+
+
+@cli.command(help="Load parsed JSON outputs into the local price warehouse")
+@click.argument(
+    "parsed_file_paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, file_okay=True),
+)
+@click.option(
+    "--db",
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    help="Warehouse database. Defaults to prices.db in the project directory.",
+)
+def ingest(parsed_file_paths, db):
+    from .warehouse import PriceWarehouse, get_warehouse
+
+    warehouse = PriceWarehouse(db) if db else get_warehouse()
+    for parsed_file_path in parsed_file_paths:
+        added = warehouse.ingest_file(parsed_file_path)
+        click.echo(f"{parsed_file_path}: {added} prices added")
+    return 0
+
+
+@cli.command(help="Query prices in the local price warehouse")
+@click.option("-p", "--product")
+@click.option("-m", "--municity")
+@click.option("-c", "--company")
+@click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--until", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option(
+    "--db",
+    type=click.Path(dir_okay=False, file_okay=True),
+    help="Warehouse database. Defaults to prices.db in the project directory.",
+)
+def query(product, municity, company, since, until, db):
+    from .warehouse import PRICE_COLUMNS, PriceWarehouse, get_warehouse
+
+    warehouse = PriceWarehouse(db) if db else get_warehouse()
+    rows = warehouse.query_prices(
+        product=product,
+        municity=municity,
+        company=company,
+        since=since.date() if since else None,
+        until=until.date() if until else None,
+    )
+    click.echo("\t".join(PRICE_COLUMNS))
+    for row in rows:
+        click.echo("\t".join(str(row[column]) for column in PRICE_COLUMNS))
+    return 0
+
+
+@cli.command(help="Update the price aggregates with parsed JSON outputs")
+@click.argument(
+    "parsed_file_paths",
+    nargs=-1,
+    type=click.Path(exists=True, dir_okay=False, file_okay=True),
+)
+@click.option(
+    "-a",
+    "--aggregates_file_path",
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    default="aggregates.json",
+    show_default=True,
+)
+def aggregate(parsed_file_paths, aggregates_file_path):
+    from .aggregates import AggregateStore
+
+    if Path(aggregates_file_path).exists():
+        store = AggregateStore.load(aggregates_file_path)
+    else:
+        store = AggregateStore()
+    added = sum(store.add_file(path) for path in parsed_file_paths)
+    store.save(aggregates_file_path)
+    click.echo(f"Added {added} reports, {len(store.meta_ids)} in total")
+    click.echo(json.dumps(store.summary(), indent=2))
     return 0
 
 
@@ -0,0 +1,138 @@
+import math
+import re
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Union
+
+from doeextractor.exceptions import NotFoundException
+from doeextractor.models import FuelLinePriceItem, PriceTable
+
+PReportDate = re.compile(r"(\d{4})-([a-z]{3})[a-z]*-(\d{1,2})", re.IGNORECASE)
+PARTITION_COLUMN = "year"
+_COLUMN_NAMES = ("municity", "product", "company", "price_low", "price_high")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise NotFoundException(
+            "PyArrow is required for the columnar output. Install it with: pip install pyarrow"
+        )
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema(
+        [
+            ("report_date", pa.date32()),
+            ("municity", pa.string()),
+            ("product", pa.string()),
+            ("company", pa.string()),
+            ("price_low", pa.float64()),
+            ("price_high", pa.float64()),
+            ("meta_id", pa.string()),
+            (PARTITION_COLUMN, pa.int16()),
+        ]
+    )
+
+
+def _partitioning(pa, schema):
+    return pa.dataset.partitioning(
+        pa.schema([schema.field(PARTITION_COLUMN)]), flavor="hive"
+    )
+
+
+def report_date_from_path(file_path: Union[str, Path]) -> Optional[date]:
+    """
+    Date of a report from its file name. e.g. petro_min_2022-may-10.pdf
+    """
+    match = PReportDate.search(Path(file_path).stem)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(
+            "{}-{}-{}".format(*match.groups()).lower(), "%Y-%b-%d"
+        ).date()
+    except ValueError:
+        return None
+
+
+def flatten_results(
+    results: Union[List[FuelLinePriceItem], PriceTable],
+    report_date: Optional[date] = None,
+    meta_id: Optional[str] = None,
+) -> dict:
+    """
+    Flatten the nested prices of parsed results into columns, one row per
+    company price. Prices that are not numbers are left out.
+    """
+    if not isinstance(results, PriceTable):
+        results = PriceTable.from_dicts(results)
+    columns = {name: [] for name in _COLUMN_NAMES}
+    for company, product, municity, _, low, high in results.iter_prices():
+        if not company or math.isnan(low):
+            continue
+        columns["municity"].append(municity)
+        columns["product"].append(product)
+        columns["company"].append(company)
+        columns["price_low"].append(low)
+        columns["price_high"].append(high)
+    rows = len(columns["municity"])
+    columns["report_date"] = [report_date] * rows
+    columns["meta_id"] = [meta_id] * rows
+    columns[PARTITION_COLUMN] = [report_date.year if report_date else None] * rows
+    return columns
+
+
+def write_dataset(
+    results: Union[List[FuelLinePriceItem], PriceTable],
+    dataset_dir: Union[str, Path],
+    report_date: Optional[date] = None,
+    meta_id: Optional[str] = None,
+) -> int:
+    """
+    Append parsed results to a Parquet dataset partitioned by year.
+
+    A report is written to its own file named after its ``meta_id``, so
+    writing the same report again replaces it instead of duplicating rows.
+    Without a ``meta_id`` the file gets a unique name and is never replaced.
+    Returns the number of rows written.
+    """
+    pa = _import_pyarrow()
+    schema = _schema(pa)
+    columns = flatten_results(results, report_date=report_date, meta_id=meta_id)
+    table = pa.table([columns[field.name] for field in schema], schema=schema)
+    pa.dataset.write_dataset(
+        table,
+        str(dataset_dir),
+        format="parquet",
+        partitioning=_partitioning(pa, schema),
+        basename_template=(meta_id or "report-" + uuid.uuid4().hex) + "-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    print(f"Saved {table.num_rows} rows to dataset:", Path(dataset_dir).absolute())
+    return table.num_rows
+
+
+def open_dataset(dataset_dir: Union[str, Path]):
+    """
+    Open a Parquet dataset lazily.
+
+    Only the files and columns a query needs are read, e.g.::
+
+        open_dataset(path).to_table(
+            columns=["report_date", "price_low"],
+            filter=pyarrow.dataset.field("year") == 2022,
+        )
+    """
+    pa = _import_pyarrow()
+    schema = _schema(pa)
+    return pa.dataset.dataset(
+        str(dataset_dir),
+        format="parquet",
+        schema=schema,
+        partitioning=_partitioning(pa, schema),
+    )
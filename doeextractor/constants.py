@@ -1,5 +1,11 @@
 from enum import Enum
 
+# Defaults of `doeextractor watch`
+WATCH_INTERVAL = 5.0  # seconds between scans of the directory
+# A file is only picked up once it has not changed for this long, so that
+# reports still being copied into the directory are left alone
+SETTLE_SECONDS = 10.0
+
 
 class ExtractMethod(Enum):
     LATTICE = "--lattice"
@@ -10,3 +16,13 @@ class Formats(Enum):
     CSV = "CSV"
     JSON = "JSON"
     TSV = "TSV"
+
+
+class Backend(Enum):
+    TABULA = "tabula"
+    TEXTRACT = "textract"
+
+
+class AnalysisEngine(Enum):
+    DECIMAL = "decimal"
+    NUMPY = "numpy"
@@ -1,105 +1,456 @@
 import hashlib
+import io
+import json
+import re
 import sqlite3
-import tempfile
+import sys
+import threading
+import time
 from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
 
-from pdf2image import convert_from_path
-from PIL import Image
+from .instrumentation import count, count_cache, stage, timed
 
 DB_PATH = Path(__file__).parent.parent / "cache.db"
+OUTPUT_DIR = Path(__file__).parent.parent / "output"
+DEFAULT_DPI = 200
+MIN_DPI = 50
+# Textract limits for synchronous operations
+MAX_IMAGE_SIDE = 10000  # pixels
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+SQLITE_MAX_VARIABLES = 900
+# Eviction policy of cached Textract page responses
+PAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+PAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # seconds
+
+PPageSize = re.compile(r"([\d.]+) x ([\d.]+) pts")
 
 
 def get_checksum(file_path):
     """
-    Calculates the checksum of a file.
+    Calculates the checksum of a file, reading it in chunks.
     """
-    with open(file_path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+    md5 = hashlib.md5()
+    with stage("file_helpers.checksum") as counters, open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            md5.update(chunk)
+            counters["bytes_read"] += len(chunk)
+    return md5.hexdigest()
 
 
-def add_file_to_local_cache(file_path: Path, output_file_path: Path) -> str:
+def _settings_key(settings: dict) -> str:
+    return json.dumps(settings, sort_keys=True)
+
+
+class AnalysisCache:
     """
-    Add file to local cache.
+    Local cache of analyzed files, keyed by file checksum.
+
+    Keeps a single SQLite connection (in WAL mode) and remembers the
+    checksum of every file it has seen, so each file is hashed once
+    unless it changes on disk.
     """
-    checksum = get_checksum(file_path)
-    con = _get_or_create_cache()
-    with con:
-        cur = con.cursor()
-        cur.execute(
-            "INSERT OR IGNORE INTO cache VALUES (?, ?, ?)",
-            (checksum, str(file_path), str(output_file_path)),
-        )
-    return checksum
 
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._connection = None
+        self._checksums = {}  # (path, size, mtime) -> checksum
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            con = sqlite3.connect(self.db_path, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (checksum TEXT PRIMARY KEY, file_path TEXT, output_file_path TEXT)"
+                )
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS results (checksum TEXT, settings TEXT, file_path TEXT, output_file_path TEXT, blocks_file_path TEXT, PRIMARY KEY (checksum, settings))"
+                )
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS pages (page_hash TEXT PRIMARY KEY, response TEXT, size INTEGER, created_at REAL, last_used_at REAL)"
+                )
+            self._connection = con
+        return self._connection
+
+    def checksum(self, file_path) -> str:
+        """
+        Checksum of a file, computed once per version of the file.
+        """
+        file_path = Path(file_path).absolute()
+        stat = file_path.stat()
+        key = (str(file_path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._checksums:
+            self._checksums[key] = get_checksum(file_path)
+        return self._checksums[key]
+
+    def get(self, file_path) -> Optional[tuple]:
+        """
+        Cache entry of a file, or None if it was not analyzed yet.
+        """
+        with self._lock:
+            cur = self.connection.execute(
+                "SELECT * FROM cache WHERE checksum = ?", (self.checksum(file_path),)
+            )
+            entry = cur.fetchone()
+        count_cache("file_helpers.cache", entry is not None)
+        return entry
+
+    def add(self, file_path, output_file_path, replace=False) -> str:
+        """
+        Add file to cache. With ``replace``, an existing entry of the same
+        file points to the new output.
+        """
+        checksum = self.checksum(file_path)
+        with self._lock, self.connection as con:
+            con.execute(
+                "INSERT OR {} INTO cache VALUES (?, ?, ?)".format(
+                    "REPLACE" if replace else "IGNORE"
+                ),
+                (checksum, str(file_path), str(output_file_path)),
+            )
+        return checksum
+
+    def get_result(self, file_path, settings: dict) -> Optional[Tuple[Path, Path]]:
+        """
+        Output and raw blocks paths of a file extracted with ``settings``.
+
+        Entries whose files no longer exist are dropped and None is returned.
+        """
+        key = (self.checksum(file_path), _settings_key(settings))
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT output_file_path, blocks_file_path FROM results WHERE checksum = ? AND settings = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                count_cache("file_helpers.results_cache", False)
+                return None
+            output_file_path, blocks_file_path = Path(row[0]), Path(row[1])
+            if output_file_path.exists() and blocks_file_path.exists():
+                count_cache("file_helpers.results_cache", True)
+                return output_file_path, blocks_file_path
+            with self.connection as con:
+                con.execute(
+                    "DELETE FROM results WHERE checksum = ? AND settings = ?", key
+                )
+        count_cache("file_helpers.results_cache", False)
+        return None
+
+    def add_result(
+        self, file_path, settings: dict, output_file_path, blocks_file_path
+    ) -> str:
+        """
+        Add the result of extracting a file with ``settings`` to the cache.
+        """
+        checksum = self.checksum(file_path)
+        with self._lock, self.connection as con:
+            con.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    checksum,
+                    _settings_key(settings),
+                    str(file_path),
+                    str(output_file_path),
+                    str(blocks_file_path),
+                ),
+            )
+        return checksum
+
+    def get_page(self, page_hash: str) -> Optional[dict]:
+        """
+        Cached Textract response of a rendered page.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT response FROM pages WHERE page_hash = ?", (page_hash,)
+            ).fetchone()
+            count_cache("file_helpers.page_cache", row is not None)
+            if row is None:
+                return None
+            with self.connection as con:
+                con.execute(
+                    "UPDATE pages SET last_used_at = ? WHERE page_hash = ?",
+                    (time.time(), page_hash),
+                )
+        return json.loads(row[0])
+
+    def add_page(self, page_hash: str, response: dict):
+        """
+        Add the Textract response of a rendered page to the cache.
+        """
+        response = json.dumps(response)
+        now = time.time()
+        with self._lock, self.connection as con:
+            con.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (page_hash, response, len(response), now, now),
+            )
+
+    def evict_pages(
+        self, max_bytes=PAGE_CACHE_MAX_BYTES, max_age=PAGE_CACHE_MAX_AGE
+    ) -> int:
+        """
+        Drop page responses not used for ``max_age`` seconds, then the least
+        recently used ones until the page cache fits in ``max_bytes``.
 
-def _get_or_create_cache() -> sqlite3.Connection:
+        Returns the number of pages evicted.
+        """
+        evicted = 0
+        with self._lock, self.connection as con:
+            if max_age is not None:
+                evicted += con.execute(
+                    "DELETE FROM pages WHERE last_used_at < ?", (time.time() - max_age,)
+                ).rowcount
+            if max_bytes is not None:
+                evicted += con.execute(
+                    """
+                    DELETE FROM pages WHERE page_hash IN (
+                        SELECT page_hash FROM (
+                            SELECT page_hash, SUM(size) OVER (
+                                ORDER BY last_used_at DESC, page_hash
+                            ) AS total_size FROM pages
+                        ) WHERE total_size > ?
+                    )
+                    """,
+                    (max_bytes,),
+                ).rowcount
+        return evicted
+
+    def get_many(self, file_paths) -> Dict[Path, Optional[tuple]]:
+        """
+        Cache entries of several files, looked up with one query per
+        ``SQLITE_MAX_VARIABLES`` files.
+        """
+        checksums = {Path(path): self.checksum(path) for path in file_paths}
+        unique_checksums = list(set(checksums.values()))
+        entries = {}
+        with self._lock:
+            for start in range(0, len(unique_checksums), SQLITE_MAX_VARIABLES):
+                batch = unique_checksums[start : start + SQLITE_MAX_VARIABLES]
+                cur = self.connection.execute(
+                    "SELECT * FROM cache WHERE checksum IN ({})".format(
+                        ",".join("?" * len(batch))
+                    ),
+                    batch,
+                )
+                entries.update((row[0], row) for row in cur)
+        return {path: entries.get(checksum) for path, checksum in checksums.items()}
+
+    def get_directory(self, directory, pattern="*.pdf") -> Dict[Path, Optional[tuple]]:
+        """
+        Cache entries of every file in a directory matching ``pattern``.
+        """
+        return self.get_many(sorted(Path(directory).glob(pattern)))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_cache = None
+
+
+def get_cache() -> AnalysisCache:
     """
-    Get or create cache.
+    Get the analysis cache shared by this process.
+    """
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
+
+
+def set_cache(cache: AnalysisCache):
+    """
+    Set the analysis cache shared by this process.
+    """
+    global _cache
+    _cache = cache
+
+
+def add_file_to_local_cache(file_path: Path, output_file_path: Path) -> str:
+    """
+    Add file to local cache.
     """
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS cache (checksum TEXT PRIMARY KEY, file_path TEXT, output_file_path TEXT)"
-    )
-    return con
+    return get_cache().add(file_path, output_file_path)
 
 
 def is_file_already_analyzed(file_path):
     """
     Checks if a file is already analyzed.
     """
-    checksum = get_checksum(file_path)
-    with _get_or_create_cache() as con:
-        cur = con.cursor()
-        cur.execute("SELECT * FROM cache WHERE checksum = ?", (checksum,))
-        first_result = cur.fetchone()
-        return first_result is not None, first_result
+    first_result = get_cache().get(file_path)
+    return first_result is not None, first_result
 
 
-def convert_pdf_to_png(file_path, merge_pages=False) -> Path:
+def get_peak_memory_mb() -> Optional[float]:
     """
-    Convert a PDF file to PNG.
+    Peak resident memory of this process in megabytes, if available.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024  # bytes on macOS, kilobytes elsewhere
+    return round(peak / 1024, 1)
+
+
+def _merged_dpi(pdf_info: dict, dpi: int, max_side: int) -> int:
+    """
+    Highest DPI (up to ``dpi``) keeping the merged image within ``max_side`` pixels.
+    """
+    match = PPageSize.match(pdf_info.get("Page size", ""))
+    if not match:
+        return dpi
+    width, height = float(match.group(1)), float(match.group(2))
+    longest_side = max(width, height * pdf_info["Pages"])  # in points, 72 per inch
+    return max(1, min(dpi, int(max_side * 72 / longest_side)))
+
+
+def _render_merged(file_path: Path, page_count: int, dpi: int):
+    """
+    Render pages one at a time into a single pre-sized canvas.
+    """
+    from pdf2image import convert_from_path
+    from PIL import Image
+
+    canvas = None
+    page_height = 0
+    for page_number in range(1, page_count + 1):
+        page = convert_from_path(
+            file_path, dpi=dpi, first_page=page_number, last_page=page_number
+        )[0]
+        if canvas is None:
+            page_height = page.size[1]
+            canvas = Image.new(
+                "RGB", (page.size[0], page_height * page_count), color=(255, 255, 255)
+            )
+        canvas.paste(page, (0, (page_number - 1) * page_height))
+        page.close()
+    return canvas
+
+
+def render_cache_path(file_path: Path, dpi=DEFAULT_DPI, suffix="") -> Path:
+    """
+    Where renders of a PDF at ``dpi`` are kept under ``output/``. Keyed by
+    the file checksum, so another file with the same name, or the same file
+    at another DPI, is rendered again.
+    """
+    checksum = get_cache().checksum(file_path)
+    return OUTPUT_DIR / f"{file_path.stem}-{checksum}-{dpi}{suffix}"
+
+
+def render_merged_page(
+    file_path, dpi=DEFAULT_DPI, max_side=MAX_IMAGE_SIDE, max_bytes=MAX_IMAGE_BYTES
+) -> bytes:
+    """
+    Render all pages of a PDF into a single PNG, in memory.
+
+    The image is capped to ``max_side`` pixels and ``max_bytes`` (Textract's
+    limits) by lowering the DPI when needed.
+    """
+    from pdf2image import pdfinfo_from_path
+
+    pdf_info = pdfinfo_from_path(file_path)
+    dpi = _merged_dpi(pdf_info, dpi, max_side)
+    min_dpi = min(MIN_DPI, dpi)
+    while True:
+        with stage("file_helpers.render_merged") as counters:
+            merged_image = _render_merged(file_path, pdf_info["Pages"], dpi)
+            buffer = io.BytesIO()
+            merged_image.save(buffer, format="PNG")
+            merged_image.close()
+            size = buffer.tell()
+            counters.update(pages=pdf_info["Pages"], bytes_written=size)
+        if size <= max_bytes or dpi <= min_dpi:
+            return buffer.getvalue()
+        dpi = max(min_dpi, int(dpi * (max_bytes / size) ** 0.5 * 0.9))
+        print(f"Merged image is {size} bytes, retrying at {dpi} DPI")
+
+
+@timed("file_helpers.convert_pdf_to_png")
+def convert_pdf_to_png(
+    file_path,
+    merge_pages=False,
+    dpi=DEFAULT_DPI,
+    max_side=MAX_IMAGE_SIDE,
+    max_bytes=MAX_IMAGE_BYTES,
+) -> Path:
+    """
+    Convert a PDF file to PNG, kept under ``output/`` (see
+    ``render_cache_path``).
+
+    Merged images are capped like ``render_merged_page``.
     """
-    output_file_path = file_path
-    output_file_dir = file_path.parent
     if merge_pages:
-        output_file_path = (
-            Path(__file__).parent.parent / "output" / (file_path.stem + ".png")
-        )
+        output_file_path = render_cache_path(file_path, dpi, suffix=".png")
         if output_file_path.exists():
             print("Output file already exists.")
             return output_file_path.absolute()
-    else:
-        output_file_dir = Path(__file__).parent.parent / "output" / file_path.stem
-        has_files = False
-        try:
-            has_files = len(list(output_file_dir.iterdir())) > 0
-        except FileNotFoundError:
-            pass
-        if has_files:
-            print("Output directory already exists and is not empty.")
-            return output_file_dir.absolute()
-        else:
-            output_file_dir.mkdir(parents=True, exist_ok=True)
-
-    with tempfile.TemporaryDirectory() as path:
-        images_from_path = convert_from_path(file_path, output_folder=path)
-
-        if merge_pages:
-            new_width = images_from_path[0].size[0]
-            new_heigth = images_from_path[0].size[1] * len(images_from_path)
-            new_image = Image.new("RGB", (new_width, new_heigth), color=(255, 255, 255))
-            for i, image in enumerate(images_from_path):
-                new_image.paste(image, (0, i * image.size[1]))
-            # TODO make output directory a variable
-            output_dir = Path(__file__).parent.parent / "output"
-            new_image.save(output_file_path, format="PNG")
-            print("Saved to " + str(output_file_path))
-            return output_file_path.absolute()
-        else:
-            for i, image in enumerate(images_from_path):
-                new_image = Image.new("RGB", image.size, color=(255, 255, 255))
-                new_image.paste(image)
-                new_image.save(output_file_dir / (str(i) + ".png"), format="PNG")
-            print(f"Saved {len(images_from_path)} pages to {str(output_file_dir)}")
-            return output_file_dir.absolute()
+        output_file_path.parent.mkdir(parents=True, exist_ok=True)
+        output_file_path.write_bytes(
+            render_merged_page(file_path, dpi, max_side=max_side, max_bytes=max_bytes)
+        )
+        print("Saved to " + str(output_file_path))
+        return output_file_path.absolute()
+
+    output_file_dir = render_cache_path(file_path, dpi)
+    has_files = False
+    try:
+        has_files = len(list(output_file_dir.iterdir())) > 0
+    except FileNotFoundError:
+        pass
+    if has_files:
+        print("Output directory already exists and is not empty.")
+        return output_file_dir.absolute()
+    page_count = 0
+    for _ in iter_pdf_pages(file_path, dpi=dpi, cache_dir=output_file_dir):
+        page_count += 1
+    print(f"Saved {page_count} pages to {str(output_file_dir)}")
+    return output_file_dir.absolute()
+
+
+def iter_pdf_pages(
+    file_path: Path, dpi=DEFAULT_DPI, cache_dir: Optional[Path] = None
+) -> Iterator[bytes]:
+    """
+    Render a PDF one page at a time, yielding each page as PNG bytes.
+
+    Each page is encoded once in memory and dropped before the next one is
+    rendered. When ``cache_dir`` is given, pages are also saved there as
+    ``0.png``, ``1.png``, ... and reused on the next run.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    page_count = pdfinfo_from_path(file_path)["Pages"]
+    for page_number in range(1, page_count + 1):
+        cached_page = cache_dir / f"{page_number - 1}.png" if cache_dir else None
+        if cached_page is not None and cached_page.exists():
+            contents = cached_page.read_bytes()
+            count("file_helpers.render_page", cache_hits=1, bytes_read=len(contents))
+            yield contents
+            continue
+        with stage("file_helpers.render_page") as counters:
+            image = convert_from_path(
+                file_path, dpi=dpi, first_page=page_number, last_page=page_number
+            )[0]
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            image.close()
+            contents = buffer.getvalue()
+            if cached_page is not None:
+                cached_page.write_bytes(contents)
+            counters.update(pages=1, cache_misses=1, bytes_written=len(contents))
+        yield contents
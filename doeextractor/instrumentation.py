@@ -0,0 +1,188 @@
+"""
+Lightweight timing and counters for the stages of a run.
+
+Stages are named ``<module>.<stage>``. Each records its number of calls and
+wall time, plus any counters such as ``bytes_read``, ``pages``, ``tokens``,
+``rows``, ``cache_hits`` and ``cache_misses``::
+
+    with stage("parser.parse") as counters:
+        ...
+        counters["rows"] += len(results)
+
+Recording is always on and costs a few microseconds per stage, so stages
+wrap whole files or pages, never single tokens.
+"""
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+PROFILE_TOP_FUNCTIONS = 25
+
+
+class Recorder:
+    """
+    Stage statistics of a run. Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, calls=0, seconds=0.0, **counters):
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = Counter(calls=0, seconds=0.0)
+            stats["calls"] += calls
+            stats["seconds"] += seconds
+            stats.update(counters)
+
+    def merge(self, report: dict):
+        """
+        Add the stages of a report from another recorder, e.g. one that ran
+        in a worker process.
+        """
+        for name, stats in report["stages"].items():
+            self.add(name, **stats)
+
+    def report(self) -> dict:
+        with self._lock:
+            stages = {
+                name: {
+                    key: round(value, 6) if key == "seconds" else value
+                    for key, value in stats.items()
+                }
+                for name, stats in self._stages.items()
+            }
+        return {
+            "started_at": self.started_at.isoformat(),
+            "seconds": round(time.perf_counter() - self._started, 6),
+            "stages": stages,
+        }
+
+
+# Per thread or task, so reports recorded side by side do not mix. Threads
+# of an executor start from the default unless run in ``copy_context()``
+_recorder = ContextVar("recorder", default=Recorder())
+
+
+def get_recorder() -> Recorder:
+    """
+    Get the recorder of the current run.
+    """
+    return _recorder.get()
+
+
+@contextmanager
+def recording() -> Iterator[Recorder]:
+    """
+    Record into a new recorder until the block ends.
+    """
+    recorder = Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Counter]:
+    """
+    Time a stage. Counters set on the yielded ``Counter`` are added to the
+    stage when it ends, even if it fails.
+    """
+    counters = Counter()
+    start = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        get_recorder().add(
+            name, calls=1, seconds=time.perf_counter() - start, **counters
+        )
+
+
+def timed(name: str):
+    """
+    Decorator that records every call of a function as a stage.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def counted(items: Iterable, counters: Counter, key: str) -> Iterator:
+    """
+    Pass items through, counting them in ``counters[key]``.
+    """
+    for item in items:
+        counters[key] += 1
+        yield item
+
+
+def count(name: str, **counters):
+    """
+    Add counters to a stage without timing it.
+    """
+    get_recorder().add(name, **counters)
+
+
+def count_cache(name: str, hit: bool):
+    """
+    Count a cache hit or miss of a stage.
+    """
+    get_recorder().add(name, cache_hits=int(hit), cache_misses=int(not hit))
+
+
+def save_report(
+    output_file_path: Union[str, Path], recorder: Optional[Recorder] = None
+):
+    """
+    Save the run report as JSON.
+    """
+    report = (recorder or get_recorder()).report()
+    full_output_path = Path(output_file_path).absolute()
+    with open(full_output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Run report saved to:", full_output_path)
+    return report
+
+
+@contextmanager
+def profile(output_file_path: Optional[Union[str, Path]] = None):
+    """
+    Run the block under cProfile. Prints the functions with the highest
+    cumulative time and saves the raw stats to ``output_file_path``.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream).sort_stats("cumulative")
+        stats.print_stats(PROFILE_TOP_FUNCTIONS)
+        print(stream.getvalue())
+        if output_file_path:
+            stats.dump_stats(str(output_file_path))
+            print("Profile saved to:", Path(output_file_path).absolute())
@@ -1 +1,2 @@
 from .fuel_line_price import FuelLinePriceItem, FuelPrice
+from .price_table import PriceTable, dump_response
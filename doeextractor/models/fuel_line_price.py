@@ -11,6 +11,12 @@ class FuelPrice:
     company: str
     price: Any
 
+    def to_dict(self) -> dict:
+        """
+        Same as ``dataclasses.asdict``, without its recursive deep copy.
+        """
+        return {"company": self.company, "price": self.price}
+
 
 @dataclass
 class FuelLinePriceItem:
@@ -24,3 +30,21 @@ class FuelLinePriceItem:
     overall_range: str = ""
     common_price: str = ""
     average_price: str = ""
+
+    def to_dict(self) -> dict:
+        """
+        Same as ``dataclasses.asdict``, without its recursive deep copy.
+        """
+        return {
+            "municity": self.municity,
+            "product": self.product,
+            "prices": [
+                fuel_price.to_dict()
+                if isinstance(fuel_price, FuelPrice)
+                else fuel_price
+                for fuel_price in self.prices
+            ],
+            "overall_range": self.overall_range,
+            "common_price": self.common_price,
+            "average_price": self.average_price,
+        }
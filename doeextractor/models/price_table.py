@@ -0,0 +1,205 @@
+import json
+import sys
+from array import array
+from typing import Iterable, Iterator, List, Tuple
+
+from ..prices import parse_price
+from .fuel_line_price import FuelLinePriceItem
+
+NAN = float("nan")
+ROW_FIELDS = ("municity", "product", "overall_range", "common_price", "average_price")
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _price_range(price) -> Tuple[float, float]:
+    """
+    Lowest and highest value of a price cell, NaN when it is not a price.
+    """
+    price_range = parse_price(price)
+    if not price_range:
+        return NAN, NAN
+    return price_range.low, price_range.high
+
+
+class PriceTable:
+    """
+    Compact, column-oriented table of parsed prices.
+
+    Rows keep their text fields in lists of interned strings. Price cells
+    are stored in flat columns, with the prices of row ``i`` at
+    ``row_offsets[i]:row_offsets[i + 1]``, and every price is parsed once
+    into ``price_low`` and ``price_high`` floats (NaN when not a number).
+    The raw price texts are kept, so the table converts back to the JSON
+    shape of the results without loss.
+    """
+
+    __slots__ = ROW_FIELDS + (
+        "row_offsets",
+        "company",
+        "price",
+        "price_low",
+        "price_high",
+        "_ranges",
+    )
+
+    def __init__(self):
+        for name in ROW_FIELDS:
+            setattr(self, name, [])
+        self.row_offsets = array("L", [0])
+        self.company = []
+        self.price = []
+        self.price_low = array("d")
+        self.price_high = array("d")
+        self._ranges = {}  # Price cells repeat a lot across rows
+
+    def append(
+        self,
+        municity: str,
+        product: str = "",
+        prices: Iterable[Tuple[str, str]] = (),
+        overall_range: str = "",
+        common_price: str = "",
+        average_price: str = "",
+    ):
+        """
+        Add a row, with its prices as ``(company, price)`` pairs.
+        """
+        self.municity.append(_intern(municity))
+        self.product.append(_intern(product))
+        self.overall_range.append(_intern(overall_range))
+        self.common_price.append(_intern(common_price))
+        self.average_price.append(_intern(average_price))
+        for company, price in prices:
+            price = _intern(price)
+            price_range = self._ranges.get(price)
+            if price_range is None:
+                price_range = self._ranges[price] = _price_range(price)
+            self.company.append(_intern(company))
+            self.price.append(price)
+            self.price_low.append(price_range[0])
+            self.price_high.append(price_range[1])
+        self.row_offsets.append(len(self.company))
+
+    def append_item(self, item: FuelLinePriceItem):
+        self.append(
+            item.municity,
+            item.product,
+            ((fuel_price.company, fuel_price.price) for fuel_price in item.prices),
+            item.overall_range,
+            item.common_price,
+            item.average_price,
+        )
+
+    def append_dict(self, item: dict):
+        self.append(
+            item["municity"],
+            item.get("product", ""),
+            (
+                (fuel_price["company"], fuel_price["price"])
+                for fuel_price in item.get("prices", [])
+            ),
+            item.get("overall_range", ""),
+            item.get("common_price", ""),
+            item.get("average_price", ""),
+        )
+
+    @classmethod
+    def from_items(cls, items: Iterable[FuelLinePriceItem]) -> "PriceTable":
+        table = cls()
+        for item in items:
+            table.append_item(item)
+        return table
+
+    @classmethod
+    def from_dicts(cls, results: Iterable[dict]) -> "PriceTable":
+        table = cls()
+        for item in results:
+            table.append_dict(item)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.municity)
+
+    def iter_prices(self) -> Iterator[tuple]:
+        """
+        ``(company, product, municity, price, price_low, price_high)`` of
+        every price cell.
+        """
+        offsets = self.row_offsets
+        for row_idx, (municity, product) in enumerate(zip(self.municity, self.product)):
+            for price_idx in range(offsets[row_idx], offsets[row_idx + 1]):
+                yield (
+                    self.company[price_idx],
+                    product,
+                    municity,
+                    self.price[price_idx],
+                    self.price_low[price_idx],
+                    self.price_high[price_idx],
+                )
+
+    def iter_dicts(self) -> Iterator[dict]:
+        """
+        The rows in the JSON shape of the results, one at a time.
+        """
+        offsets = self.row_offsets
+        for row_idx, (
+            municity,
+            product,
+            overall_range,
+            common_price,
+            average_price,
+        ) in enumerate(
+            zip(
+                self.municity,
+                self.product,
+                self.overall_range,
+                self.common_price,
+                self.average_price,
+            )
+        ):
+            yield {
+                "municity": municity,
+                "product": product,
+                "prices": [
+                    {"company": self.company[price_idx], "price": self.price[price_idx]}
+                    for price_idx in range(offsets[row_idx], offsets[row_idx + 1])
+                ],
+                "overall_range": overall_range,
+                "common_price": common_price,
+                "average_price": average_price,
+            }
+
+    def to_dicts(self) -> List[dict]:
+        """
+        The rows in the JSON shape of the results, for serialization.
+        """
+        return list(self.iter_dicts())
+
+
+def dump_response(response: dict, f):
+    """
+    Write a parsed response as JSON, same as ``json.dump(response, f,
+    indent=2)``. When its ``results`` are a ``PriceTable``, rows are
+    converted and written one at a time instead of all at once.
+    """
+    results = response.get("results")
+    if not isinstance(results, PriceTable):
+        json.dump(response, f, indent=2)
+        return
+    f.write("{")
+    for key_idx, (key, value) in enumerate(response.items()):
+        f.write(("," if key_idx else "") + "\n  " + json.dumps(key) + ": ")
+        if value is not results:
+            f.write(json.dumps(value, indent=2).replace("\n", "\n  "))
+        elif not len(results):
+            f.write("[]")
+        else:
+            f.write("[")
+            for row_idx, row in enumerate(results.iter_dicts()):
+                row_json = json.dumps(row, indent=2).replace("\n", "\n    ")
+                f.write(("," if row_idx else "") + "\n    " + row_json)
+            f.write("\n  ]")
+    f.write("\n}")
@@ -1,18 +1,20 @@
-import dataclasses
+import codecs
 import hashlib
+import io
 import json
 import logging
+import re
 from datetime import datetime
 from pathlib import Path
 from pprint import PrettyPrinter
 
 pp = PrettyPrinter(indent=2)
 
-from doeextractor.models import FuelLinePriceItem, FuelPrice
+from doeextractor import columnar
+from doeextractor.instrumentation import counted, stage
+from doeextractor.models import FuelLinePriceItem, FuelPrice, PriceTable, dump_response
 
 from .token_types import (
-    FEATURES,
-    TOKEN_TYPES,
     TYPE_BRAND,
     TYPE_CITY,
     TYPE_HEADER,
@@ -20,10 +22,16 @@ from .token_types import (
     TYPE_PRICE,
     TYPE_PRODUCT_TYPE,
     UNCATEGORIZED,
+    classify_token,
 )
 
 logger = logging.getLogger(__name__)
 
+READ_CHUNK_SIZE = 64 * 1024
+HEADER_SIZE = 20  # Tokens searched for the header. TODO: Make it configurable
+# A JSON string, followed by ":" when it is an object key
+PJsonString = re.compile(r'"((?:[^"\\]|\\.)*)"(\s*:)?')
+
 
 logger.setLevel(logging.DEBUG)
 handler = logging.FileHandler("log_file.log")
@@ -48,15 +56,16 @@ class Token:
         return self.token_type == "header" and self.value.lower() == "overall range"
 
 
-def _clean(text_entries: list):
+def _clean(text_entries):
     """
     Clean text entries.
-    """
-    to_split = []  # [(start_index, text1), (start_index+1, text2)]
 
-    # Normalize entries
-    for idx, text_entry in enumerate(text_entries):
+    Works on any iterable and yields entries as they are cleaned.
+    """
+    for text_entry in text_entries:
+        # Normalize entries
         text_entry = text_entry.lower().strip()
+        to_split = None
         if "no branch" in text_entry or text_entry == "outlet":
             text_entry = "no branch/outlet"
         elif text_entry == "overall":
@@ -67,36 +76,27 @@ def _clean(text_entries: list):
             text_entry = "average price"
         elif text_entry == "noneron 95":
             text_entry = "none"
-            to_split.append((idx + 1, "ron 95"))
+            to_split = "ron 95"
         elif text_entry == "-none":
             text_entry = "none"
-        text_entries[idx] = text_entry  # write back modifications
-
-    # Insert entries needed
-    for idx, text_entry in to_split:
-        text_entries.insert(idx, text_entry)
-
-    yield from text_entries
+        yield text_entry
+        # Insert entries needed
+        if to_split:
+            yield to_split
 
 
 def classify(text):
     """
-    Classify text simplified for DOE reports
+    Classify text simplified for DOE reports, already normalized by ``_clean``
     """
-    # Prefer simpler cases early
-    text = text.lower().strip()
-    token_type = TOKEN_TYPES.get("default")
-    for feature, feature_func in FEATURES.items():
-        if feature_func(text):
-            token_type = TOKEN_TYPES[feature]
-            break
+    token_type = classify_token(text)
     if token_type == UNCATEGORIZED:
         logger.debug("Uncategorized token: %s", text)
         print("Uncategorized token:", text)
     return token_type
 
 
-def tokenize(text_data: list):
+def tokenize(text_data):
     cleaned_text = _clean(text_data)
     while True:
         try:
@@ -107,6 +107,59 @@ def tokenize(text_data: list):
             yield Token(text, classify(text))
 
 
+def iter_tabula_texts(input_file, hasher=None):
+    """
+    Stream the text of every table cell of a Tabula JSON output.
+
+    ``input_file`` is a path or a binary file object, e.g. an ``io.BytesIO``
+    over an output captured from Tabula. It is read in chunks and only the
+    ``text`` values are decoded; the cell geometry is skipped. When given,
+    ``hasher`` is updated with the raw bytes in the same pass.
+    """
+    if isinstance(input_file, (str, Path)):
+        with open(input_file, "rb") as f:
+            yield from iter_tabula_texts(f, hasher=hasher)
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    is_text_value = False
+    while True:
+        chunk = input_file.read(READ_CHUNK_SIZE)
+        if hasher is not None:
+            hasher.update(chunk)
+        buffer += decoder.decode(chunk, final=not chunk)
+        # Until the end of the file, only whole strings are taken and a key
+        # needs its ":" to be known
+        complete_end = len(buffer.rstrip()) if chunk else len(buffer) + 1
+        position = 0
+        for match in PJsonString.finditer(buffer):
+            if match.end() >= complete_end and not match.group(2):
+                break
+            position = match.end()
+            value = match.group(1)
+            if match.group(2):  # object key
+                is_text_value = value == "text"
+                continue
+            if is_text_value:
+                yield json.loads(f'"{value}"') if "\\" in value else value
+                is_text_value = False
+        buffer = buffer[position:]
+        if not chunk:
+            break
+
+
+def iter_page_texts(pages):
+    """
+    Text of every table cell of a Tabula JSON output already loaded as
+    Python objects.
+    """
+    for page in pages:
+        for data in page.get("data", []):
+            for entry in data:
+                yield entry["text"]
+
+
 def _get_hash(data):
     """
     Get hash of input file.
@@ -116,122 +169,275 @@ def _get_hash(data):
     return m.hexdigest()
 
 
-def _build_data(tokens) -> list:
-    # TODO: Something wrong with the input data especially when report includes "NO BRANCH/OUTLET"
-    data = []
-
-    # 1. Identify from header row the sequence of fuel providers (oil company)
-    # Typical sequence of the header:
-    # [Area, Product, Company 1, ..., Company N, Overall Range, Common Price, Average Price]
-    header_slice = tokens[:20]  # TODO: Make it configurable
-    fuel_provider_sequence_start = None
-    fuel_provider_sequence_end = None
-    first_fuel_provider_is_found = False
-    for idx, token in enumerate(header_slice):
-        if not first_fuel_provider_is_found:
-            if token.token_type == "brand":
-                fuel_provider_sequence_start = idx
-                first_fuel_provider_is_found = True
-        elif token.is_overall_range_header():
-            fuel_provider_sequence_end = idx
-            break
-    if fuel_provider_sequence_start is None or fuel_provider_sequence_end is None:
-        raise Exception("Could not identify fuel provider sequence")
-    header_end = fuel_provider_sequence_end + 3
-
-    fuel_provider_sequence = header_slice[
-        fuel_provider_sequence_start:fuel_provider_sequence_end
-    ]
-    full_header = tokens[0:header_end]
-    # 2. Start complete sequence
-    current_line_price_item = None
-    adding_prices = False
-    iter_fuel_provider_and_prices_sequence = iter(
-        header_slice[fuel_provider_sequence_start : fuel_provider_sequence_end + 3]
-    )  # Additional headers are "Overall, common, and average"
-    current_city = None
-    for idx, token in enumerate(tokens):
+class FuelLinePriceBuilder:
+    """
+    Builds fuel line price items from tokens fed one at a time.
+
+    The header is worked out once from the first ``header_size`` tokens;
+    after that every token is handled as it comes and each item is returned
+    as soon as its row is complete.
+    """
+
+    def __init__(self, header_size=HEADER_SIZE):
+        self.header_size = header_size
+        self._header_tokens = []
+        # Typical sequence of the header:
+        # [Area, Product, Company 1, ..., Company N, Overall Range, Common Price, Average Price]
+        self._price_headers = None
+        self._price_header_iter = None
+        self._current_city = None
+        self._current_line_price_item = None
+        self._adding_prices = False
+
+    def feed(self, token) -> list:
+        """
+        Handle a token. Returns the items completed by it.
+        """
+        if self._price_headers is not None:
+            return self._handle(token)
+        self._header_tokens.append(token)
+        if len(self._header_tokens) < self.header_size:
+            return []
+        return self._start()
+
+    def close(self) -> list:
+        """
+        Handle the remaining tokens when there are fewer than ``header_size``.
+        """
+        if self._price_headers is not None:
+            return []
+        return self._start()
+
+    def _start(self) -> list:
+        # TODO: Something wrong with the input data especially when report includes "NO BRANCH/OUTLET"
+        # 1. Identify from header row the sequence of fuel providers (oil company)
+        fuel_provider_sequence_start = None
+        fuel_provider_sequence_end = None
+        for idx, token in enumerate(self._header_tokens):
+            if fuel_provider_sequence_start is None:
+                if token.token_type == "brand":
+                    fuel_provider_sequence_start = idx
+            elif token.is_overall_range_header():
+                fuel_provider_sequence_end = idx
+                break
+        if fuel_provider_sequence_start is None or fuel_provider_sequence_end is None:
+            raise Exception("Could not identify fuel provider sequence")
+        # Additional headers are "Overall, common, and average"
+        self._price_headers = self._header_tokens[
+            fuel_provider_sequence_start : fuel_provider_sequence_end + 3
+        ]
+        self._price_header_iter = iter(self._price_headers)
+
+        # 2. Start complete sequence
+        tokens, self._header_tokens = self._header_tokens, []
+        items = []
+        for token in tokens:
+            items.extend(self._handle(token))
+        return items
+
+    def _handle(self, token) -> list:
         if token.token_type == TYPE_HEADER:
-            continue
+            return []
         if token.token_type == TYPE_CITY:
             # 3. Start populating an entry
-            current_city = token.value
+            self._current_city = token.value
             # TODO Check if completed line item before creating a new one?
 
         if token.token_type == TYPE_PRODUCT_TYPE:
-            current_line_price_item = FuelLinePriceItem(
-                municity=current_city,
+            self._current_line_price_item = FuelLinePriceItem(
+                municity=self._current_city,
                 product=token.value,
             )
-            adding_prices = True
+            self._adding_prices = True
         # 4. Adding prices
-        if adding_prices:
-            if token.token_type in [TYPE_NONE_TYPE, TYPE_PRICE]:
-                # Get which brand/header
-                try:
-                    fuel_provider = next(iter_fuel_provider_and_prices_sequence)
-                except StopIteration:
-                    adding_prices = False
-                    data.append(dataclasses.asdict(current_line_price_item))
-                    iter_fuel_provider_and_prices_sequence = iter(
-                        header_slice[
-                            fuel_provider_sequence_start : fuel_provider_sequence_end
-                            + 3
-                        ]
-                    )
-                else:
-                    if fuel_provider.token_type == TYPE_BRAND:
-                        current_line_price_item.prices.append(
-                            FuelPrice(company=fuel_provider.value, price=token.value)
-                        )
-                    elif fuel_provider.value == "overall range":
-                        current_line_price_item.overall_range = token.value
-                    elif fuel_provider.value == "common price":
-                        current_line_price_item.common_price = token.value
-                    elif fuel_provider.value == "average price":
-                        current_line_price_item.average_price = token.value
-    return data
-
-
-def parse(input_file_path: str, output_file_path: str = None):
+        if not self._adding_prices or token.token_type not in (
+            TYPE_NONE_TYPE,
+            TYPE_PRICE,
+        ):
+            return []
+        # Get which brand/header
+        fuel_provider = next(self._price_header_iter, None)
+        if fuel_provider is None:
+            self._adding_prices = False
+            self._price_header_iter = iter(self._price_headers)
+            return [self._current_line_price_item]
+        line_price_item = self._current_line_price_item
+        if fuel_provider.token_type == TYPE_BRAND:
+            line_price_item.prices.append(
+                FuelPrice(company=fuel_provider.value, price=token.value)
+            )
+        elif fuel_provider.value == "overall range":
+            line_price_item.overall_range = token.value
+        elif fuel_provider.value == "common price":
+            line_price_item.common_price = token.value
+        elif fuel_provider.value == "average price":
+            line_price_item.average_price = token.value
+        return []
+
+
+def iter_line_price_items(tokens):
+    """
+    Yield fuel line price items as soon as their rows are complete.
+    """
+    builder = FuelLinePriceBuilder()
+    for token in tokens:
+        yield from builder.feed(token)
+    yield from builder.close()
+
+
+def _build_data(tokens) -> list:
+    return [item.to_dict() for item in iter_line_price_items(tokens)]
+
+
+def build_table(tokens) -> PriceTable:
+    """
+    Build the line price items of a token stream into a compact table.
+    """
+    return PriceTable.from_items(iter_line_price_items(tokens))
+
+
+def parse(
+    input_file_path: str,
+    output_file_path: str = None,
+    stream=False,
+    dataset_dir: str = None,
+):
     """
     Simple parser for extracted tables.
+
+    With ``stream``, the input is read incrementally: cell texts are
+    tokenized as they are read and the input is hashed in the same pass.
+    With ``dataset_dir``, the prices are also appended to a columnar
+    dataset (see ``columnar.write_dataset``).
     """
     # Metadata
     metadata = {
         "query_datetime": datetime.now().isoformat(),
     }
 
-    try:
-        file_contents = Path(input_file_path).read_bytes()
-        raw_data = json.loads(file_contents)
-    except json.JSONDecodeError:
-        raise Exception("Input file is not a valid JSON file")
-    except Exception as e:
-        raise Exception(f"Error parsing input file: {e}")
-    meta_hash = _get_hash(file_contents)
-    metadata["meta_id"] = meta_hash
-    # TODO Ask interactively to continue parse if there exists the same hash as input file
-
-    all_text = []
-    for page in raw_data:
-        for data in page.get("data", []):
-            for entry in data:
-                # if entry.get("text"):  # NOTE Maybe the blank texts are important?
-                all_text.append(entry["text"].lower())
-
-    tokens = list(tokenize(all_text))
-    results = _build_data(tokens)
+    with stage("parser.parse") as counters:
+        counters["bytes_read"] += Path(input_file_path).stat().st_size
+        if stream:
+            hasher = hashlib.sha256()
+            tokens = tokenize(iter_tabula_texts(input_file_path, hasher=hasher))
+            results = _build_data(counted(tokens, counters, "tokens"))
+            metadata["meta_id"] = hasher.hexdigest()
+        else:
+            try:
+                file_contents = Path(input_file_path).read_bytes()
+                raw_data = json.loads(file_contents)
+            except json.JSONDecodeError:
+                raise Exception("Input file is not a valid JSON file")
+            except Exception as e:
+                raise Exception(f"Error parsing input file: {e}")
+            meta_hash = _get_hash(file_contents)
+            metadata["meta_id"] = meta_hash
+            # TODO Ask interactively to continue parse if there exists the same hash as input file
+
+            tokens = tokenize(iter_page_texts(raw_data))
+            results = _build_data(counted(tokens, counters, "tokens"))
+        counters["rows"] += len(results)
+
+    return _respond(
+        metadata,
+        results,
+        output_file_path,
+        dataset_dir,
+        report_date=columnar.report_date_from_path(input_file_path),
+    )
+
+
+def parse_output(
+    output: bytes,
+    output_file_path: str = None,
+    dataset_dir: str = None,
+    report_date=None,
+    as_table=False,
+):
+    """
+    Parse a raw Tabula JSON output captured in memory, e.g. from
+    ``tabula.extract_output``, without intermediate files.
+
+    The output is streamed like ``parse(..., stream=True)``: cell texts are
+    tokenized as they are read and hashed in the same pass, so only the raw
+    bytes are held and not the whole output as Python objects. With
+    ``as_table``, the results are built into a compact ``PriceTable``
+    instead of a list of dicts. The response is returned and only written
+    when ``output_file_path`` is given.
+    """
+    metadata = {
+        "query_datetime": datetime.now().isoformat(),
+    }
+    with stage("parser.parse") as counters:
+        counters["bytes_read"] += len(output)
+        hasher = hashlib.sha256()
+        tokens = tokenize(iter_tabula_texts(io.BytesIO(output), hasher=hasher))
+        build = build_table if as_table else _build_data
+        results = build(counted(tokens, counters, "tokens"))
+        metadata["meta_id"] = hasher.hexdigest()
+        counters["rows"] += len(results)
+    return _respond(
+        metadata,
+        results,
+        output_file_path,
+        dataset_dir,
+        report_date=report_date,
+        echo=False,
+    )
+
+
+def parse_tables(
+    pages: list,
+    output_file_path: str = None,
+    meta_id: str = None,
+    dataset_dir: str = None,
+    report_date=None,
+):
+    """
+    Parse a Tabula JSON output already loaded as Python objects, e.g. from
+    ``tabula.extract_tables``, without intermediate files.
 
+    ``meta_id`` should be the hash of the raw Tabula output; it is only
+    worked out from ``pages`` when not given. The response is returned and
+    only written when ``output_file_path`` is given.
+    """
+    metadata = {
+        "query_datetime": datetime.now().isoformat(),
+        "meta_id": meta_id or _get_hash(json.dumps(pages).encode("utf-8")),
+    }
+    with stage("parser.parse") as counters:
+        tokens = tokenize(iter_page_texts(pages))
+        results = _build_data(counted(tokens, counters, "tokens"))
+        counters["rows"] += len(results)
+    return _respond(
+        metadata,
+        results,
+        output_file_path,
+        dataset_dir,
+        report_date=report_date,
+        echo=False,
+    )
+
+
+def _respond(
+    metadata, results, output_file_path, dataset_dir, report_date=None, echo=True
+):
     response = {
         "metadata": metadata,
         "results": results,
     }
-    if not output_file_path:
-        pp.pprint(response)
-    else:
+    if output_file_path:
         full_output_path = str(Path(output_file_path).absolute())
-        with open(full_output_path, "w") as f:
-            json.dump(response, f, indent=2)
+        with stage("parser.write_output"), open(full_output_path, "w") as f:
+            dump_response(response, f)
             print("Output file saved to:", full_output_path)
+    elif echo:
+        pp.pprint(response)
+    if dataset_dir:
+        columnar.write_dataset(
+            results,
+            dataset_dir,
+            report_date=report_date,
+            meta_id=metadata["meta_id"],
+        )
     return response
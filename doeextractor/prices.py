@@ -0,0 +1,76 @@
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple, Tuple, Union
+
+NAN = float("nan")
+PPriceRange = re.compile(r"(\d+\.\d+)(\s*\-\s*|\s)(\d+\.\d+)")
+# Plain decimal numbers only: float() also takes "nan", "inf", "1e3" or "1_000"
+PNumber = re.compile(r"[0-9]+(?:\.[0-9]+)?")
+
+
+class PriceRange(NamedTuple):
+    """
+    A parsed price cell. ``values`` are all the numbers of the cell, in
+    order, e.g. (81.6, 81.6, 82.4, 82.4) for a merged cell.
+    """
+
+    low: float
+    high: float
+    values: Tuple[float, ...]
+
+
+class _NoPrice:
+    """
+    Sentinel of a cell that is not a price, e.g. "n.a" or "none".
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "NO_PRICE"
+
+    @property
+    def values(self):
+        return ()
+
+
+NO_PRICE = _NoPrice()
+
+
+@lru_cache(maxsize=65536)
+def parse_price(text) -> Union[PriceRange, _NoPrice]:
+    """
+    Parse a price cell once.
+
+    A cell is a price when it only holds plain decimal numbers separated by
+    spaces or dashes, e.g. "78.19", "78.19 80.95" or "78.50 - 78.50". A
+    cell that starts like a range but is garbled, e.g. "80.10 - 81.1081.10",
+    is still a price, with no values. Anything else is ``NO_PRICE``. Results are
+    memoized since price cells repeat a lot in DOE reports.
+    """
+    if not isinstance(text, str):
+        return NO_PRICE
+    parts = text.replace("-", " ").split()
+    if parts and all(PNumber.fullmatch(part) for part in parts):
+        values = tuple(map(float, parts))
+        return PriceRange(min(values), max(values), values)
+    if PPriceRange.match(text):
+        return PriceRange(NAN, NAN, ())
+    return NO_PRICE
+
+
+@lru_cache(maxsize=65536)
+def price_values(text, convert=Decimal) -> tuple:
+    """
+    Distinct values of a price cell as ``convert`` (``Decimal`` or
+    ``float``), or an empty tuple when the cell is not a price.
+    """
+    values = dict.fromkeys(parse_price(text).values)
+    if convert is float:
+        return tuple(values)
+    # The shortest repr of a float reads back as the decimal that was parsed
+    return tuple(convert(repr(value)) for value in values)
@@ -1,5 +1,9 @@
+import hashlib
+import json
 import os
 import subprocess
+import threading
+from functools import lru_cache
 from logging import getLogger
 from pathlib import Path
 from typing import Optional
@@ -8,19 +12,26 @@ from dotenv import load_dotenv
 
 from .constants import ExtractMethod, Formats
 from .exceptions import NotFoundException
+from .instrumentation import timed
 
-load_dotenv()
 logger = getLogger(__name__)
 
 
-TABULA_JAR_PATH = os.getenv("TABULA_JAR_PATH", None)
-if TABULA_JAR_PATH is None:
-    raise Exception("TABULA_JAR_PATH is not set")
-if not os.path.exists(TABULA_JAR_PATH):
-    raise Exception("Tabula jar file does not exist")
+@lru_cache(maxsize=None)
+def get_tabula_jar_path() -> str:
+    """
+    Path to the Tabula jar, read from the environment (or .env) on first use.
+    """
+    load_dotenv()
+    tabula_jar_path = os.getenv("TABULA_JAR_PATH", None)
+    if tabula_jar_path is None:
+        raise Exception("TABULA_JAR_PATH is not set")
+    if not os.path.exists(tabula_jar_path):
+        raise Exception("Tabula jar file does not exist")
+    return tabula_jar_path
 
 
-def _tabula(
+def _tabula_arguments(
     input_file_path=None,
     batch_directory=None,
     columns=None,
@@ -34,27 +45,24 @@ def _tabula(
     output_file_path=None,  # If None, output to stdout
 ):
     """
-    Run tabula
+    Build tabula command line arguments (without the java command)
     """
-    # Command looks like:
-    # java -jar tabula-1.0.5-jar-with-dependencies.jar -l -f JSON --pages all reports/2022-05-18/petro_min_2022-may-10.pdf -o output.json
-    command = ["java", "-jar", TABULA_JAR_PATH]
-    command.append(extract_method.value)
+    arguments = [extract_method.value]
     output_format = (
         output_format if isinstance(output_format, str) else output_format.value
     )
-    command.extend(["-f", output_format])
+    arguments.extend(["-f", output_format])
     if area:
-        command.extend(["--area", area])
+        arguments.extend(["--area", area])
     if guess:
-        command.append("--guess")
+        arguments.append("--guess")
     if columns:
-        command.extend(["--columns", columns])
-    command.extend(["--pages", pages])
+        arguments.extend(["--columns", columns])
+    arguments.extend(["--pages", pages])
     if password:
-        command.extend(["--password", password])
+        arguments.extend(["--password", password])
     if use_line_returns:
-        command.append("--use-line-returns")
+        arguments.append("--use-line-returns")
 
     # Must be on the last part
     if batch_directory and input_file_path:
@@ -62,11 +70,23 @@ def _tabula(
     if batch_directory is None and input_file_path is None:
         raise TypeError("Must specify either batch_directory or input_file_path")
     if batch_directory:
-        command.extend(["--batch", str(Path(batch_directory).absolute())])
+        arguments.extend(["--batch", str(Path(batch_directory).absolute())])
     elif input_file_path:
-        command.append(str(Path(input_file_path).absolute()))
+        arguments.append(str(Path(input_file_path).absolute()))
     if output_file_path:
-        command.extend(["-o", str(Path(output_file_path).absolute())])
+        arguments.extend(["-o", str(Path(output_file_path).absolute())])
+    return arguments
+
+
+@timed("tabula.extract")
+def _tabula(*args, **kwargs):
+    """
+    Run tabula
+    """
+    # Command looks like:
+    # java -jar tabula-1.0.5-jar-with-dependencies.jar -l -f JSON --pages all reports/2022-05-18/petro_min_2022-may-10.pdf -o output.json
+    command = ["java", "-jar", get_tabula_jar_path()]
+    command.extend(_tabula_arguments(*args, **kwargs))
     print("Running tabula with this command:")
     print(" ".join(command))
 
@@ -74,6 +94,52 @@ def _tabula(
     return result.stdout.decode("utf-8")
 
 
+def tables_from_output(output: bytes) -> dict:
+    """
+    Load a raw Tabula JSON output. Returns the ``pages`` as Python objects
+    and the ``meta_id`` that ``parser.parse`` gives the same output saved
+    to a file.
+    """
+    return {
+        "pages": json.loads(output),
+        "meta_id": hashlib.sha256(output).hexdigest(),
+    }
+
+
+def _json_options(options: dict) -> dict:
+    options.pop("output_file_path", None)
+    options["output_format"] = Formats.JSON
+    return options
+
+
+@timed("tabula.extract")
+def extract_output(input_file_path, **options) -> bytes:
+    """
+    Extract the tables of a PDF as a raw Tabula JSON output.
+
+    Tabula writes its JSON to a pipe and the captured bytes are returned;
+    nothing is written to disk. Accepts the same options as ``extract``.
+    """
+    command = ["java", "-jar", get_tabula_jar_path()]
+    command.extend(
+        _tabula_arguments(input_file_path=input_file_path, **_json_options(options))
+    )
+    # Warnings from Java on stderr must not end up in the JSON
+    result = _run_tabula(command, stderr=subprocess.PIPE)
+    return result.stdout
+
+
+def extract_tables(input_file_path, **options) -> dict:
+    """
+    Extract the tables of a PDF as Python objects, see ``tables_from_output``.
+
+    Loaded straight from the output of ``extract_output``. Accepts the same
+    options as ``extract``.
+    """
+    return tables_from_output(extract_output(input_file_path, **options))
+
+
+@lru_cache(maxsize=None)
 def _java_version():
     try:
         result = subprocess.run(
@@ -93,14 +159,14 @@ def _java_version():
     return result.stdout.decode("utf-8")
 
 
-def _run_tabula(command: Optional[list] = None):
+def _run_tabula(command: Optional[list] = None, stderr=subprocess.STDOUT):
     if not command:
-        command = ["java", "-jar", TABULA_JAR_PATH, "-v"]
+        command = ["java", "-jar", get_tabula_jar_path(), "-v"]
     try:
         result = subprocess.run(
             command,
             stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
+            stderr=stderr,
             stdin=subprocess.DEVNULL,
             check=True,
         )
@@ -108,12 +174,15 @@ def _run_tabula(command: Optional[list] = None):
         raise NotFoundException("Tabula is not installed or not set in PATH")
     except subprocess.CalledProcessError as e:
         logger.error(
-            "Error occured while running tabula:\n{}\n".format(e.stderr.decode("utf-8"))
+            "Error occured while running tabula:\n{}\n".format(
+                (e.stderr or e.stdout).decode("utf-8")
+            )
         )
         raise
     return result
 
 
+@lru_cache(maxsize=None)
 def _tabula_version():
     result = _run_tabula()  # command is for debug (default)
     return result.stdout.decode("utf-8")
@@ -133,6 +202,131 @@ def debug_info(silent=False):
     )
 
 
+class TabulaWorker:
+    """
+    Long-lived Tabula worker.
+
+    Starts a single JVM (through JPype) the first time it is used and runs
+    every extraction inside it, avoiding a ``java -jar`` startup per PDF.
+    The JVM stays up until the Python process exits.
+    """
+
+    def __init__(self, jar_path=None):
+        self.jar_path = jar_path or get_tabula_jar_path()
+        self._lock = threading.Lock()
+        self._app_class = None
+        self._parser = None
+        self._options = None
+        self._string_builder = None
+        self._string_array = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def start(self):
+        """
+        Start the JVM and load Tabula, if not yet started
+        """
+        if self._app_class is not None:
+            return self
+        try:
+            import jpype
+        except ImportError:
+            raise NotFoundException(
+                "JPype is required for the Tabula worker. Install it with: pip install JPype1"
+            )
+        debug_info(silent=True)
+        with self._lock:
+            if not jpype.isJVMStarted():
+                jpype.startJVM(
+                    "-Djava.awt.headless=true",
+                    classpath=[str(Path(self.jar_path).absolute())],
+                    convertStrings=False,
+                )
+            self._app_class = jpype.JClass("technology.tabula.CommandLineApp")
+            self._parser = jpype.JClass("org.apache.commons.cli.DefaultParser")()
+            self._options = self._app_class.buildOptions()
+            self._string_builder = jpype.JClass("java.lang.StringBuilder")
+            self._string_array = jpype.JArray(jpype.JString)
+        return self
+
+    @timed("tabula.worker_extract")
+    def extract(self, input_file_path=None, **kwargs) -> str:
+        """
+        Extract tables from a PDF inside the running JVM.
+
+        Accepts the same options as ``extract``. Returns the Tabula output,
+        which is empty when ``output_file_path`` is given.
+        """
+        self.start()
+        arguments = _tabula_arguments(input_file_path=input_file_path, **kwargs)
+        with self._lock:
+            line = self._parser.parse(self._options, self._string_array(arguments))
+            output = self._string_builder()
+            self._app_class(output, line).extractTables(line)
+            return str(output.toString())
+
+    def extract_tables(self, input_file_path, **kwargs) -> dict:
+        """
+        Extract the tables of a PDF as Python objects, like
+        ``extract_tables``, inside the running JVM.
+        """
+        output = self.extract(input_file_path, **_json_options(kwargs))
+        return tables_from_output(output.encode("utf-8"))
+
+    def extract_many(self, input_file_paths, **kwargs):
+        """
+        Extract tables from several PDFs, yielding ``(input_file_path, output)``
+        as soon as each file is done.
+        """
+        for input_file_path in input_file_paths:
+            yield input_file_path, self.extract(input_file_path, **kwargs)
+
+
+_worker = None
+
+
+def get_worker() -> TabulaWorker:
+    """
+    Get the Tabula worker shared by this process
+    """
+    global _worker
+    if _worker is None:
+        _worker = TabulaWorker()
+    return _worker
+
+
+def _output_suffix(output_format) -> str:
+    output_format = (
+        output_format if isinstance(output_format, str) else output_format.value
+    )
+    return "." + output_format.lower()
+
+
+def extract_with_worker(batch_directory=None, input_file_path=None, **kwargs):
+    """
+    Extract data from PDFs using the persistent Tabula worker.
+
+    With ``batch_directory``, every PDF in it is extracted in the same JVM
+    and the output is written next to it, like Tabula's own ``--batch``.
+    """
+    worker = get_worker()
+    if batch_directory is None:
+        print(worker.extract(input_file_path, **kwargs))
+        return
+    kwargs.pop("output_file_path", None)
+    input_file_paths = sorted(Path(batch_directory).glob("*.pdf"))
+    output_format = kwargs.get("output_format", Formats.CSV)
+    for idx, pdf_path in enumerate(input_file_paths):
+        output_file_path = pdf_path.with_suffix(_output_suffix(output_format))
+        worker.extract(pdf_path, output_file_path=output_file_path, **kwargs)
+        print(f"{idx + 1} / {len(input_file_paths)} {output_file_path}")
+
+
 def extract(*args, **kwargs):
     """
     Extract data from PDFs using tabula
@@ -1,22 +1,26 @@
 import csv
-import dataclasses
 import hashlib
-import json
 import logging
 import re
 from datetime import datetime
 from pathlib import Path
 from pprint import PrettyPrinter
 
-from doeextractor import analyser
-from doeextractor.models.fuel_line_price import FuelLinePriceItem, FuelPrice
-from doeextractor.token_types import FEATURES, TOKEN_TYPES, UNCATEGORIZED
+from doeextractor import analyser, columnar
+from doeextractor.constants import AnalysisEngine
+from doeextractor.instrumentation import count, counted, stage
+from doeextractor.models import FuelLinePriceItem, FuelPrice, PriceTable, dump_response
+from doeextractor.prices import parse_price
 
 pp = PrettyPrinter(indent=2)
 
 
 logger = logging.getLogger(__name__)
 
+# Product merged with a "ron" product, e.g. "kerosene ron 95"
+PMergedRon = re.compile(r"^.*\s(ron)\s\d+$")
+PProduct = re.compile(r"ron\s\d+|kerosene")
+
 
 logger.setLevel(logging.DEBUG)
 handler = logging.FileHandler("log_file.log")
@@ -35,15 +39,7 @@ def clean(input_file_path: Path, overwrite=False):
     output_file = input_file.with_suffix(".clean.csv")
     with open(input_file, "r") as input_file_obj:
         with open(output_file, "w") as output_file_obj:
-            for line in input_file_obj:
-                if line.startswith("Table:"):
-                    continue
-                if line.startswith("\n"):
-                    continue
-                if line.startswith("\r"):
-                    continue
-                if line.startswith("\r\n"):
-                    continue
+            for line in _iter_clean_lines(input_file_obj):
                 output_file_obj.write(line)
     if overwrite:
         input_file.unlink()
@@ -51,24 +47,49 @@ def clean(input_file_path: Path, overwrite=False):
     return output_file
 
 
-def _get_hash(data):
+def _is_table_noise(line: str) -> bool:
+    return (
+        line.startswith("Table:")
+        or line.startswith("\n")
+        or line.startswith("\r")
+        or line.startswith("\r\n")
+    )
+
+
+def _iter_clean_lines(lines, hasher=None):
     """
-    Get hash of input file.
+    Drop "Table:" and blank lines, hashing the kept lines as they pass.
     """
-    m = hashlib.sha256()
-    m.update(data)
-    return m.hexdigest()
+    for line in lines:
+        if _is_table_noise(line):
+            continue
+        if hasher is not None:
+            hasher.update(line.encode("utf-8"))
+        yield line
 
 
-def _get_input_file_metadata(input_file_path: str):
+def _iter_input_lines(input_file_path, clean_input=True, hasher=None):
     """
-    Get metadata from input file.
+    Lines of an input file, read once.
+
+    The hash covers the cleaned lines when ``clean_input`` is set, or the
+    raw file contents otherwise.
     """
-    try:
-        file_contents = Path(input_file_path).read_bytes()
-    except Exception as e:
-        raise Exception(f"Error parsing input file: {e}")
-    return _get_hash(file_contents)
+    with open(input_file_path, "rb") as input_file_obj:
+        lines = _iter_decoded_lines(input_file_obj, None if clean_input else hasher)
+        if clean_input:
+            lines = _iter_clean_lines(lines, hasher)
+        yield from lines
+
+
+def _iter_decoded_lines(raw_lines, hasher=None):
+    for raw_line in raw_lines:
+        if hasher is not None:
+            hasher.update(raw_line)
+        line = raw_line.decode("utf-8")
+        if line.endswith("\r\n"):  # Same newlines as reading in text mode
+            line = line[:-2] + "\n"
+        yield line
 
 
 def _clean_cell(text, is_header=False):
@@ -91,199 +112,167 @@ def _clean_cell(text, is_header=False):
     return text_entry
 
 
-def classify(text):
+def tokenize_input(input_file_path: str):
     """
-    Classify text simplified for DOE reports
+    Tokenize input file.
     """
-    # Prefer simpler cases early
-    text = text.lower().strip()
-    token_type = TOKEN_TYPES.get("default")
-    for feature, feature_func in FEATURES.items():
-        if feature_func(text):
-            token_type = TOKEN_TYPES[feature]
-            break
-    if token_type == UNCATEGORIZED:
-        logger.debug("Uncategorized token: %s", text)
-        print("Uncategorized token:", text)
-    return token_type
+    input_file = Path(input_file_path, exists=True).absolute()
+    with open(input_file, "r") as input_file_obj:
+        return tokenize_lines(input_file_obj)
 
 
-def tokenize_input(input_file_path: str):
+def tokenize_lines(lines):
     """
-    Tokenize input file.
+    Tokenize lines of extracted tables.
+
+    ``lines`` can be any iterable of CSV lines (an open file, a generator).
     """
-    input_file = Path(input_file_path, exists=True).absolute()
     skip_first_cell = False  # Skip first cell if header has region
     skip_last_cell = False  # Skip last cell if last cell is just empty/padding
     # Cities to correct. e.g. {"koronadal": "koronadal city"}
     corrections_for_cities = dict()
-    with open(input_file, "r") as input_file_obj:
-        reader = csv.reader(input_file_obj)
-        raw_header = next(reader)
-        # clean header
-        print("[.] Getting headers")
-        header = [_clean_cell(cell, is_header=True) for cell in raw_header]
-        alternate_header = [_clean_cell(cell) for cell in raw_header]
-        if len(header[0]) == 0 and header[1] == "area":
-            # header has region in it
-            header = header[1:]
-            alternate_header = alternate_header[1:]
-            skip_first_cell = True
-
-        if len(header[-1]) == 0:
-            # header has a padding
-            header = header[:-1]
-            alternate_header = alternate_header[:-1]
-            skip_last_cell = True
-
-        current_location = None
-        last_product_identifier = "kerosene"  # TODO Constant?
-
-        line_entry_data = []
-        location_for_rows = []  # [()]
-        index_with_no_location = -1
-        context_row_idx = 0
-        print("[.] Reading data")
-        for row_idx, row in enumerate(reader):
-            if skip_first_cell:
-                row = row[1:]
-            if skip_last_cell:
-                row = row[:-1]
-            row = [_clean_cell(cell) for cell in row]
-
-            # Sometimes the header gets repeated
+    reader = csv.reader(lines)
+    raw_header = next(reader)
+    # clean header
+    print("[.] Getting headers")
+    header = [_clean_cell(cell, is_header=True) for cell in raw_header]
+    alternate_header = [_clean_cell(cell) for cell in raw_header]
+    if len(header[0]) == 0 and header[1] == "area":
+        # header has region in it
+        header = header[1:]
+        alternate_header = alternate_header[1:]
+        skip_first_cell = True
+
+    if len(header[-1]) == 0:
+        # header has a padding
+        header = header[:-1]
+        alternate_header = alternate_header[:-1]
+        skip_last_cell = True
+
+    current_location = None
+    last_product_identifier = "kerosene"  # TODO Constant?
+
+    line_entry_data = []
+    location_for_rows = []  # [()]
+    index_with_no_location = -1
+    context_row_idx = 0
+    print("[.] Reading data")
+    for row_idx, row in enumerate(reader):
+        if skip_first_cell:
+            row = row[1:]
+        if skip_last_cell:
+            row = row[:-1]
+        row = [_clean_cell(cell) for cell in row]
+
+        # Sometimes the header gets repeated
+        if (
+            row == header
+            or row == alternate_header
+            or row[:2] == ["cities", ""]
+            or row[1:] == alternate_header[1:]
+        ):
+            continue
+
+        # Get current location
+        previous_location = current_location
+        if len(row[0]) > 1:
+            current_location = row[0]
+        elif len(row[0]) == 0 and index_with_no_location == -1:
+            index_with_no_location = context_row_idx
+        elif len(row[0]) == 0 and current_location:
+            # line_entry.area = current_location
+            row[0] = current_location
+        if current_location != previous_location:
             if (
-                row == header
-                or row == alternate_header
-                or row[:2] == ["cities", ""]
-                or row[1:] == alternate_header[1:]
-            ):
-                continue
-
-            # Get current location
-            previous_location = current_location
-            if len(row[0]) > 1:
-                current_location = row[0]
-            elif len(row[0]) == 0 and index_with_no_location == -1:
-                index_with_no_location = context_row_idx
-            elif len(row[0]) == 0 and current_location:
-                # line_entry.area = current_location
+                current_location == "city"
+            ):  # quite possibly the "city" part is split into the cell below
+                current_location = f"{previous_location} city"
+                if previous_location not in corrections_for_cities:
+                    corrections_for_cities[previous_location] = current_location
+                # write back modification
                 row[0] = current_location
-            if current_location != previous_location:
-                if (
-                    current_location == "city"
-                ):  # quite possibly the "city" part is split into the cell below
-                    current_location = f"{previous_location} city"
-                    if previous_location not in corrections_for_cities:
-                        corrections_for_cities[previous_location] = current_location
-                    # write back modification
-                    row[0] = current_location
-
-            if last_product_identifier in row:
-                location_for_rows.append(
-                    (index_with_no_location, context_row_idx, current_location)
-                )
-                # Last product identified, reset some variables
-                current_location = None
-                index_with_no_location = -1
-
-            line_entry = row
-            line_entry_data.append(line_entry)
-            context_row_idx += 1
-
-        # Corrections on locations
-        print("[.] Correcting locations")
-        # Do correction on location names
-        for entry_idx, entry in enumerate(line_entry_data):
-            entry_location = entry[0]
-            if entry_location in corrections_for_cities:
-                entry[0] = corrections_for_cities[entry_location]
-
-        # Fill in blank locations
-        while True:
-            try:
-                start_idx, end_idx, location = location_for_rows.pop(0)
-            except IndexError:
-                break
-            else:
-                for slice_row in line_entry_data[start_idx:end_idx]:
-                    if slice_row[0] == "":
-                        slice_row[0] = location
-
-        # Break up merged lines
-        print("[.] Breaking up merged lines")
-        merged_rows = []  # [(source_idx, fixed_row)]
-        inserts_done = 0
-        for row_idx, line_entry in enumerate(line_entry_data):
-            new_row = line_entry[:]
-            to_insert = False
-            if line_entry[1].endswith(" diesel"):
-                # e.g. "ron 91 diesel"
-                line_entry[1] = line_entry[1].replace(" diesel", "")
-                # Fixing the source product
-                line_entry[1] = line_entry[1].rsplit(" diesel")[0]
-                # Fixing the new row
-                new_row[1] = "diesel"  # Fix the product of new row
-                to_insert = True
-            elif re.match(r"^.*\s(ron)\s\d+$", line_entry[1]):
-                line_entry[1], new_row[1] = re.findall(
-                    r"ron\s\d+|kerosene", line_entry[1]
-                )
-                # TODO Not working. Gets rearranged
-                # if line_entry[1] == "kerosene":
-                #     # Do not copy all for new row since i t marks another start of entry
-                #     try:
-                #         new_row[0] = line_entry_data[row_idx + inserts_done + 1][0]
-                #     except IndexError:
-                #         new_row[0] = ""
+
+        if last_product_identifier in row:
+            location_for_rows.append(
+                (index_with_no_location, context_row_idx, current_location)
+            )
+            # Last product identified, reset some variables
+            current_location = None
+            index_with_no_location = -1
+
+        line_entry = row
+        line_entry_data.append(line_entry)
+        context_row_idx += 1
+
+    # Corrections on locations
+    print("[.] Correcting locations")
+    # Do correction on location names
+    for entry_idx, entry in enumerate(line_entry_data):
+        entry_location = entry[0]
+        if entry_location in corrections_for_cities:
+            entry[0] = corrections_for_cities[entry_location]
+
+    # Fill in blank locations
+    for start_idx, end_idx, location in location_for_rows:
+        for slice_row in line_entry_data[start_idx:end_idx]:
+            if slice_row[0] == "":
+                slice_row[0] = location
+
+    # Break up merged lines
+    print("[.] Breaking up merged lines")
+    return list(_repair_rows(line_entry_data)), header
+
+
+def _repair_rows(rows):
+    """
+    Break up merged rows, in a single pass.
+
+    Yields every row in order; when a row was merged with the next one,
+    the split-off row is yielded right before it.
+    """
+    for line_entry in rows:
+        new_row = line_entry[:]
+        to_insert = False
+        if line_entry[1].endswith(" diesel"):
+            # e.g. "ron 91 diesel"
+            line_entry[1] = line_entry[1].replace(" diesel", "")
+            # Fixing the source product
+            line_entry[1] = line_entry[1].rsplit(" diesel")[0]
+            # Fixing the new row
+            new_row[1] = "diesel"  # Fix the product of new row
+            to_insert = True
+        elif PMergedRon.match(line_entry[1]):
+            line_entry[1], new_row[1] = PProduct.findall(line_entry[1])
+            # TODO Not working. Gets rearranged
+            # if line_entry[1] == "kerosene":
+            #     # Do not copy all for new row since i t marks another start of entry
+            #     new_row[0] = next row's location
+            to_insert = True
+        # Fixing merged prices
+        for cell_idx, cell in enumerate(
+            line_entry[2:]
+        ):  # Index 2 is where prices start
+            cell_split = cell.split(" ")
+            price = parse_price(cell)
+            if (
+                price
+                and len(price.values) == len(cell_split)
+                and len(cell_split) % 2 == 0
+                and len(cell_split) > 2
+            ):
+                # Even number of prices, so it's probably a merged cell
+                # e.g. "81.60 81.60 82.40 82.40"
+                line_entry[cell_idx + 2] = " ".join(cell_split[: len(cell_split) // 2])
+                new_row[cell_idx + 2] = " ".join(cell_split[len(cell_split) // 2 :])
                 to_insert = True
-            # Fixing merged prices
-            for cell_idx, cell in enumerate(
-                line_entry[2:]
-            ):  # Index 2 is where prices start
-                cell_split = cell.split(" ")
-                for_prices = True
-                try:
-                    list(map(float, cell_split))
-                except ValueError:
-                    for_prices = False
-                else:
-                    if len(cell_split) % 2 == 0 and len(cell_split) > 2 and for_prices:
-                        # Even number of elements, so it's probably a merged cell
-                        # e.g. "81.60 81.60 82.40 82.40"
-                        line_entry[cell_idx + 2] = " ".join(
-                            cell_split[: len(cell_split) // 2]
-                        )
-                        new_row[cell_idx + 2] = " ".join(
-                            cell_split[len(cell_split) // 2 :]
-                        )
-                        to_insert = True
-            if to_insert:
-                merged_rows.append((row_idx + inserts_done, new_row))
-                inserts_done += 1
-
-        # Re-insert merged rows
-        if merged_rows:
-            print(f"[.] Re-inserting merged {len(merged_rows)} rows")
-        while True:
-            try:
-                insert_idx, new_row = merged_rows.pop(0)
-            except IndexError:
-                break
-            else:
-                line_entry_data.insert(insert_idx, new_row)
-
-        # For debug purposes only
-        # for row_idx, line_entry in enumerate(line_entry_data):
-        #     print(row_idx, line_entry)
-
-        return line_entry_data, header
+        if to_insert:
+            yield new_row
+        yield line_entry
 
 
-def _build_data(parsed_data, header) -> list:
-    """Parsed data is then transformed to the output format"""
-    results = []
-    for idx, data in enumerate(parsed_data):
+def iter_line_price_items(parsed_data, header):
+    """Parsed data is then transformed to line price items"""
+    for data in parsed_data:
         line_price_item = FuelLinePriceItem(
             municity=data[0],
             product=data[1],
@@ -297,29 +286,43 @@ def _build_data(parsed_data, header) -> list:
             FuelPrice(company=company, price=col_data)
             for col_data, company in zip(price_cols, company_cols)
         ]
-        results.append(dataclasses.asdict(line_price_item))
-    return results
+        yield line_price_item
 
 
-def parse(input_file_path: str, output_file_path: str = None, clean_input=True):
+def _build_data(parsed_data, header) -> list:
+    """Parsed data is then transformed to the output format"""
+    return [item.to_dict() for item in iter_line_price_items(parsed_data, header)]
+
+
+def build_table(parsed_data, header) -> PriceTable:
     """
-    Simple parser for extracted tables.
+    Build parsed data into a compact table.
     """
-    input_file = Path(input_file_path, exists=True).absolute()
-    if clean_input:
-        input_file = clean(input_file, overwrite=True)
-
+    return PriceTable.from_items(iter_line_price_items(parsed_data, header))
+
+
+def _parse_lines(
+    lines,
+    hasher,
+    output_file_path: str = None,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: str = None,
+    report_date=None,
+    as_table=False,
+):
     # Metadata
     metadata = {
         "query_datetime": datetime.now().isoformat(),
     }
-    meta_hash = _get_input_file_metadata(input_file_path)
-    metadata["meta_id"] = meta_hash
 
     # Tokenize
-    tokens, header = tokenize_input(input_file_path)
-    results = _build_data(tokens, header)
-    analysis = analyser.analyse(results)
+    with stage("textract_parser.parse") as counters:
+        tokens, header = tokenize_lines(counted(lines, counters, "lines"))
+        metadata["meta_id"] = hasher.hexdigest()
+        build = build_table if as_table else _build_data
+        results = build(tokens, header)
+        counters["rows"] += len(results)
+    analysis = analyser.analyse(results, engine=engine)
     response = {
         "metadata": metadata,
         "results": results,
@@ -329,9 +332,68 @@ def parse(input_file_path: str, output_file_path: str = None, clean_input=True):
         pp.pprint(response)
     else:
         full_output_path = str(Path(output_file_path).absolute())
-        with open(full_output_path, "w") as f:
-            json.dump(response, f, indent=2)
+        with stage("textract_parser.write_output"), open(full_output_path, "w") as f:
+            dump_response(response, f)
             print("Output file saved to:", full_output_path)
+    if dataset_dir:
+        columnar.write_dataset(
+            results, dataset_dir, report_date=report_date, meta_id=metadata["meta_id"]
+        )
     print("[.] Done")
 
-    return 0
+    return response
+
+
+def parse(
+    input_file_path: str,
+    output_file_path: str = None,
+    clean_input=True,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: str = None,
+):
+    """
+    Simple parser for extracted tables.
+
+    The input is cleaned, hashed and tokenized in a single pass over the
+    file, without intermediate files. With ``dataset_dir``, the prices are
+    also appended to a columnar dataset (see ``columnar.write_dataset``).
+    """
+    input_file = Path(input_file_path, exists=True).absolute()
+    count("textract_parser.parse", bytes_read=input_file.stat().st_size)
+    hasher = hashlib.sha256()
+    lines = _iter_input_lines(input_file, clean_input=clean_input, hasher=hasher)
+    return _parse_lines(
+        lines,
+        hasher,
+        output_file_path,
+        engine=engine,
+        dataset_dir=dataset_dir,
+        report_date=columnar.report_date_from_path(input_file),
+    )
+
+
+def parse_csv(
+    csv_text: str,
+    output_file_path: str = None,
+    engine: AnalysisEngine = AnalysisEngine.DECIMAL,
+    dataset_dir: str = None,
+    report_date=None,
+    as_table=False,
+):
+    """
+    Parse the CSV of extracted tables straight from memory.
+
+    With ``as_table``, the results are built into a compact ``PriceTable``
+    instead of a list of dicts.
+    """
+    hasher = hashlib.sha256()
+    lines = _iter_clean_lines(csv_text.splitlines(keepends=True), hasher)
+    return _parse_lines(
+        lines,
+        hasher,
+        output_file_path,
+        engine=engine,
+        dataset_dir=dataset_dir,
+        report_date=report_date,
+        as_table=as_table,
+    )
@@ -1,80 +1,233 @@
-import base64
+import hashlib
+import json
 import os
-from json import load
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from pathlib import Path
-from typing import Any, Union
+from typing import Optional, Tuple, Union
 
-import boto3
 from dotenv import load_dotenv
 
 from .file_helpers import (
-    add_file_to_local_cache,
+    DEFAULT_DPI,
+    AnalysisCache,
     convert_pdf_to_png,
-    is_file_already_analyzed,
+    get_cache,
+    iter_pdf_pages,
+    render_cache_path,
+    render_merged_page,
 )
+from .instrumentation import count_cache, stage, timed
 
-load_dotenv()
+# Pages sent to Textract at the same time
+TEXTRACT_MAX_WORKERS = 4
+TEXTRACT_MAX_RETRIES = 5
+TEXTRACT_RETRY_BACKOFF = 0.5  # seconds, doubled on every retry
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+}
 
-AWS_REGION = os.getenv("AWS_REGION", None)
-AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY", None)
-AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY", None)
-if not AWS_REGION or not AWS_ACCESS_KEY or not AWS_SECRET_KEY:
-    raise Exception(
-        """\
-        Incomplete credentials for AWS Textract. \
-        Please set AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY"""
-    )
 
+def _get_credentials() -> dict:
+    """
+    AWS credentials, read from the environment (or .env) when first needed.
+    """
+    load_dotenv()
+    aws_region = os.getenv("AWS_REGION", None)
+    aws_access_key = os.getenv("AWS_ACCESS_KEY", None)
+    aws_secret_key = os.getenv("AWS_SECRET_KEY", None)
+    if not aws_region or not aws_access_key or not aws_secret_key:
+        raise Exception(
+            """\
+            Incomplete credentials for AWS Textract. \
+            Please set AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY"""
+        )
+    return {
+        "aws_access_key_id": aws_access_key,
+        "aws_secret_access_key": aws_secret_key,
+        "region_name": aws_region,
+    }
 
-def get_table_csv_results(input_file: Path):
-    input_as_image = convert_pdf_to_png(input_file)
-    # contents = bytearray(input_as_image.read_bytes())
-    input_images = []
-    if input_as_image.is_dir():
-        input_images.extend(input_as_image.glob("*.png"))
-    else:
-        input_images = [input_as_image]
 
-    csv_results = []
+def _get_client():
+    import boto3
+
+    return boto3.client("textract", **_get_credentials())
+
+
+def analyze_page(client, page, max_retries=TEXTRACT_MAX_RETRIES):
+    """
+    Send a single page to Textract, retrying with backoff when throttled.
+
+    ``page`` is either the page image bytes or the path to the image.
+    """
+    from botocore.exceptions import ClientError
+
+    if isinstance(page, Path):
+        page = page.read_bytes()
+    with stage("textractor.analyze_page") as counters:
+        counters.update(pages=1, bytes_sent=len(page))
+        for attempt in range(max_retries + 1):
+            try:
+                return client.analyze_document(
+                    Document={"Bytes": bytearray(page)}, FeatureTypes=["TABLES"]
+                )
+            except ClientError as e:
+                error_code = e.response.get("Error", {}).get("Code")
+                if error_code not in THROTTLING_ERROR_CODES or attempt == max_retries:
+                    raise
+                counters["retries"] += 1
+                delay = TEXTRACT_RETRY_BACKOFF * (2**attempt)
+                time.sleep(delay + random.uniform(0, delay))
+
+
+def _page_hash(page: bytes) -> str:
+    return hashlib.sha256(page).hexdigest()
+
+
+def analyze_pages(
+    pages,
+    client=None,
+    max_workers=TEXTRACT_MAX_WORKERS,
+    page_cache: Optional[AnalysisCache] = None,
+) -> list:
+    """
+    Send pages to Textract concurrently, at most ``max_workers`` at a time.
+
+    ``pages`` may be a lazy iterator; a new page is only taken from it when
+    a slot frees up, so at most ``max_workers`` pages are held in memory.
+    With ``page_cache``, pages already sent before are answered from the
+    cache and every new response is stored as soon as it arrives, so a
+    failed run only resends the missing pages.
+    Responses are returned in the same order as ``pages``.
+    """
+    client = client or _get_client()
+    total = len(pages) if hasattr(pages, "__len__") else "?"
+    responses = {}
+
+    def _collect(futures):
+        """
+        Store the responses of done pages. Returns the first error, if any.
+        """
+        error = None
+        for future in futures:
+            idx, page_hash = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            response.pop("ResponseMetadata", None)
+            if page_cache is not None:
+                page_cache.add_page(page_hash, response)
+            responses[idx] = response
+            print(f"{len(responses)} / {total}")
+        return error
+
     print("Analyzing...")
-    client = boto3.client(
-        "textract",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_KEY,
-        region_name=AWS_REGION,
-    )
-    for idx, input_png in enumerate(input_images):
-        with open(input_png, "rb") as document:
-            # contents = bytearray(document.read())
-            contents = bytearray(document.read())
-        # contents = base64.b64encode(input_as_image.read_bytes())
-        print(f"{idx} / {len(input_images)}")
-        response = client.analyze_document(
-            Document={"Bytes": contents}, FeatureTypes=["TABLES"]
-        )
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        try:
+            for idx, page in enumerate(pages):
+                page_hash = None
+                if page_cache is not None:
+                    if isinstance(page, Path):
+                        page = page.read_bytes()
+                    page_hash = _page_hash(page)
+                    cached_response = page_cache.get_page(page_hash)
+                    if cached_response is not None:
+                        responses[idx] = cached_response
+                        print(f"{len(responses)} / {total} (cached)")
+                        continue
+                # Recorded into the recorder of the caller, e.g. its report
+                future = executor.submit(copy_context().run, analyze_page, client, page)
+                pending[future] = (idx, page_hash)
+                if len(pending) >= max_workers:
+                    error = _collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                    if error is not None:
+                        break  # No new pages are sent
+        finally:
+            # Pages already sent are stored even when another one failed
+            last_error = _collect(wait(pending).done)
+    error = error or last_error
+    if error is not None:
+        raise error
+    return [responses[idx] for idx in range(len(responses))]
+
 
-        blocks = response["Blocks"]
+def response_to_csv(response) -> Optional[str]:
+    """
+    Convert the tables of a Textract response to CSV.
 
-        blocks_map = {}
-        table_blocks = []
-        for block in blocks:
-            blocks_map[block["Id"]] = block
-            if block["BlockType"] == "TABLE":
-                table_blocks.append(block)
+    Returns None when the response has no tables.
+    """
+    blocks_map = {}
+    table_blocks = []
+    for block in response["Blocks"]:
+        blocks_map[block["Id"]] = block
+        if block["BlockType"] == "TABLE":
+            table_blocks.append(block)
 
-        if len(table_blocks) == 0:
-            return None
+    if len(table_blocks) == 0:
+        return None
+
+    csv = ""
+    for index, table in enumerate(table_blocks):
+        csv += generate_table_csv(table, blocks_map, index + 1)
+        csv += "\n\n"
+    return csv
+
+
+def get_table_responses(
+    input_file: Path,
+    client=None,
+    max_workers=TEXTRACT_MAX_WORKERS,
+    cache_pages=False,
+    merge_pages=False,
+    dpi=DEFAULT_DPI,
+) -> list:
+    """
+    Textract responses for every page of a PDF, in page order.
+
+    Pages are rendered and sent to Textract straight from memory. With
+    ``cache_pages``, the rendered pages are also kept under ``output/`` (see
+    ``file_helpers.render_cache_path``) and reused on the next run. With
+    ``merge_pages``, all pages are sent as a single image.
+    """
+    if merge_pages and cache_pages:
+        pages = [convert_pdf_to_png(input_file, merge_pages=True, dpi=dpi)]
+    elif merge_pages:
+        pages = [render_merged_page(input_file, dpi=dpi)]
+    else:
+        cache_dir = render_cache_path(input_file, dpi) if cache_pages else None
+        pages = iter_pdf_pages(input_file, dpi=dpi, cache_dir=cache_dir)
+    return analyze_pages(
+        pages, client=client, max_workers=max_workers, page_cache=get_cache()
+    )
 
-        csv = ""
-        for index, table in enumerate(table_blocks):
-            csv += generate_table_csv(table, blocks_map, index + 1)
-            csv += "\n\n"
-        csv_results.append(csv)
-    print(f"{len(input_images)} / {len(input_images)}")
 
+def responses_to_csv(responses: list) -> Optional[list]:
+    """
+    CSV of every response, or None if a page has no tables.
+    """
+    csv_results = []
+    for response in responses:
+        csv = response_to_csv(response)
+        if csv is None:
+            return None
+        csv_results.append(csv)
     return csv_results
 
 
+def get_table_csv_results(input_file: Path, **kwargs):
+    return responses_to_csv(get_table_responses(input_file, **kwargs))
+
+
 def generate_table_csv(table_result, blocks_map, table_index):
     rows = get_rows_columns_map(table_result, blocks_map)
     # table_id = "Table_" + str(table_index)
@@ -121,29 +274,153 @@ def get_text(result, blocks_map):
     return text
 
 
-def extract(input_file_path: Union[str, Path]):
+def _extraction_settings(merge_pages=False, dpi=DEFAULT_DPI) -> dict:
+    """
+    Settings that change the extraction result, part of the cache key.
+    """
+    return {"feature_types": ["TABLES"], "merge_pages": merge_pages, "dpi": dpi}
+
+
+def _output_file_paths(input_file_path: Path, settings: dict) -> Tuple[Path, Path]:
+    """
+    CSV and raw blocks paths of a file extracted with ``settings``.
+
+    Results of the default settings are written next to the input file as
+    ``<report>.csv``; other settings add a hash of the settings to the name,
+    so each cached result keeps its own files.
+    """
+    if settings == _extraction_settings():
+        stem = input_file_path.stem
+    else:
+        settings_key = json.dumps(settings, sort_keys=True).encode()
+        stem = f"{input_file_path.stem}.{hashlib.md5(settings_key).hexdigest()[:8]}"
+    return (
+        input_file_path.with_name(stem + ".csv"),
+        input_file_path.with_name(stem + ".blocks.json"),
+    )
+
+
+def _get_cached_tables(
+    input_file_path: Path, settings: dict, cache: AnalysisCache
+) -> Optional[dict]:
+    """
+    Tables of a file already extracted with the same settings, if any.
+    """
+    cached_result = cache.get_result(input_file_path, settings)
+    count_cache("textractor.extract_tables", bool(cached_result))
+    if not cached_result:
+        return None
+    output_file_path, blocks_file_path = cached_result
+    return {
+        "output_file_path": output_file_path,
+        "blocks_file_path": blocks_file_path,
+        "csv": output_file_path.read_text(),
+        "blocks": json.loads(blocks_file_path.read_bytes()),
+        "cached": True,
+    }
+
+
+def _save_tables(
+    input_file_path: Path,
+    settings: dict,
+    responses: list,
+    cache: AnalysisCache,
+    write_output=True,
+) -> Optional[dict]:
+    """
+    Tables of the responses. With ``write_output``, the CSV and the raw
+    blocks are also written next to the input file and added to the cache.
+    Returns None when there are no tables.
+    """
+    csv_results = responses_to_csv(responses)
+    if not bool(csv_results):
+        return None
+
+    csv = "".join(csv_results)
+    blocks = [response["Blocks"] for response in responses]
+    if not write_output:
+        return {
+            "output_file_path": None,
+            "blocks_file_path": None,
+            "csv": csv,
+            "blocks": blocks,
+            "cached": False,
+        }
+    output_file_path, blocks_file_path = _output_file_paths(input_file_path, settings)
+    output_file_path.write_text(csv)
+    with open(blocks_file_path, "w") as f:
+        json.dump(blocks, f)
+    cache.add(input_file_path, output_file_path)
+    cache.add_result(input_file_path, settings, output_file_path, blocks_file_path)
+    cache.evict_pages()
+    return {
+        "output_file_path": output_file_path,
+        "blocks_file_path": blocks_file_path,
+        "csv": csv,
+        "blocks": blocks,
+        "cached": False,
+    }
+
+
+@timed("textractor.extract_tables")
+def extract_tables(
+    input_file_path: Union[str, Path],
+    max_workers=TEXTRACT_MAX_WORKERS,
+    cache_pages=False,
+    merge_pages=False,
+    dpi=DEFAULT_DPI,
+    write_output=True,
+) -> Optional[dict]:
     """
     Extract tables from a PDF file using Amazon Textract
+
+    Returns the CSV and the raw Textract blocks of every page, or None when
+    nothing was extracted. A file already extracted with the same settings
+    is served from the local cache without rendering or calling Textract.
+    Without ``write_output``, new results are only returned, not written
+    next to the input file; pages are still answered from the page cache.
     """
-    if isinstance(input_file_path, str):
-        input_file_path = Path(input_file_path).absolute()
-    # Check if the file is already analyzed
-    is_file_analyzed_before, initial_result = is_file_already_analyzed(input_file_path)  # type: ignore
-    if is_file_analyzed_before and initial_result:
-        # TODO Return the analysis result
+    input_file_path = Path(input_file_path).absolute()
+    settings = _extraction_settings(merge_pages=merge_pages, dpi=dpi)
+    cache = get_cache()
+    cached_tables = _get_cached_tables(input_file_path, settings, cache)
+    if cached_tables:
         print("File is already analyzed")
-        print(initial_result)
-        return 0
+        return cached_tables
 
-    csv_results = get_table_csv_results(input_file_path)
-    if not bool(csv_results):
+    responses = get_table_responses(
+        input_file_path,
+        max_workers=max_workers,
+        cache_pages=cache_pages,
+        merge_pages=merge_pages,
+        dpi=dpi,
+    )
+    tables = _save_tables(input_file_path, settings, responses, cache, write_output)
+    if tables is None:
         print("Cannot analyze or no CSV results")
-        return 0
-
-    output_file_path = input_file_path.with_suffix(".csv")
-    with open(output_file_path, "w") as f:
-        for csv_result in csv_results:
-            f.write(csv_result)
-    add_file_to_local_cache(input_file_path, output_file_path)
-    print("CSV results are written to {}".format(input_file_path.with_suffix(".csv")))
-    return 0
+        return None
+    if write_output:
+        print("CSV results are written to {}".format(tables["output_file_path"]))
+    return tables
+
+
+def extract(
+    input_file_path: Union[str, Path],
+    max_workers=TEXTRACT_MAX_WORKERS,
+    cache_pages=False,
+    merge_pages=False,
+    dpi=DEFAULT_DPI,
+) -> Optional[Path]:
+    """
+    Extract tables from a PDF file using Amazon Textract
+
+    Returns the path of the CSV results, or None when nothing was extracted.
+    """
+    result = extract_tables(
+        input_file_path,
+        max_workers=max_workers,
+        cache_pages=cache_pages,
+        merge_pages=merge_pages,
+        dpi=dpi,
+    )
+    return result["output_file_path"] if result else None
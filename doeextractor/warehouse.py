@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Union
+
+from doeextractor.columnar import flatten_results, report_date_from_path
+from doeextractor.models.fuel_line_price import FuelLinePriceItem
+
+WAREHOUSE_PATH = Path(__file__).parent.parent / "prices.db"
+DIMENSIONS = ("municities", "products", "companies")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    meta_id TEXT NOT NULL UNIQUE,
+    report_date TEXT,
+    source_path TEXT,
+    ingested_at TEXT
+);
+CREATE TABLE IF NOT EXISTS municities (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS companies (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS prices (
+    report_id INTEGER NOT NULL REFERENCES reports (id) ON DELETE CASCADE,
+    municity_id INTEGER NOT NULL REFERENCES municities (id),
+    product_id INTEGER NOT NULL REFERENCES products (id),
+    company_id INTEGER NOT NULL REFERENCES companies (id),
+    price_low REAL NOT NULL,
+    price_high REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_report_date ON reports (report_date);
+CREATE INDEX IF NOT EXISTS prices_product_municity ON prices (product_id, municity_id, company_id);
+CREATE INDEX IF NOT EXISTS prices_report ON prices (report_id);
+"""
+
+QUERY_PRICES = """
+SELECT reports.report_date, municities.name, products.name, companies.name, prices.price_low, prices.price_high
+FROM prices
+JOIN reports ON reports.id = prices.report_id
+JOIN municities ON municities.id = prices.municity_id
+JOIN products ON products.id = prices.product_id
+JOIN companies ON companies.id = prices.company_id
+"""
+PRICE_COLUMNS = (
+    "report_date",
+    "municity",
+    "product",
+    "company",
+    "price_low",
+    "price_high",
+)
+
+
+class PriceWarehouse:
+    """
+    Local SQLite store of parsed prices, normalized and indexed for
+    historical queries.
+    """
+
+    def __init__(self, db_path=WAREHOUSE_PATH):
+        self.db_path = db_path
+        self._connection = None
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            con = sqlite3.connect(self.db_path, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA foreign_keys=ON")
+            con.executescript(SCHEMA)
+            self._connection = con
+        return self._connection
+
+    def has_report(self, meta_id: str) -> bool:
+        with self._lock:
+            cur = self.connection.execute(
+                "SELECT 1 FROM reports WHERE meta_id = ?", (meta_id,)
+            )
+            return cur.fetchone() is not None
+
+    def _dimension_ids(self, con, table: str, names) -> dict:
+        names = sorted(set(names))
+        con.executemany(
+            f"INSERT OR IGNORE INTO {table} (name) VALUES (?)",
+            ((name,) for name in names),
+        )
+        # Dimension tables stay small, so reading them whole is cheap
+        return {name: id for id, name in con.execute(f"SELECT id, name FROM {table}")}
+
+    def ingest(
+        self,
+        results: List[FuelLinePriceItem],
+        meta_id: str,
+        report_date: Optional[date] = None,
+        source_path: Optional[Union[str, Path]] = None,
+    ) -> int:
+        """
+        Load the results of a parsed report in a single transaction.
+
+        A report already in the store (same ``meta_id``) is skipped.
+        Returns the number of prices added.
+        """
+        if self.has_report(meta_id):
+            print("Report is already ingested:", meta_id)
+            return 0
+        columns = flatten_results(results)
+        with self._lock, self.connection as con:
+            cur = con.execute(
+                "INSERT INTO reports (meta_id, report_date, source_path, ingested_at) VALUES (?, ?, ?, ?)",
+                (
+                    meta_id,
+                    report_date.isoformat() if report_date else None,
+                    str(source_path) if source_path else None,
+                    datetime.now().isoformat(),
+                ),
+            )
+            report_id = cur.lastrowid
+            ids = [
+                self._dimension_ids(con, table, columns[column])
+                for table, column in zip(DIMENSIONS, ("municity", "product", "company"))
+            ]
+            con.executemany(
+                "INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        report_id,
+                        ids[0][municity],
+                        ids[1][product],
+                        ids[2][company],
+                        price_low,
+                        price_high,
+                    )
+                    for municity, product, company, price_low, price_high in zip(
+                        columns["municity"],
+                        columns["product"],
+                        columns["company"],
+                        columns["price_low"],
+                        columns["price_high"],
+                    )
+                ),
+            )
+        return len(columns["municity"])
+
+    def ingest_file(self, parsed_file_path: Union[str, Path]) -> int:
+        """
+        Load a parsed JSON output file. The report date is taken from the
+        file name.
+        """
+        parsed_file_path = Path(parsed_file_path).absolute()
+        with open(parsed_file_path) as f:
+            response = json.load(f)
+        return self.ingest(
+            response["results"],
+            response["metadata"]["meta_id"],
+            report_date=report_date_from_path(parsed_file_path),
+            source_path=parsed_file_path,
+        )
+
+    def query_prices(
+        self,
+        product: Optional[str] = None,
+        municity: Optional[str] = None,
+        company: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> List[dict]:
+        """
+        Prices over time, filtered by any of product, municity, company and
+        report date range. e.g. diesel prices by company in Davao City::
+
+            query_prices(product="diesel", municity="davao city")
+        """
+        conditions, params = [], []
+        for column, value in (
+            ("products.name", product),
+            ("municities.name", municity),
+            ("companies.name", company),
+        ):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value.strip().lower())
+        if since:
+            conditions.append("reports.report_date >= ?")
+            params.append(since.isoformat())
+        if until:
+            conditions.append("reports.report_date <= ?")
+            params.append(until.isoformat())
+        sql = QUERY_PRICES
+        if conditions:
+            sql += "WHERE " + " AND ".join(conditions) + "\n"
+        sql += "ORDER BY reports.report_date, companies.name, municities.name, products.name"
+        with self._lock:
+            cur = self.connection.execute(sql, params)
+            return [dict(zip(PRICE_COLUMNS, row)) for row in cur]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_warehouse = None
+
+
+def get_warehouse() -> PriceWarehouse:
+    """
+    Get the price warehouse shared by this process.
+    """
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = PriceWarehouse()
+    return _warehouse
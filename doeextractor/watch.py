@@ -0,0 +1,212 @@
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .batch import PARSED_SUFFIX, _process_pool, find_reports, process_report
+from .constants import SETTLE_SECONDS, WATCH_INTERVAL, Backend
+from .file_helpers import AnalysisCache, get_cache
+from .instrumentation import get_recorder
+
+STAGING_DIR_NAME = ".staging"
+
+
+def process_and_publish(
+    input_file_path: Union[str, Path],
+    backend: Backend,
+    output_dir: Union[str, Path],
+    **options,
+) -> dict:
+    """
+    Process a report into a staging directory, then move its parsed output
+    into ``output_dir`` in a single rename, so readers never see a partial
+    output. Never raises, like ``batch.process_report``.
+    """
+    input_file_path = Path(input_file_path).absolute()
+    output_dir = Path(output_dir).absolute()
+    staging_dir = output_dir / STAGING_DIR_NAME
+    result = process_report(input_file_path, backend, staging_dir, **options)
+    if result["error"]:
+        return result
+    output_file_path = output_dir / (input_file_path.stem + PARSED_SUFFIX)
+    try:
+        os.replace(result["output_file_path"], output_file_path)
+    except OSError as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    else:
+        result["output_file_path"] = str(output_file_path)
+    return result
+
+
+class ReportWatcher:
+    """
+    Watches a drop folder and processes every new PDF report once.
+
+    The directory is the queue: each scan picks up the reports that are not
+    in the analysis cache yet, up to ``jobs`` at a time. A report is marked
+    in the cache only after its output is in place, so a restart never
+    reprocesses a finished report and retries any that were interrupted.
+    Reports are recognized by checksum, so a copy of a processed report
+    under another name is skipped too.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        backend: Backend = Backend.TABULA,
+        output_dir: Optional[Union[str, Path]] = None,
+        jobs: Optional[int] = None,
+        settle=SETTLE_SECONDS,
+        cache: Optional[AnalysisCache] = None,
+        **options,
+    ):
+        self.directory = Path(directory).absolute()
+        self.backend = backend
+        self.output_dir = Path(output_dir or directory).absolute()
+        self.jobs = jobs or os.cpu_count() or 1
+        self.settle = settle
+        self.cache = cache or get_cache()
+        self.options = options
+        self._running = {}  # future -> (input_file_path, checksum)
+        self._failed = set()  # (path, size, mtime) of reports that failed
+
+    def _clean_staging(self):
+        """
+        Drop outputs left behind by an interrupted run.
+        """
+        shutil.rmtree(self.output_dir / STAGING_DIR_NAME, ignore_errors=True)
+
+    def is_processed(self, input_file_path: Path) -> bool:
+        entry = self.cache.get(input_file_path)
+        if entry is None:
+            return False
+        # Extraction alone also adds an entry, pointing at its CSV output
+        output_file_path = Path(entry[2])
+        return (
+            output_file_path.name.endswith(PARSED_SUFFIX) and output_file_path.exists()
+        )
+
+    def find_new_reports(self) -> List[Path]:
+        """
+        Reports ready to be processed: settled, not processed, not running
+        and not failed before in their current version.
+        """
+        now = time.time()
+        running_checksums = {checksum for _, checksum in self._running.values()}
+        reports = []
+        for input_file_path in find_reports(self.directory):
+            try:
+                stat = input_file_path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.settle:
+                continue
+            if (str(input_file_path), stat.st_size, stat.st_mtime_ns) in self._failed:
+                continue
+            checksum = self.cache.checksum(input_file_path)
+            if checksum in running_checksums or self.is_processed(input_file_path):
+                continue
+            running_checksums.add(checksum)
+            reports.append(input_file_path)
+        return reports
+
+    def _finish(self, input_file_path: Path, result: dict):
+        if result.get("instrumentation"):
+            get_recorder().merge(result["instrumentation"])
+        if result["error"]:
+            try:
+                stat = input_file_path.stat()
+            except FileNotFoundError:
+                pass
+            else:
+                self._failed.add((str(input_file_path), stat.st_size, stat.st_mtime_ns))
+            print(f"{input_file_path} (error: {result['error']})")
+        else:
+            self.cache.add(input_file_path, result["output_file_path"], replace=True)
+            print(f"{input_file_path} ({result['rows']} rows)")
+
+    def _submit(self, executor, input_file_path: Path):
+        future = executor.submit(
+            process_and_publish,
+            input_file_path,
+            self.backend,
+            self.output_dir,
+            **self.options,
+        )
+        self._running[future] = (input_file_path, self.cache.checksum(input_file_path))
+
+    def _collect(self, timeout=None) -> List[dict]:
+        """
+        Finish the reports done within ``timeout`` seconds.
+        """
+        if not self._running:
+            time.sleep(timeout or 0)
+            return []
+        done, _ = wait(self._running, timeout=timeout, return_when=FIRST_COMPLETED)
+        results = []
+        for future in done:
+            input_file_path, _ = self._running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. a worker process died
+                result = {
+                    "input_file_path": str(input_file_path),
+                    "rows": 0,
+                    "error": f"{e.__class__.__name__}: {e}",
+                }
+            self._finish(input_file_path, result)
+            results.append(result)
+        return results
+
+    def run_once(self) -> List[dict]:
+        """
+        Process every report that is ready, in the current process, and
+        return their results.
+        """
+        self._clean_staging()
+        results = []
+        for input_file_path in self.find_new_reports():
+            result = process_and_publish(
+                input_file_path, self.backend, self.output_dir, **self.options
+            )
+            self._finish(input_file_path, result)
+            results.append(result)
+        return results
+
+    def _executor(self) -> ProcessPoolExecutor:
+        return _process_pool(self.jobs, self.cache)
+
+    def run(
+        self,
+        interval=WATCH_INTERVAL,
+        max_scans: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        Scan the directory every ``interval`` seconds and process new
+        reports across ``jobs`` worker processes, until interrupted (or
+        after ``max_scans`` scans). Running reports are finished on exit.
+        ``executor`` replaces the worker processes and is shut down on exit.
+        """
+        self._clean_staging()
+        print(f"Watching {self.directory} for new reports")
+        scans = 0
+        with executor or self._executor() as executor:
+            try:
+                while max_scans is None or scans < max_scans:
+                    scans += 1
+                    for input_file_path in self.find_new_reports():
+                        if len(self._running) >= self.jobs:
+                            break  # Picked up again on a later scan
+                        self._submit(executor, input_file_path)
+                    deadline = time.monotonic() + interval
+                    while True:
+                        self._collect(timeout=max(0, deadline - time.monotonic()))
+                        if time.monotonic() >= deadline:
+                            break
+            except KeyboardInterrupt:
+                print("Stopping, waiting for running reports")
+            while self._running:
+                self._collect()
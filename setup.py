@@ -18,6 +18,12 @@ requirements = [
     "pillow>=9.1.1",
 ]
 
+extras_requirements = {
+    "worker": ["JPype1>=1.4.0"],
+    "numpy": ["numpy>=1.17"],
+    "parquet": ["pyarrow>=7.0.0"],
+}
+
 test_requirements = [
     "pytest>=3",
 ]
@@ -43,6 +49,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="Apache Software License 2.0",
     long_description=readme + "\n\n" + history,
     include_package_data=True,
@@ -0,0 +1,57 @@
+"""Tests for `doeextractor.aggregates`."""
+
+import json
+
+from doeextractor import analyser
+from doeextractor.aggregates import AggregateStore
+
+
+def _report(municity, prices):
+    return [
+        {
+            "municity": municity,
+            "product": "diesel",
+            "prices": [
+                {"company": company, "price": price} for company, price in prices
+            ],
+        }
+    ]
+
+
+REPORTS = {
+    "week-1": _report("davao city", [("petron", "70.50 - 71.50"), ("shell", "n.a")]),
+    "week-2": _report("davao city", [("petron", "70.50"), ("shell", "72.00")]),
+    "week-3": _report("tagum city", [("petron", "69.99"), ("shell", "72.00 72.10")]),
+}
+
+
+def _as_json(data):
+    return json.loads(json.dumps(data))
+
+
+def test_incremental_summary_matches_analyse():
+    store = AggregateStore()
+    for meta_id, results in REPORTS.items():
+        assert store.add_results(results, meta_id)
+    assert not store.add_results(REPORTS["week-1"], "week-1")
+
+    all_results = [item for results in REPORTS.values() for item in results]
+    assert _as_json(store.summary()) == _as_json(analyser.analyse(all_results))
+    petron = store.aggregates[("petron", "diesel", "davao city")]
+    assert (petron.count, petron.min, petron.max) == (3, 70.5, 71.5)
+
+
+def test_merge_and_reload_partial_stores(tmp_path):
+    first, second = AggregateStore(), AggregateStore()
+    first.add_results(REPORTS["week-1"], "week-1")
+    second.add_results(REPORTS["week-2"], "week-2")
+    second.add_results(REPORTS["week-3"], "week-3")
+    second.save(tmp_path / "aggregates.json")
+
+    merged = first.merge(AggregateStore.load(tmp_path / "aggregates.json"))
+
+    full = AggregateStore()
+    for meta_id, results in REPORTS.items():
+        full.add_results(results, meta_id)
+    assert merged.meta_ids == full.meta_ids
+    assert _as_json(merged.summary()) == _as_json(full.summary())
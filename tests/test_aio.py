@@ -0,0 +1,118 @@
+"""Tests for `doeextractor.aio`."""
+
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from doeextractor import aio, file_helpers
+from doeextractor.constants import Backend
+
+SAMPLE_TABULA_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.json"
+)
+
+
+def _fake_java(tmp_path, monkeypatch, script):
+    """
+    Put a fake ``java`` on the PATH that runs ``script``.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    java = bin_dir / "java"
+    java.write_text("#!/bin/sh\n" + script)
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setattr(aio, "get_tabula_jar_path", lambda: "tabula.jar")
+
+
+def test_extract_report_with_tabula(tmp_path, monkeypatch):
+    _fake_java(
+        tmp_path,
+        monkeypatch,
+        f'echo "Java warning" >&2\ncat "{SAMPLE_TABULA_OUTPUT}"\n',
+    )
+    report = tmp_path / "petro_min_2022-may-10.pdf"
+    report.write_bytes(b"%PDF")
+
+    result = asyncio.run(aio.extract_report(report, Backend.TABULA))
+
+    assert len(result["results"]) == 255
+    assert result["analysis"]["petron"]
+    assert Path(result["output_file_path"]).exists()
+    assert not (tmp_path / "petro_min_2022-may-10.json").exists()
+
+
+def test_run_tabula_is_killed_when_cancelled(tmp_path, monkeypatch):
+    pid_file = tmp_path / "java.pid"
+    _fake_java(tmp_path, monkeypatch, f'echo $$ > "{pid_file}"\nexec sleep 30\n')
+
+    async def _cancel():
+        task = asyncio.ensure_future(aio.run_tabula(tmp_path / "report.pdf"))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_cancel())
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+class _FakeClient:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def analyze_document(self, Document, FeatureTypes):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        if Document["Bytes"] == b"broken":
+            raise ValueError("cannot analyze page")
+        return {"Blocks": [bytes(Document["Bytes"]).decode()]}
+
+
+def test_analyze_pages_in_order_with_bounded_concurrency():
+    client = _FakeClient()
+    pages = [str(idx).encode() for idx in range(10)]
+
+    responses = asyncio.run(aio.analyze_pages(pages, client=client, max_workers=3))
+
+    assert [response["Blocks"] for response in responses] == [
+        [str(idx)] for idx in range(10)
+    ]
+    assert 1 < client.max_running <= 3
+
+
+def test_analyze_pages_stops_on_failure():
+    taken = []
+
+    def _pages():
+        for page in [b"broken"] + [str(idx).encode() for idx in range(100)]:
+            taken.append(page)
+            yield page
+
+    with pytest.raises(ValueError):
+        asyncio.run(aio.analyze_pages(_pages(), client=_FakeClient(), max_workers=2))
+    assert len(taken) < 100
+
+
+def test_analyze_pages_caches_sent_pages_when_one_fails(tmp_path):
+    cache = file_helpers.AnalysisCache(tmp_path / "cache.db")
+    pages = [b"0", b"broken", b"2"]
+
+    with pytest.raises(ValueError):
+        asyncio.run(aio.analyze_pages(pages, client=_FakeClient(), page_cache=cache))
+
+    assert cache.get_page(aio._page_hash(b"0")) == {"Blocks": ["0"]}
+    assert cache.get_page(aio._page_hash(b"2")) == {"Blocks": ["2"]}
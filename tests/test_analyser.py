@@ -0,0 +1,93 @@
+"""Tests for `doeextractor.analyser`."""
+
+import json
+
+import pytest
+
+from doeextractor import analyser
+from doeextractor.constants import AnalysisEngine
+
+RESULTS = [
+    {
+        "municity": "davao city",
+        "product": "diesel",
+        "prices": [
+            {"company": "petron", "price": "70.50 - 71.50"},
+            {"company": "shell", "price": "72.00"},
+            {"company": "", "price": "99.00"},
+        ],
+    },
+    {
+        "municity": "tagum city",
+        "product": "diesel",
+        "prices": [
+            {"company": "petron", "price": "70.50"},
+            {"company": "shell", "price": "n.a"},
+        ],
+    },
+    {
+        "municity": "tagum city",
+        "product": "ron 95",
+        "prices": [
+            {"company": "shell", "price": "80.00 80.00"},
+            {"company": "petron", "price": "79.00"},
+            {"company": "petron", "price": "81.00"},
+        ],
+    },
+]
+
+
+@pytest.mark.parametrize("engine", list(AnalysisEngine))
+def test_analyse(engine):
+    if engine == AnalysisEngine.NUMPY:
+        pytest.importorskip("numpy")
+
+    analysis = analyser.analyse(RESULTS, engine=engine)
+
+    assert json.loads(json.dumps(analysis)) == {
+        "petron": {
+            "diesel": {
+                "mean": 70.83,
+                "median": 70.5,
+                "mode": 70.5,
+                "min": 70.5,
+                "max": 71.5,
+            },
+            "ron 95": {
+                "mean": 80.0,
+                "median": 80.0,
+                "mode": 79.0,
+                "min": 79.0,
+                "max": 81.0,
+            },
+        },
+        "shell": {
+            "diesel": {
+                "mean": 72.0,
+                "median": 72.0,
+                "mode": 72.0,
+                "min": 72.0,
+                "max": 72.0,
+            },
+            "ron 95": {
+                "mean": 80.0,
+                "median": 80.0,
+                "mode": 80.0,
+                "min": 80.0,
+                "max": 80.0,
+            },
+        },
+    }
+    assert list(analysis) == ["petron", "shell"]
+
+
+def test_price_columns():
+    pytest.importorskip("numpy")
+
+    columns = analyser.price_columns(RESULTS)
+
+    assert sorted(columns["prices"][:2].tolist()) == [70.5, 71.5]
+    assert columns["prices"][2:].tolist() == [72.0, 70.5, 80.0, 79.0, 81.0]
+    assert columns["company"].tolist() == [0, 0, 1, 0, 1, 0, 0]
+    assert columns["municity_names"] == ["davao city", "tagum city"]
+    assert columns["group_names"][columns["group"][4]] == ("shell", "ron 95")
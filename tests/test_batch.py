@@ -0,0 +1,54 @@
+"""Tests for `doeextractor.batch`."""
+
+import sys
+
+from doeextractor import batch, file_helpers
+from doeextractor.constants import Backend
+
+
+def _fake_pipeline(input_file_path, output_dir, **options):
+    if input_file_path.stem == "broken":
+        raise ValueError("cannot read report")
+    return {"results": [{}, {}], "analysis": {"petron": {}}}
+
+
+def test_run_batch_collects_results_per_file(tmp_path, monkeypatch):
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _fake_pipeline)
+    for name in ["b.pdf", "broken.pdf", "a.pdf", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"%PDF")
+    progress = []
+
+    results = batch.run_batch(
+        tmp_path, jobs=1, progress=lambda done, total, _: progress.append(done)
+    )
+
+    assert [r["input_file_path"] for r in results] == [
+        str(tmp_path / "a.pdf"),
+        str(tmp_path / "b.pdf"),
+        str(tmp_path / "broken.pdf"),
+    ]
+    assert [r["rows"] for r in results] == [2, 2, 0]
+    assert results[2]["error"] == "ValueError: cannot read report"
+    assert progress == [1, 2, 3]
+
+
+# Set in the test process only, to tell forked workers from spawned ones
+in_test_process = False
+
+
+def _worker_cache():
+    cache = file_helpers.get_cache()
+    return str(cache.db_path), in_test_process
+
+
+def test_worker_processes_open_their_own_cache(tmp_path, monkeypatch):
+    cache = file_helpers.AnalysisCache(tmp_path / "cache.db")
+    monkeypatch.setattr(file_helpers, "_cache", cache)
+    monkeypatch.setattr(sys.modules[__name__], "in_test_process", True)
+    cache.connection  # Opened in this process
+
+    with batch._process_pool(1) as executor:
+        assert executor.submit(_worker_cache).result() == (
+            str(tmp_path / "cache.db"),
+            False,
+        )
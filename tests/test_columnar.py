@@ -0,0 +1,71 @@
+"""Tests for `doeextractor.columnar`."""
+
+from datetime import date
+
+import pytest
+
+from doeextractor import columnar
+
+RESULTS = [
+    {
+        "municity": "davao city",
+        "product": "diesel",
+        "prices": [
+            {"company": "petron", "price": "71.50 - 70.50"},
+            {"company": "shell", "price": "n.a"},
+            {"company": "", "price": "99.00"},
+        ],
+    },
+    {
+        "municity": "tagum city",
+        "product": "ron 95",
+        "prices": [{"company": "shell", "price": "80.00"}],
+    },
+]
+
+
+def test_report_date_from_path():
+    assert columnar.report_date_from_path("petro_min_2022-may-10.pdf") == date(
+        2022, 5, 10
+    )
+    assert columnar.report_date_from_path("report_2021-September-3.csv") == date(
+        2021, 9, 3
+    )
+    assert columnar.report_date_from_path("report.pdf") is None
+
+
+def test_flatten_results():
+    columns = columnar.flatten_results(RESULTS, date(2022, 5, 10), "abc")
+
+    assert columns["company"] == ["petron", "shell"]
+    assert columns["price_low"] == [70.5, 80.0]
+    assert columns["price_high"] == [71.5, 80.0]
+    assert columns["year"] == [2022, 2022]
+
+
+def test_write_dataset_appends_and_replaces_reports(tmp_path):
+    dataset = pytest.importorskip("pyarrow.dataset")
+
+    columnar.write_dataset(RESULTS, tmp_path, date(2021, 1, 4), "first")
+    columnar.write_dataset(RESULTS, tmp_path, date(2022, 5, 10), "second")
+    columnar.write_dataset(RESULTS, tmp_path, date(2022, 5, 10), "second")
+
+    prices = columnar.open_dataset(tmp_path)
+    assert prices.count_rows() == 4
+    table = prices.to_table(
+        columns=["report_date", "company", "price_high"],
+        filter=dataset.field("year") == 2022,
+    )
+    assert table.to_pylist() == [
+        {"report_date": date(2022, 5, 10), "company": "petron", "price_high": 71.5},
+        {"report_date": date(2022, 5, 10), "company": "shell", "price_high": 80.0},
+    ]
+
+
+def test_write_dataset_keeps_reports_without_meta_id(tmp_path):
+    pytest.importorskip("pyarrow.dataset")
+
+    columnar.write_dataset(RESULTS, tmp_path, date(2022, 5, 10))
+    columnar.write_dataset(RESULTS, tmp_path, date(2022, 5, 10))
+
+    assert columnar.open_dataset(tmp_path).count_rows() == 4
@@ -2,6 +2,11 @@
 
 """Tests for `doeextractor` package."""
 
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 from click.testing import CliRunner
 
@@ -32,4 +37,70 @@ def test_command_line_interface():
     assert "Usage: cli" in result.output
     help_result = runner.invoke(cli.main, ["--help"])
     assert help_result.exit_code == 0
-    assert "--help  Show this message and exit." in help_result.output
+    assert "--help          Show this message and exit." in help_result.output
+    assert "--profile" in help_result.output
+
+
+def test_command_line_interface_starts_without_backends():
+    """The CLI loads without boto3, Tabula or any configuration."""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in {"TABULA_JAR_PATH", "AWS_REGION", "AWS_ACCESS_KEY"}
+    }
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, doeextractor.cli; "
+            "print(sorted({'boto3', 'pdf2image', 'numpy', 'pyarrow', "
+            "'multiprocessing', 'concurrent.futures', 'doeextractor.tabula', "
+            "'doeextractor.textractor', 'doeextractor.batch', "
+            "'doeextractor.analyser', 'doeextractor.watch', 'doeextractor.aio', "
+            "'doeextractor.warehouse'} & set(sys.modules)))",
+        ],
+        cwd=Path(__file__).parent.parent,
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    assert result.stdout.decode("utf-8").strip() == "[]"
+
+
+def test_batch_exits_with_error_when_reports_fail(tmp_path, monkeypatch):
+    from doeextractor import batch
+    from doeextractor.constants import Backend
+
+    def _failing_pipeline(input_file_path, output_dir, **options):
+        raise ValueError("cannot read report")
+
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _failing_pipeline)
+    (tmp_path / "a.pdf").write_bytes(b"%PDF")
+
+    result = CliRunner().invoke(cli.main, ["batch", str(tmp_path), "-j", "1"])
+
+    assert result.exit_code == 1
+    assert "Processed 1 reports, 1 failed" in result.output
+
+
+def test_watch_once_exits_with_error_when_reports_fail(tmp_path, monkeypatch):
+    from doeextractor import batch, file_helpers
+    from doeextractor.constants import Backend
+
+    def _failing_pipeline(input_file_path, output_dir, **options):
+        raise ValueError("cannot read report")
+
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _failing_pipeline)
+    monkeypatch.setattr(
+        file_helpers, "_cache", file_helpers.AnalysisCache(tmp_path / "cache.db")
+    )
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    (drop_dir / "a.pdf").write_bytes(b"%PDF")
+
+    result = CliRunner().invoke(
+        cli.main, ["watch", str(drop_dir), "--once", "--settle", "0"]
+    )
+
+    assert result.exit_code == 1
+    assert "Processed 1 reports, 1 failed" in result.output
@@ -0,0 +1,80 @@
+"""Tests for `doeextractor.file_helpers`."""
+
+import hashlib
+
+from doeextractor import file_helpers
+from doeextractor.file_helpers import AnalysisCache
+
+
+def test_get_checksum_reads_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_helpers, "CHECKSUM_CHUNK_SIZE", 3)
+    report = tmp_path / "report.pdf"
+    report.write_bytes(b"%PDF-1.4 report")
+    assert (
+        file_helpers.get_checksum(report) == hashlib.md5(b"%PDF-1.4 report").hexdigest()
+    )
+
+
+def test_analysis_cache(tmp_path, monkeypatch):
+    reports = []
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        report = tmp_path / name
+        report.write_bytes(name.encode())
+        reports.append(report)
+    cache = AnalysisCache(tmp_path / "cache.db")
+    cache.add(reports[0], tmp_path / "a.csv")
+
+    hashed = []
+    monkeypatch.setattr(
+        file_helpers, "get_checksum", lambda path: hashed.append(path) or path.name
+    )
+    assert cache.get(reports[1]) is None
+    entries = cache.get_directory(tmp_path)
+    assert entries[reports[0]][2] == str(tmp_path / "a.csv")
+    assert entries[reports[1]] is None and entries[reports[2]] is None
+    # a.pdf was hashed before the patch, b.pdf only once
+    assert hashed == [reports[1], reports[2]]
+    assert cache.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    cache.close()
+
+
+def test_page_cache_eviction(tmp_path, monkeypatch):
+    cache = AnalysisCache(tmp_path / "cache.db")
+    clock = iter(range(100, 200))
+    monkeypatch.setattr(file_helpers.time, "time", lambda: next(clock))
+    for page_hash in ["a", "b", "c"]:
+        cache.add_page(page_hash, {"Blocks": [page_hash * 10]})
+    cache.get_page("a")  # "b" is now the least recently used
+
+    assert cache.evict_pages(max_bytes=60, max_age=None) == 1
+    assert cache.get_page("b") is None
+    assert cache.get_page("a") == {"Blocks": ["a" * 10]}
+    assert cache.evict_pages(max_bytes=None, max_age=0) == 2
+    cache.close()
+
+
+def test_merged_pages_are_kept_per_file_and_dpi(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_helpers, "_cache", AnalysisCache(tmp_path / "cache.db"))
+    monkeypatch.setattr(file_helpers, "OUTPUT_DIR", tmp_path / "output")
+    monkeypatch.setattr(
+        file_helpers,
+        "render_merged_page",
+        lambda file_path, dpi, **kwargs: file_path.read_bytes() + b" @%d" % dpi,
+    )
+    first, second = tmp_path / "a" / "report.pdf", tmp_path / "b" / "report.pdf"
+    for report in (first, second):
+        report.parent.mkdir()
+        report.write_bytes(b"%PDF " + report.parent.name.encode())
+
+    images = [
+        file_helpers.convert_pdf_to_png(first, merge_pages=True),
+        file_helpers.convert_pdf_to_png(second, merge_pages=True),
+        file_helpers.convert_pdf_to_png(first, merge_pages=True, dpi=100),
+    ]
+
+    assert [image.read_bytes() for image in images] == [
+        b"%PDF a @200",
+        b"%PDF b @200",
+        b"%PDF a @100",
+    ]
+    assert file_helpers.convert_pdf_to_png(second, merge_pages=True) == images[1]
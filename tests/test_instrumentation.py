@@ -0,0 +1,82 @@
+"""Tests for `doeextractor.instrumentation`."""
+
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from doeextractor import instrumentation
+from doeextractor.textract_parser import parse
+
+SAMPLE_TEXTRACT_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.csv"
+)
+
+
+def test_stages_record_calls_time_and_counters():
+    with instrumentation.recording() as recorder:
+        for _ in range(2):
+            with instrumentation.stage("test.read") as counters:
+                list(instrumentation.counted("abc", counters, "tokens"))
+                counters["bytes_read"] += 10
+        instrumentation.count_cache("test.cache", True)
+        instrumentation.count_cache("test.cache", False)
+        with pytest.raises(ValueError), instrumentation.stage("test.fail"):
+            raise ValueError()
+
+    stages = recorder.report()["stages"]
+    assert stages["test.read"]["calls"] == 2
+    assert stages["test.read"]["tokens"] == 6
+    assert stages["test.read"]["bytes_read"] == 20
+    assert stages["test.read"]["seconds"] >= 0
+    assert (
+        stages["test.cache"]["cache_hits"] == stages["test.cache"]["cache_misses"] == 1
+    )
+    assert stages["test.fail"]["calls"] == 1
+    assert "test.read" not in instrumentation.get_recorder().report()["stages"]
+
+
+def test_recording_is_local_to_each_thread():
+    run_recorder = instrumentation.get_recorder()
+    started = {name: threading.Event() for name in "ab"}
+    recorders = {}
+
+    # b starts recording while a is recording, and a finishes first
+    def _record_a():
+        with instrumentation.recording() as recorders["a"]:
+            started["a"].set()
+            started["b"].wait()
+            with instrumentation.stage("test.a"):
+                pass
+
+    def _record_b():
+        started["a"].wait()
+        with instrumentation.recording() as recorders["b"]:
+            started["b"].set()
+            thread_a.join()
+            with instrumentation.stage("test.b"):
+                pass
+
+    thread_a = threading.Thread(target=_record_a)
+    thread_b = threading.Thread(target=_record_b)
+    thread_a.start()
+    thread_b.start()
+    thread_b.join()
+
+    assert list(recorders["a"].report()["stages"]) == ["test.a"]
+    assert list(recorders["b"].report()["stages"]) == ["test.b"]
+    assert instrumentation.get_recorder() is run_recorder
+
+
+def test_parse_run_report(tmp_path):
+    with instrumentation.recording() as recorder:
+        parse(SAMPLE_TEXTRACT_OUTPUT, tmp_path / "output.json")
+        instrumentation.save_report(tmp_path / "report.json", recorder)
+
+    stages = json.loads((tmp_path / "report.json").read_text())["stages"]
+    assert stages["textract_parser.parse"]["rows"] == 272
+    assert stages["textract_parser.parse"]["bytes_read"] == (
+        SAMPLE_TEXTRACT_OUTPUT.stat().st_size
+    )
+    assert stages["analyser.analyse_decimal"]["calls"] == 1
@@ -0,0 +1,93 @@
+"""Tests for `doeextractor.parser`."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from doeextractor import parser, tabula
+
+SAMPLE_TABULA_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.json"
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_iter_tabula_texts(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(parser, "READ_CHUNK_SIZE", chunk_size)
+    tables = [
+        {
+            "extraction_method": "lattice",
+            "data": [[{"top": 1.5, "text": 'a "text": b'}, {"text": "ñ \\ é"}]],
+        },
+        {"data": [[{"text": ""}, {"left": 2, "text": "RON 95"}]]},
+    ]
+    input_file = tmp_path / "tables.json"
+    input_file.write_text(json.dumps(tables))
+
+    assert list(parser.iter_tabula_texts(input_file)) == [
+        'a "text": b',
+        "ñ \\ é",
+        "",
+        "RON 95",
+    ]
+
+
+def test_parse_stream_matches_parse():
+    response = parser.parse(SAMPLE_TABULA_OUTPUT, "/dev/null")
+    streamed_response = parser.parse(SAMPLE_TABULA_OUTPUT, "/dev/null", stream=True)
+
+    assert streamed_response["metadata"]["meta_id"] == response["metadata"]["meta_id"]
+    assert streamed_response["results"] == response["results"]
+
+
+def test_parse_tables_matches_parse():
+    response = parser.parse(SAMPLE_TABULA_OUTPUT, "/dev/null")
+    tables = tabula.tables_from_output(SAMPLE_TABULA_OUTPUT.read_bytes())
+
+    in_memory_response = parser.parse_tables(tables["pages"], meta_id=tables["meta_id"])
+
+    assert in_memory_response["metadata"]["meta_id"] == response["metadata"]["meta_id"]
+    assert in_memory_response["results"] == response["results"]
+
+
+def test_line_price_items_are_emitted_as_rows_close():
+    texts = ["area", "product", "petron", "shell", "overall", "common", "average"]
+    # A row is complete on the cell following the average price
+    texts += ["davao city", "diesel", "80.00", "81.00", "80.00 81.00", "none", "80.50"]
+    texts += ["", "kerosene", "90.00", "n.a", "90.00", "90.00", "90.00", "-"]
+    builder = parser.FuelLinePriceBuilder(header_size=7)
+    emitted = [
+        (idx, item)
+        for idx, token in enumerate(parser.tokenize(texts))
+        for item in builder.feed(token)
+    ]
+
+    assert [idx for idx, _ in emitted] == [14, 21]
+    diesel, kerosene = [item for _, item in emitted]
+    assert (diesel.municity, diesel.product) == ("davao city", "diesel")
+    assert [(p.company, p.price) for p in diesel.prices] == [
+        ("petron", "80.00"),
+        ("shell", "81.00"),
+    ]
+    assert diesel.overall_range == "80.00 81.00"
+    assert kerosene.average_price == "90.00"
+    assert builder.close() == []
+
+
+def test_parse_output_matches_parse():
+    response = parser.parse(SAMPLE_TABULA_OUTPUT, "/dev/null")
+    in_memory_response = parser.parse_output(SAMPLE_TABULA_OUTPUT.read_bytes())
+
+    assert in_memory_response["metadata"]["meta_id"] == response["metadata"]["meta_id"]
+    assert in_memory_response["results"] == response["results"]
+
+
+def test_parse_output_as_table():
+    response = parser.parse_output(SAMPLE_TABULA_OUTPUT.read_bytes())
+    table_response = parser.parse_output(
+        SAMPLE_TABULA_OUTPUT.read_bytes(), as_table=True
+    )
+
+    assert table_response["metadata"]["meta_id"] == response["metadata"]["meta_id"]
+    assert table_response["results"].to_dicts() == response["results"]
@@ -0,0 +1,81 @@
+"""Tests for `doeextractor.models.price_table`."""
+
+import io
+import json
+import math
+from pathlib import Path
+
+import pytest
+
+from doeextractor import analyser, columnar
+from doeextractor.constants import AnalysisEngine
+from doeextractor.models import FuelLinePriceItem, FuelPrice, PriceTable, dump_response
+
+SAMPLE_PARSED_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "parsed_tabula_output.json"
+)
+
+RESULTS = [
+    FuelLinePriceItem(
+        municity="davao city",
+        product="diesel",
+        prices=[
+            FuelPrice(company="petron", price="71.50 - 70.50"),
+            FuelPrice(company="shell", price="n.a"),
+        ],
+        overall_range="70.50 - 72.00",
+    ).to_dict(),
+    FuelLinePriceItem(
+        municity="davao city",
+        product="ron 95",
+        prices=[FuelPrice(company="petron", price="80.00")],
+    ).to_dict(),
+]
+
+
+def test_round_trip_to_results_shape():
+    table = PriceTable.from_dicts(RESULTS)
+
+    assert len(table) == 2
+    assert list(table.row_offsets) == [0, 2, 3]
+    assert table.to_dicts() == RESULTS
+    assert json.dumps(table.to_dicts()) == json.dumps(RESULTS)
+
+
+def test_prices_are_parsed_once_and_strings_interned():
+    table = PriceTable.from_dicts(json.loads(json.dumps(RESULTS)))
+
+    assert list(table.price_low)[::2] == [70.5, 80.0]
+    assert list(table.price_high)[::2] == [71.5, 80.0]
+    assert math.isnan(table.price_low[1])
+    assert table.municity[0] is table.municity[1]
+    assert table.company[0] is table.company[2]
+
+
+def test_table_is_accepted_in_place_of_results():
+    table = PriceTable.from_dicts(RESULTS)
+
+    assert analyser.analyse(table) == analyser.analyse(RESULTS)
+    assert columnar.flatten_results(table) == columnar.flatten_results(RESULTS)
+
+
+@pytest.mark.parametrize("engine", list(AnalysisEngine))
+def test_table_analysis_matches_results(engine):
+    if engine == AnalysisEngine.NUMPY:
+        pytest.importorskip("numpy")
+    results = json.loads(SAMPLE_PARSED_OUTPUT.read_text())["results"]
+    table = PriceTable.from_dicts(results)
+
+    assert analyser.analyse(table, engine=engine) == analyser.analyse(
+        results, engine=engine
+    )
+
+
+@pytest.mark.parametrize("results", [RESULTS, []])
+def test_dump_response_writes_table_rows_like_json_dump(results):
+    response = {"metadata": {"meta_id": "abc"}, "results": results, "analysis": {}}
+    output = io.StringIO()
+
+    dump_response({**response, "results": PriceTable.from_dicts(results)}, output)
+
+    assert output.getvalue() == json.dumps(response, indent=2)
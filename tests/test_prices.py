@@ -0,0 +1,40 @@
+"""Tests for `doeextractor.prices`."""
+
+import math
+from decimal import Decimal
+
+from doeextractor.prices import NO_PRICE, PriceRange, parse_price, price_values
+
+
+def test_parse_price():
+    assert parse_price("78.19") == PriceRange(78.19, 78.19, (78.19,))
+    assert parse_price("78.19 80.95") == PriceRange(78.19, 80.95, (78.19, 80.95))
+    assert parse_price("80.95 - 78.19") == PriceRange(78.19, 80.95, (80.95, 78.19))
+    assert parse_price("78.50-78.50").values == (78.5, 78.5)
+    for text in ("", "-", "n.a", "none", "no branch/outlet", None):
+        assert parse_price(text) is NO_PRICE
+    assert not NO_PRICE
+
+
+def test_parse_price_only_takes_plain_decimals():
+    for text in ("nan", "inf", "-inf", "1e3", "1_000", "+1.5", ".5", "5.", "78.19 nan"):
+        assert parse_price(text) is NO_PRICE
+    assert parse_price("80") == PriceRange(80.0, 80.0, (80.0,))
+
+
+def test_parse_garbled_range():
+    price = parse_price("80.10 - 81.1081.10")
+    assert price
+    assert price.values == ()
+    assert math.isnan(price.low) and math.isnan(price.high)
+
+
+def test_price_values():
+    assert price_values("81.60 81.60 82.40 82.40") == (
+        Decimal("81.60"),
+        Decimal("82.40"),
+    )
+    assert price_values("78.50 - 78.5", float) == (78.5,)
+    assert price_values("80.10 - 81.1081.10") == ()
+    assert price_values("n.a") == ()
+    assert price_values("nan") == ()
@@ -0,0 +1,32 @@
+"""Tests for `doeextractor.tabula`."""
+
+from pathlib import Path
+
+import pytest
+
+from doeextractor import tabula
+from doeextractor.constants import ExtractMethod, Formats
+
+
+def test_tabula_arguments():
+    arguments = tabula._tabula_arguments(
+        input_file_path="report.pdf",
+        output_format=Formats.JSON,
+        extract_method=ExtractMethod.STREAM,
+        pages="all",
+    )
+    assert arguments == [
+        "--stream",
+        "-f",
+        "JSON",
+        "--pages",
+        "all",
+        str(Path("report.pdf").absolute()),
+    ]
+
+
+def test_tabula_arguments_requires_single_input():
+    with pytest.raises(TypeError):
+        tabula._tabula_arguments(input_file_path="a.pdf", batch_directory="reports")
+    with pytest.raises(TypeError):
+        tabula._tabula_arguments()
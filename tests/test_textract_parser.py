@@ -0,0 +1,69 @@
+"""Tests for `doeextractor.textract_parser`."""
+
+import json
+from pathlib import Path
+
+from doeextractor import textract_parser
+
+SAMPLE_TEXTRACT_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.csv"
+)
+
+
+def test_repair_rows():
+    rows = [
+        ["davao city", "ron 91 diesel", "79.91 79.92", "none"],
+        ["davao city", "kerosene ron 95", "81.60 81.60 82.40 82.40", "-"],
+        ["davao city", "diesel plus", "84.20", "n.a"],
+    ]
+
+    assert list(textract_parser._repair_rows(rows)) == [
+        ["davao city", "diesel", "79.91 79.92", "none"],
+        ["davao city", "ron 91", "79.91 79.92", "none"],
+        ["davao city", "ron 95", "82.40 82.40", "-"],
+        ["davao city", "kerosene", "81.60 81.60", "-"],
+        ["davao city", "diesel plus", "84.20", "n.a"],
+    ]
+
+
+def test_tokenize_input_sample():
+    rows, header = textract_parser.tokenize_input(SAMPLE_TEXTRACT_OUTPUT)
+
+    assert header[:3] == ["area", "product", "petron"]
+    assert len(rows) == 272
+    assert all(len(row) == len(header) for row in rows)
+
+
+def test_parse_streams_without_temporary_files(tmp_path):
+    input_file_path = tmp_path / "report.csv"
+    input_file_path.write_bytes(SAMPLE_TEXTRACT_OUTPUT.read_bytes())
+
+    response = textract_parser.parse(input_file_path, tmp_path / "report.json")
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "report.csv",
+        "report.json",
+    ]
+    assert input_file_path.read_bytes() == SAMPLE_TEXTRACT_OUTPUT.read_bytes()
+
+    in_memory = textract_parser.parse_csv(
+        SAMPLE_TEXTRACT_OUTPUT.read_text(), tmp_path / "report.json"
+    )
+    assert in_memory["metadata"]["meta_id"] == response["metadata"]["meta_id"]
+    assert in_memory["results"] == response["results"]
+
+
+def test_parse_csv_as_table_writes_the_same_output(tmp_path):
+    csv_text = SAMPLE_TEXTRACT_OUTPUT.read_text()
+    response = textract_parser.parse_csv(csv_text, tmp_path / "dicts.json")
+    table_response = textract_parser.parse_csv(
+        csv_text, tmp_path / "table.json", as_table=True
+    )
+
+    assert table_response["results"].to_dicts() == response["results"]
+    assert table_response["analysis"] == response["analysis"]
+    dicts_output = json.loads((tmp_path / "dicts.json").read_text())
+    table_output = json.loads((tmp_path / "table.json").read_text())
+    for output in (dicts_output, table_output):
+        output["metadata"].pop("query_datetime")
+    assert table_output == dicts_output
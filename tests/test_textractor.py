@@ -0,0 +1,246 @@
+"""Tests for `doeextractor.textractor`."""
+
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from doeextractor import file_helpers, instrumentation, textractor
+
+
+def _blocks(rows):
+    """Canned Textract blocks for a single table."""
+    blocks = [{"Id": "table", "BlockType": "TABLE", "Relationships": []}]
+    cell_ids = []
+    for row_index, row in enumerate(rows, start=1):
+        for col_index, text in enumerate(row, start=1):
+            cell_id = f"cell-{row_index}-{col_index}"
+            word_id = f"word-{row_index}-{col_index}"
+            cell_ids.append(cell_id)
+            blocks.append(
+                {
+                    "Id": cell_id,
+                    "BlockType": "CELL",
+                    "RowIndex": row_index,
+                    "ColumnIndex": col_index,
+                    "Relationships": [{"Type": "CHILD", "Ids": [word_id]}],
+                }
+            )
+            blocks.append({"Id": word_id, "BlockType": "WORD", "Text": text})
+    blocks[0]["Relationships"].append({"Type": "CHILD", "Ids": cell_ids})
+    return blocks
+
+
+class StubTextractClient:
+    """Returns canned blocks per page and throttles the first call of each page."""
+
+    def __init__(self, responses, throttle_first=True):
+        self.responses = responses
+        self.throttle_first = throttle_first
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def analyze_document(self, Document, FeatureTypes):
+        page = bytes(Document["Bytes"])
+        with self._lock:
+            first_call = page not in self.calls
+            self.calls.append(page)
+        if self.throttle_first and first_call:
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException"}}, "AnalyzeDocument"
+            )
+        return {"Blocks": self.responses[page]}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(textractor.time, "sleep", lambda seconds: None)
+
+
+def test_analyze_pages_keeps_page_order_and_retries():
+    pages = [str(page).encode() for page in range(11)]
+    client = StubTextractClient(
+        {page: _blocks([["area", page.decode()]]) for page in pages}
+    )
+
+    with instrumentation.recording() as recorder:
+        responses = textractor.analyze_pages(iter(pages), client=client, max_workers=3)
+
+    assert len(client.calls) == 22
+    stages = recorder.report()["stages"]
+    assert stages["textractor.analyze_page"]["pages"] == 11
+    assert stages["textractor.analyze_page"]["retries"] == 11
+    csv_results = [textractor.response_to_csv(response) for response in responses]
+    assert [csv.split("\n")[0] for csv in csv_results] == [
+        f"area ,{page} ," for page in range(11)
+    ]
+
+
+def test_analyze_page_gives_up_on_other_errors():
+    class FailingClient:
+        def analyze_document(self, Document, FeatureTypes):
+            raise ClientError(
+                {"Error": {"Code": "InvalidParameterException"}}, "AnalyzeDocument"
+            )
+
+    with pytest.raises(ClientError):
+        textractor.analyze_page(FailingClient(), b"page")
+
+
+def test_extract_tables_returns_cached_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        file_helpers, "_cache", file_helpers.AnalysisCache(tmp_path / "cache.db")
+    )
+    calls = []
+
+    def fake_get_table_responses(input_file, **kwargs):
+        calls.append(input_file)
+        return [{"Blocks": _blocks([["area", "product"]])}]
+
+    monkeypatch.setattr(textractor, "get_table_responses", fake_get_table_responses)
+    report = tmp_path / "report.pdf"
+    report.write_bytes(b"%PDF report")
+
+    result = textractor.extract_tables(report)
+    cached_result = textractor.extract_tables(report)
+
+    assert len(calls) == 1
+    assert cached_result["cached"] and not result["cached"]
+    assert cached_result["csv"] == result["csv"]
+    assert cached_result["blocks"] == result["blocks"]
+
+    # Other settings or a missing output file are cache misses
+    textractor.extract_tables(report, dpi=100)
+    result["output_file_path"].unlink()
+    assert not textractor.extract_tables(report)["cached"]
+    assert len(calls) == 3
+
+
+def test_extract_tables_keeps_results_per_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        file_helpers, "_cache", file_helpers.AnalysisCache(tmp_path / "cache.db")
+    )
+
+    def fake_get_table_responses(input_file, dpi, **kwargs):
+        return [{"Blocks": _blocks([["dpi", str(dpi)]])}]
+
+    monkeypatch.setattr(textractor, "get_table_responses", fake_get_table_responses)
+    report = tmp_path / "report.pdf"
+    report.write_bytes(b"%PDF report")
+
+    default_result = textractor.extract_tables(report)
+    low_dpi_result = textractor.extract_tables(report, dpi=100)
+
+    assert default_result["output_file_path"] == tmp_path / "report.csv"
+    assert low_dpi_result["output_file_path"] != default_result["output_file_path"]
+    cached_default_result = textractor.extract_tables(report)
+    cached_low_dpi_result = textractor.extract_tables(report, dpi=100)
+    assert cached_default_result["cached"] and cached_low_dpi_result["cached"]
+    assert cached_default_result["csv"] == default_result["csv"]
+    assert cached_low_dpi_result["csv"] == low_dpi_result["csv"]
+    assert cached_low_dpi_result["blocks"] == low_dpi_result["blocks"]
+    assert cached_low_dpi_result["csv"] != cached_default_result["csv"]
+
+
+class FailingPageClient:
+    """Fails ``failing_page`` at once and answers the other pages slowly."""
+
+    def __init__(self, failing_page=None):
+        self.failing_page = failing_page
+        self.calls = []
+
+    def analyze_document(self, Document, FeatureTypes):
+        page = bytes(Document["Bytes"])
+        self.calls.append(page)
+        if page == self.failing_page:
+            raise ClientError(
+                {"Error": {"Code": "InvalidParameterException"}}, "AnalyzeDocument"
+            )
+        time.sleep(0.05)
+        return {"Blocks": _blocks([[page.decode()]])}
+
+
+def test_analyze_pages_caches_sent_pages_when_one_fails(tmp_path):
+    cache = file_helpers.AnalysisCache(tmp_path / "cache.db")
+    pages = [b"page 0", b"page 1", b"page 2"]
+
+    with pytest.raises(ClientError):
+        textractor.analyze_pages(
+            pages,
+            client=FailingPageClient(b"page 1"),
+            max_workers=3,
+            page_cache=cache,
+        )
+    client = FailingPageClient()
+    responses = textractor.analyze_pages(pages, client=client, page_cache=cache)
+
+    assert client.calls == [b"page 1"]
+    assert [r["Blocks"][2]["Text"] for r in responses] == ["page 0", "page 1", "page 2"]
+
+
+def test_analyze_pages_only_resends_missing_pages(tmp_path):
+    cache = file_helpers.AnalysisCache(tmp_path / "cache.db")
+    pages = [b"page 0", b"page 1", b"page 2"]
+    client = StubTextractClient(
+        {page: _blocks([[page.decode()]]) for page in pages}, throttle_first=False
+    )
+    textractor.analyze_pages(pages[:2], client=client, page_cache=cache)
+
+    responses = textractor.analyze_pages(pages, client=client, page_cache=cache)
+
+    assert sorted(client.calls) == pages
+    assert [r["Blocks"][2]["Text"] for r in responses] == ["page 0", "page 1", "page 2"]
+
+
+def test_cached_pages_are_kept_per_file_and_dpi(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        file_helpers, "_cache", file_helpers.AnalysisCache(tmp_path / "cache.db")
+    )
+    cache_dirs = []
+
+    def fake_iter_pdf_pages(input_file, dpi, cache_dir):
+        cache_dirs.append(cache_dir)
+        return []
+
+    monkeypatch.setattr(textractor, "iter_pdf_pages", fake_iter_pdf_pages)
+    monkeypatch.setattr(textractor, "analyze_pages", lambda pages, **kwargs: [])
+    first, second = tmp_path / "a" / "report.pdf", tmp_path / "b" / "report.pdf"
+    for report in (first, second):
+        report.parent.mkdir()
+        report.write_bytes(b"%PDF " + report.parent.name.encode())
+
+    textractor.get_table_responses(first, cache_pages=True)
+    textractor.get_table_responses(first, cache_pages=True, dpi=100)
+    textractor.get_table_responses(second, cache_pages=True)
+    textractor.get_table_responses(first, cache_pages=False)
+
+    assert len(set(cache_dirs[:3])) == 3
+    assert cache_dirs[3] is None
+
+
+def test_merged_pages_are_only_written_with_cache_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        file_helpers, "_cache", file_helpers.AnalysisCache(tmp_path / "cache.db")
+    )
+    monkeypatch.setattr(file_helpers, "OUTPUT_DIR", tmp_path / "output")
+
+    def fake_render_merged_page(file_path, dpi, **kwargs):
+        return b"merged"
+
+    monkeypatch.setattr(file_helpers, "render_merged_page", fake_render_merged_page)
+    monkeypatch.setattr(textractor, "render_merged_page", fake_render_merged_page)
+    sent = []
+    monkeypatch.setattr(
+        textractor, "analyze_pages", lambda pages, **kwargs: sent.extend(pages)
+    )
+    report = tmp_path / "report.pdf"
+    report.write_bytes(b"%PDF report")
+
+    textractor.get_table_responses(report, merge_pages=True)
+    assert sent == [b"merged"]
+    assert not (tmp_path / "output").exists()
+
+    textractor.get_table_responses(report, merge_pages=True, cache_pages=True)
+    assert sent[1].read_bytes() == b"merged"
+    assert sent[1].parent == tmp_path / "output"
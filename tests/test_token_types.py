@@ -0,0 +1,116 @@
+"""Tests for `doeextractor.token_types`."""
+
+import json
+import re
+from pathlib import Path
+
+import pytest
+
+from doeextractor.token_types import (
+    ALL_HEADERS,
+    BRANDS,
+    CITIES,
+    NONE_TYPES,
+    PRODUCT_TYPES,
+    SPECIAL_CITIES,
+    TYPE_BRAND,
+    TYPE_CITY,
+    TYPE_HEADER,
+    TYPE_NONE_TYPE,
+    TYPE_PRICE,
+    TYPE_PRODUCT_TYPE,
+    UNCATEGORIZED,
+    PPriceRange,
+    classify_token,
+)
+
+SAMPLE_TABULA_OUTPUT = (
+    Path(__file__).parent.parent / "samples" / "petro_min_2022-may-10.json"
+)
+
+
+def _baseline_is_price(text):
+    try:
+        return isinstance(float(text), float)
+    except ValueError:
+        return bool(re.match(PPriceRange, text))
+
+
+def _baseline_classify(text):
+    """
+    Token classification before it was rewritten, kept as a reference.
+    """
+    features = [
+        (
+            TYPE_CITY,
+            lambda text: text in CITIES
+            or text.startswith("city of ")
+            or text.endswith(" city")
+            or any(special_city in text for special_city in SPECIAL_CITIES),
+        ),
+        (TYPE_BRAND, lambda text: text in BRANDS),
+        (TYPE_HEADER, lambda text: text in ALL_HEADERS),
+        (TYPE_PRODUCT_TYPE, lambda text: text in PRODUCT_TYPES),
+        (TYPE_NONE_TYPE, lambda text: len(text) == 0 or text in NONE_TYPES),
+        (TYPE_PRICE, _baseline_is_price),
+    ]
+    for token_type, feature_func in features:
+        if feature_func(text):
+            return token_type
+    return UNCATEGORIZED
+
+
+def _sample_texts():
+    texts = set()
+    for page in json.loads(SAMPLE_TABULA_OUTPUT.read_bytes()):
+        for row in page["data"]:
+            texts.update(cell["text"].lower().strip() for cell in row)
+    return sorted(texts)
+
+
+def test_classify_token_matches_baseline_on_sample():
+    mismatches = [
+        text
+        for text in _sample_texts()
+        if classify_token(text) != _baseline_classify(text)
+    ]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize(
+    "text, token_type",
+    [
+        ("78.19", TYPE_PRICE),
+        ("80", TYPE_PRICE),
+        ("78.19-80.95", TYPE_PRICE),
+        ("80.10 - 81.1081.10", TYPE_PRICE),
+        # Numbers joined by spaces or dashes are prices, unlike in the baseline
+        ("- 81.85 81.85", TYPE_PRICE),
+        # Only plain decimals are prices, unlike in the baseline
+        ("1_0", UNCATEGORIZED),
+        (".5", UNCATEGORIZED),
+        ("5.", UNCATEGORIZED),
+        ("+1.5e-3", UNCATEGORIZED),
+        ("1e", UNCATEGORIZED),
+        ("nan", UNCATEGORIZED),
+        ("-inf", UNCATEGORIZED),
+        ("n.a", TYPE_NONE_TYPE),
+        ("-", TYPE_NONE_TYPE),
+        ("", TYPE_NONE_TYPE),
+        ("city of koronadal", TYPE_CITY),
+        ("flying v", TYPE_BRAND),
+        ("overall range", TYPE_HEADER),
+        ("diesel plus", TYPE_PRODUCT_TYPE),
+    ],
+)
+def test_classify_token_types(text, token_type):
+    assert classify_token(text) == token_type
+
+
+def test_classify_token():
+    assert classify_token("koronadal city") == TYPE_CITY
+    assert classify_token("mambajao / mahinog") == TYPE_CITY
+    assert classify_token("78.19 80.95") == TYPE_PRICE
+    assert classify_token("78.50 - 78.50") == TYPE_PRICE
+    assert classify_token("80.10 - 81.1081.10") == TYPE_PRICE
+    assert classify_token("region ix") == UNCATEGORIZED
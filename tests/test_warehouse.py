@@ -0,0 +1,41 @@
+"""Tests for `doeextractor.warehouse`."""
+
+from datetime import date
+
+from doeextractor.warehouse import PriceWarehouse
+
+
+def _results(diesel_price):
+    return [
+        {
+            "municity": "davao city",
+            "product": "diesel",
+            "prices": [
+                {"company": "petron", "price": diesel_price},
+                {"company": "shell", "price": "n.a"},
+            ],
+        },
+        {
+            "municity": "tagum city",
+            "product": "diesel",
+            "prices": [{"company": "shell", "price": "80.00"}],
+        },
+    ]
+
+
+def test_ingest_and_query_prices_over_time(tmp_path):
+    warehouse = PriceWarehouse(tmp_path / "prices.db")
+
+    assert warehouse.ingest(_results("70.50"), "may", date(2022, 5, 10)) == 2
+    assert warehouse.ingest(_results("75.00 - 76.00"), "june", date(2022, 6, 7)) == 2
+    assert warehouse.ingest(_results("99.00"), "may", date(2022, 5, 10)) == 0
+
+    rows = warehouse.query_prices(product="Diesel", municity="Davao City")
+    assert [
+        (row["report_date"], row["price_low"], row["price_high"]) for row in rows
+    ] == [
+        ("2022-05-10", 70.5, 70.5),
+        ("2022-06-07", 75.0, 76.0),
+    ]
+    assert len(warehouse.query_prices(company="shell", since=date(2022, 6, 1))) == 1
+    warehouse.close()
@@ -0,0 +1,137 @@
+"""Tests for `doeextractor.watch`."""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from doeextractor import batch, file_helpers
+from doeextractor.constants import Backend
+from doeextractor.file_helpers import AnalysisCache
+from doeextractor.watch import STAGING_DIR_NAME, ReportWatcher
+
+processed = []
+running = []
+max_running = []
+lock = threading.Lock()
+
+
+def _fake_pipeline(input_file_path, output_dir, **options):
+    processed.append(input_file_path.name)
+    if input_file_path.stem == "broken":
+        raise ValueError("cannot read report")
+    response = {"results": [{}, {}], "analysis": {"petron": {}}}
+    output_file_path = output_dir / (input_file_path.stem + batch.PARSED_SUFFIX)
+    output_file_path.write_text(json.dumps(response))
+    return response
+
+
+def _watcher(tmp_path, **kwargs):
+    return ReportWatcher(
+        tmp_path / "drop",
+        output_dir=tmp_path / "out",
+        settle=0,
+        cache=AnalysisCache(tmp_path / "cache.db"),
+        **kwargs,
+    )
+
+
+def test_watcher_processes_new_reports_once(tmp_path, monkeypatch):
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _fake_pipeline)
+    processed.clear()
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    (drop_dir / "a.pdf").write_bytes(b"%PDF a")
+    (drop_dir / "copy-of-a.pdf").write_bytes(b"%PDF a")
+    (drop_dir / "broken.pdf").write_bytes(b"%PDF broken")
+    # Left behind by an interrupted run
+    (tmp_path / "out" / STAGING_DIR_NAME).mkdir(parents=True)
+    (tmp_path / "out" / STAGING_DIR_NAME / "b.parsed.json").write_text("{")
+
+    watcher = _watcher(tmp_path)
+    results = watcher.run_once()
+
+    assert sorted(processed) == ["a.pdf", "broken.pdf"]
+    assert [result["error"] for result in results if result["error"]] == [
+        "ValueError: cannot read report"
+    ]
+    assert sorted(os.listdir(tmp_path / "out")) == [STAGING_DIR_NAME, "a.parsed.json"]
+    assert os.listdir(tmp_path / "out" / STAGING_DIR_NAME) == []
+    # Failed reports are not retried until they change
+    assert watcher.run_once() == []
+
+    # A restarted watcher only picks up new or changed reports
+    processed.clear()
+    (drop_dir / "b.pdf").write_bytes(b"%PDF b")
+    watcher = _watcher(tmp_path)
+    watcher.run_once()
+    assert sorted(processed) == ["b.pdf", "broken.pdf"]
+
+
+def test_watcher_waits_for_reports_to_settle(tmp_path, monkeypatch):
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _fake_pipeline)
+    processed.clear()
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    (drop_dir / "a.pdf").write_bytes(b"%PDF a")
+
+    watcher = _watcher(tmp_path)
+    watcher.settle = 60
+
+    assert watcher.find_new_reports() == []
+    os.utime(drop_dir / "a.pdf", (0, 0))
+    assert watcher.find_new_reports() == [drop_dir / "a.pdf"]
+
+
+def _slow_pipeline(input_file_path, output_dir, **options):
+    with lock:
+        running.append(input_file_path.name)
+        max_running.append(len(running))
+    time.sleep(0.05)
+    with lock:
+        running.remove(input_file_path.name)
+    return _fake_pipeline(input_file_path, output_dir, **options)
+
+
+def _cache_db_path():
+    return str(file_helpers.get_cache().db_path)
+
+
+def test_watcher_runs_reports_across_jobs(tmp_path, monkeypatch):
+    monkeypatch.setitem(batch.PIPELINES, Backend.TABULA, _slow_pipeline)
+    processed.clear()
+    max_running.clear()
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    for name in "abcde":
+        (drop_dir / f"{name}.pdf").write_bytes(b"%PDF " + name.encode())
+
+    # Submissions are capped at `jobs`, and running reports are finished
+    # when the watcher stops
+    watcher = _watcher(tmp_path, jobs=2)
+    watcher.run(interval=0, max_scans=1, executor=ThreadPoolExecutor(4))
+    assert sorted(processed) == ["a.pdf", "b.pdf"]
+    assert max(max_running) == 2
+    assert not watcher._running
+    assert sorted(os.listdir(tmp_path / "out")) == [
+        STAGING_DIR_NAME,
+        "a.parsed.json",
+        "b.parsed.json",
+    ]
+
+    # A restarted watcher picks up the rest; reports finished within the
+    # interval free their slot for the next scan
+    processed.clear()
+    watcher = _watcher(tmp_path, jobs=2)
+    watcher.run(interval=0.3, max_scans=2, executor=ThreadPoolExecutor(4))
+    assert sorted(processed) == ["c.pdf", "d.pdf", "e.pdf"]
+    assert max(max_running) == 2
+    assert all(watcher.is_processed(drop_dir / f"{name}.pdf") for name in "abcde")
+
+
+def test_watcher_workers_use_its_cache(tmp_path):
+    watcher = _watcher(tmp_path, jobs=1)
+
+    with watcher._executor() as executor:
+        assert executor.submit(_cache_db_path).result() == str(tmp_path / "cache.db")